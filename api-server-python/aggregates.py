@@ -0,0 +1,94 @@
+"""
+SELRS API Server - Aggregate queries
+Totals are computed by the database with a single GROUP BY (through the
+connection's storage backend) so the phone gets a short series instead of
+the whole ledger.
+"""
+
+from datetime import datetime, timedelta
+
+import storage
+from khazina_ledger import to_date
+
+
+# group name -> how to label a period (its date parts: storage.DATE_GROUPS)
+GROUPS = {
+    'year': '{0:04d}',
+    'month': '{0:04d}-{1:02d}',
+    'day': '{0:04d}-{1:02d}-{2:02d}',
+}
+
+
+def date_bounds(start, end):
+    """(from, to) datetimes for an inclusive from/to date filter; to is exclusive"""
+    lower = datetime.combine(to_date(start), datetime.min.time()) if start else None
+    upper = datetime.combine(to_date(end) + timedelta(days=1), datetime.min.time()) if end else None
+    return lower, upper
+
+
+def year_bounds(year):
+    """(from, to) covering one calendar year, as a range the date index can use"""
+    return datetime(int(year), 1, 1), datetime(int(year) + 1, 1, 1)
+
+
+def khazina_summary(conn, group, start=None, end=None):
+    """Revenue/expense totals of [All] per period -> compact series"""
+    if group not in GROUPS:
+        raise ValueError(f"group must be one of: {', '.join(GROUPS)}")
+    lower, upper = date_bounds(start, end)
+    cursor = conn.backend.aggregate(conn, '[All]', group, sums=['الايراد', 'المصروف'], start=lower, end=upper)
+    return khazina_summary_rows(group, cursor.fetchall())
+
+
+def khazina_summary_rows(group, rows):
+    """[(year[, month[, day]], revenue, expense, count, ...)] -> compact series"""
+    label = GROUPS[group]
+    width = len(storage.DATE_GROUPS[group])
+    series = []
+    for row in rows:
+        revenue = float(row[width] or 0)
+        expense = float(row[width + 1] or 0)
+        series.append({
+            'period': label.format(*(int(v) for v in row[:width])),
+            'revenue': round(revenue, 2),
+            'expense': round(expense, 2),
+            'net': round(revenue - expense, 2),
+            'count': int(row[width + 2]),
+        })
+    return series
+
+
+# ?sort= -> storage aggregate order
+PERSON_SORTS = {
+    'name': 'group',
+    'outstanding': 'balance',
+    'last': 'last',
+}
+
+
+def person_balances(conn, table, format_date, sort='name', top=None):
+    """One entry per [الاسم] of a سلف/القرض table: advanced, repaid, last date, count"""
+    if sort not in PERSON_SORTS:
+        raise ValueError(f"sort must be one of: {', '.join(PERSON_SORTS)}")
+    if top is not None and (not str(top).isdigit() or int(top) < 1):
+        raise ValueError('top must be a positive integer')
+    cursor = conn.backend.aggregate(conn, table, 'الاسم', sums=['المبلغ', 'سداد'], order=PERSON_SORTS[sort],
+                                    top=int(top) if top is not None else None)
+    return person_balances_rows(cursor.fetchall(), format_date)
+
+
+def person_balances_rows(rows, format_date):
+    people = []
+    for name, advanced, repaid, count, last_date in rows:
+        advanced = float(advanced or 0)
+        repaid = float(repaid or 0)
+        people.append({
+            'name': name,
+            'advanced': round(advanced, 2),
+            'repaid': round(repaid, 2),
+            'outstanding': round(advanced - repaid, 2),
+            # MAX() of a date comes back as text from the SQLite replica
+            'last_date': format_date(to_date(last_date)),
+            'count': int(count),
+        })
+    return people
@@ -0,0 +1,188 @@
+"""
+SELRS API Server - asyncio serving mode
+Runs the same Flask app under uvicorn. Sockets are handled by asyncio, so a
+phone trickling bytes over a bad network costs a coroutine instead of a
+thread. The WSGI app, with its blocking pyodbc calls, runs in a fixed-size
+executor sized to what the Access file can sustain.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Request bodies above this are spooled to disk (CSV imports)
+MAX_BODY_IN_MEMORY = 1024 * 1024
+
+# Responses up to this size are produced in one go; larger ones are streamed
+BUFFER_LIMIT = 256 * 1024
+
+
+def enabled():
+    return os.getenv('SERVER_MODE', 'threaded').lower() == 'asgi'
+
+
+class AsgiAdapter:
+    """ASGI app that runs a WSGI app in a bounded thread pool"""
+
+    def __init__(self, wsgi_app, workers=8, max_concurrency=64):
+        """
+        workers: threads running the app (and so talking to the database)
+        max_concurrency: requests inside the app at once, including
+        streamed responses still being generated; the rest wait their turn
+        """
+        self.wsgi_app = wsgi_app
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='asgi-worker')
+        self._limit = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        if self._limit is None:
+            self._limit = asyncio.Semaphore(self.max_concurrency)
+
+        body = await self._read_body(receive)
+        environ = self._environ(scope, body)
+        loop = asyncio.get_running_loop()
+        async with self._limit:
+            status, headers, chunks, rest = await loop.run_in_executor(self.executor, self._start, environ)
+            if rest is not None:
+                await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+                try:
+                    for chunk in chunks:
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                    while True:
+                        chunk = await loop.run_in_executor(self.executor, next, rest, None)
+                        if chunk is None:
+                            break
+                        if chunk:
+                            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                finally:
+                    await loop.run_in_executor(self.executor, rest.close)
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+        # Whole body in hand: the slot is free again before a slow client reads it
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b''.join(chunks)})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_body(self, receive):
+        body = tempfile.SpooledTemporaryFile(max_size=MAX_BODY_IN_MEMORY)
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            body.write(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        body.seek(0)
+        return body
+
+    def _environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.input_terminated': True,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for raw_name, raw_value in scope.get('headers', []):
+            name = raw_name.decode('latin-1').upper().replace('-', '_')
+            value = raw_value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name == 'CONTENT_LENGTH':
+                environ['CONTENT_LENGTH'] = value
+            else:
+                key = 'HTTP_' + name
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    def _start(self, environ):
+        """
+        Run the app and read up to BUFFER_LIMIT bytes of its body.
+        Returns (status, headers, chunks, rest); rest is None when the body
+        was read completely, otherwise an iterator over the remainder.
+        """
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+            return lambda data: None
+
+        result = self.wsgi_app(environ, start_response)
+        chunks, size = [], 0
+        rest = _Remainder(result)
+        for chunk in rest:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= BUFFER_LIMIT:
+                return response['status'], response['headers'], chunks, rest
+        rest.close()
+        return response['status'], response['headers'], chunks, None
+
+
+class _Remainder:
+    """The rest of a WSGI result, closed exactly once"""
+
+    def __init__(self, result):
+        self._result = result
+        self._iterator = iter(result)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        close = getattr(self._result, 'close', None)
+        self._result = None
+        if close is not None:
+            close()
+
+
+def adapter_from_env(app):
+    """ASGI_WORKERS (executor threads), ASGI_MAX_CONCURRENCY (requests in the app)"""
+    return AsgiAdapter(app, workers=int(os.getenv('ASGI_WORKERS', 8)),
+                       max_concurrency=int(os.getenv('ASGI_MAX_CONCURRENCY', 64)))
+
+
+def serve(app, host, port, certfile=None, keyfile=None):
+    """Serve the Flask app with uvicorn (SERVER_MODE=asgi)"""
+    import uvicorn
+    adapter = adapter_from_env(app)
+    print(f"⚡ asyncio mode: {adapter.workers} DB workers, {adapter.max_concurrency} concurrent requests", flush=True)
+    uvicorn.run(adapter, host=host, port=port, ssl_certfile=certfile, ssl_keyfile=keyfile,
+                log_level='warning', lifespan='on', timeout_keep_alive=int(os.getenv('ASGI_KEEP_ALIVE', 5)))
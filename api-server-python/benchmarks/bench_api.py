@@ -0,0 +1,205 @@
+"""
+API load benchmark against a SQLite stand-in database
+For each ledger size, seeds a stand-in from data_import (grown to that many
+[All] rows), boots a server script on it in a subprocess and drives the
+login, list, single-record, create, update and delete scenarios at each
+concurrency level. Prints req/s and p50/p95/p99 per endpoint as JSON, with
+the commit it ran on, so runs can be compared.
+
+    python benchmarks/bench_api.py [--rows 10000,100000,1000000] [--concurrency 1,10,50]
+                                   [--requests 500] [--mode threaded|asgi] [--out result.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import bench_asgi  # noqa: E402
+import standin_db  # noqa: E402
+
+SCENARIOS = ('login', 'list', 'single', 'create', 'update', 'delete')
+
+
+async def call(port, method, path, token=None, body=None):
+    """One request on a fresh connection; returns (seconds, status, parsed JSON or None)"""
+    payload = json.dumps(body).encode() if body is not None else b''
+    headers = [f"{method} {path} HTTP/1.1", "Host: 127.0.0.1", "Connection: close",
+               f"Content-Length: {len(payload)}"]
+    if token:
+        headers.append(f"Authorization: Bearer {token}")
+    if body is not None:
+        headers.append("Content-Type: application/json")
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode() + payload)
+    response = await reader.read()
+    writer.close()
+    seconds = time.perf_counter() - started
+    head, _, content = response.partition(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1]) if head else 0
+    try:
+        data = json.loads(content) if content else None
+    except ValueError:
+        data = None
+    return seconds, status, data
+
+
+def requests_for(scenario, count, ids, created):
+    """(method, path, body) for each request of a scenario"""
+    if scenario == 'login':
+        body = {'username': 'admin', 'password': 'selrs2024'}
+        return [('POST', '/api/login', body)] * count
+    if scenario == 'list':
+        return [('GET', '/api/khazina?limit=50', None)] * count
+    if scenario == 'single':
+        return [('GET', f'/api/khazina/{random.choice(ids)}', None) for _ in range(count)]
+    if scenario == 'create':
+        return [('POST', '/api/khazina', {'date': '2024-06-15', 'revenue': 100, 'expense': 0,
+                                          'notes': f'bench {i}'}) for i in range(count)]
+    if scenario == 'update':
+        return [('PUT', f'/api/khazina/{created[i % len(created)]}',
+                 {'date': '2024-06-16', 'revenue': 0, 'expense': 50, 'notes': 'bench updated'})
+                for i in range(count if created else 0)]
+    # delete: the rows this level created, so every level starts from the same data
+    return [('DELETE', f'/api/khazina/{record_id}', None) for record_id in created]
+
+
+async def run_scenario(port, token, scenario, plan, concurrency, created):
+    times, errors = [], 0
+    queue = list(reversed(plan))
+
+    async def worker():
+        nonlocal errors
+        while queue:
+            method, path, body = queue.pop()
+            try:
+                seconds, status, data = await call(port, method, path, token, body)
+            except OSError:
+                errors += 1
+                continue
+            times.append(seconds)
+            if status >= 400:
+                errors += 1
+            elif scenario == 'create' and data and data.get('id') is not None:
+                created.append(data['id'])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return summarize(times, errors, elapsed)
+
+
+def summarize(times, errors, elapsed):
+    def ms(q):
+        value = bench_asgi.percentile(times, q)
+        return round(value * 1000, 2) if value is not None else None
+    return {
+        'requests': len(times),
+        'errors': errors,
+        'req_per_s': round(len(times) / elapsed, 1) if elapsed > 0 else None,
+        'p50_ms': ms(0.50),
+        'p95_ms': ms(0.95),
+        'p99_ms': ms(0.99),
+    }
+
+
+async def run_level(port, token, concurrency, count, ids):
+    results, created = {}, []
+    for scenario in SCENARIOS:
+        plan = requests_for(scenario, count, ids, created)
+        results[scenario] = await run_scenario(port, token, scenario, plan, concurrency, created)
+    return results
+
+
+def wait_until_ready(port, timeout=600):
+    """Health answers and the replica (if any) has finished its first sync"""
+    deadline = time.time() + timeout
+    bench_asgi.wait_until_up(port, timeout)
+    while time.time() < deadline:
+        health = json.loads(urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health').read())
+        if not health.get('replica') or health['replica'].get('ready'):
+            return
+        time.sleep(0.5)
+    raise RuntimeError('replica did not become ready')
+
+
+def run_size(rows, args, workdir):
+    db_path = os.path.join(workdir, f'standin-{rows}.db')
+    counts = standin_db.create(db_path, rows)
+    with sqlite3.connect(db_path) as conn:
+        ids = [row[0] for row in conn.execute("SELECT ID FROM [All] ORDER BY RANDOM() LIMIT 1000")]
+    port = bench_asgi.free_port()
+    env = dict(os.environ, SQLITE_DB_PATH=db_path, SERVER_MODE=args.mode,
+               REPLICA_PATH=os.path.join(workdir, f'replica-{rows}.db'),
+               SLOW_QUERY_LOG=os.path.join(workdir, 'slow-queries.log'))
+    child = subprocess.Popen([sys.executable, bench_asgi.__file__, '--serve', args.mode, '--port', str(port),
+                              '--script', args.script], env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        started = time.perf_counter()
+        wait_until_ready(port)
+        startup = time.perf_counter() - started
+        token = bench_asgi.login(port)
+        asyncio.run(run_level(port, token, 4, 20, ids))  # warm-up
+        levels = {}
+        for concurrency in args.concurrency:
+            levels[str(concurrency)] = asyncio.run(run_level(port, token, concurrency, args.requests, ids))
+        return {'rows': counts['[All]'], 'startup_s': round(startup, 2), 'concurrency': levels}
+    finally:
+        child.terminate()
+        child.wait()
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def int_list(text):
+    return [int(value) for value in text.split(',') if value]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int_list, default=[10000], help='ledger sizes, e.g. 10000,100000,1000000')
+    parser.add_argument('--concurrency', type=int_list, default=[1, 10, 50])
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario and level')
+    parser.add_argument('--mode', choices=['threaded', 'asgi'], default='threaded')
+    parser.add_argument('--script', default='server-lets-encrypt.py')
+    parser.add_argument('--out', help='also write the JSON to this file')
+    args = parser.parse_args()
+
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as workdir:
+        sizes = [run_size(rows, args, workdir) for rows in args.rows]
+    report = json.dumps({
+        'commit': commit(),
+        'script': args.script,
+        'mode': args.mode,
+        'python': platform.python_version(),
+        'requests': args.requests,
+        'results': sizes,
+    }, indent=2)
+    print(report)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
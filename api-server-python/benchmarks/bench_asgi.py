@@ -0,0 +1,161 @@
+"""
+Serving-mode benchmark: app.run(threaded=True) vs SERVER_MODE=asgi
+Boots a server script against a SQLite stand-in database in a subprocess,
+once per mode, and drives it with concurrent clients. A share of the
+clients are "slow phones" that trickle their request over ~1 s. Prints
+p50/p99 latency and req/s per mode as JSON.
+
+    python benchmarks/bench_asgi.py [--clients 200] [--requests 4000] [--slow 20]
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.join(HERE, '..')
+sys.path.insert(0, SERVER_DIR)
+
+PATHS = ['/api/khazina?limit=50', '/api/khazina/balance', '/api/sulf?limit=50', '/api/health']
+
+
+def serve(mode, script, port):
+    """Child process: load the server script and serve it without TLS"""
+    spec = importlib.util.spec_from_file_location('server_under_test', os.path.join(SERVER_DIR, script))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.KHAZINA_LEDGER.reload()
+    if mode == 'asgi':
+        import asgi_server
+        asgi_server.serve(module.app, '127.0.0.1', port)
+    else:
+        module.app.run(host='127.0.0.1', port=port, threaded=True)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+
+def login(port):
+    request = urllib.request.Request(f'http://127.0.0.1:{port}/api/login', method='POST',
+                                     data=json.dumps({'username': 'admin', 'password': 'selrs2024'}).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    return json.loads(urllib.request.urlopen(request).read())['token']
+
+
+async def one_request(port, path, token, slow):
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    request = (f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAuthorization: Bearer {token}\r\n"
+               f"Connection: close\r\n\r\n").encode()
+    if slow:
+        # A phone on a bad network: the request dribbles in over about a second
+        step = max(1, len(request) // 10)
+        for i in range(0, len(request), step):
+            writer.write(request[i:i + step])
+            await writer.drain()
+            await asyncio.sleep(0.1)
+    else:
+        writer.write(request)
+    response = await reader.read()
+    writer.close()
+    ok = response.startswith(b'HTTP/1.1 200') or response.startswith(b'HTTP/1.0 200')
+    return time.perf_counter() - started, ok
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else None
+
+
+async def drive(port, token, clients, requests, slow_clients):
+    fast, slow, errors = [], [], 0
+    remaining = [requests]
+
+    async def client(index):
+        nonlocal errors
+        is_slow = index < slow_clients
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            try:
+                seconds, ok = await one_request(port, PATHS[remaining[0] % len(PATHS)], token, is_slow)
+            except OSError:
+                errors += 1
+                continue
+            if not ok:
+                errors += 1
+            (slow if is_slow else fast).append(seconds)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(fast) + len(slow),
+        'errors': errors,
+        'req_per_s': round((len(fast) + len(slow)) / elapsed, 1),
+        'fast_p50_ms': round(percentile(fast, 0.50) * 1000, 1) if fast else None,
+        'fast_p99_ms': round(percentile(fast, 0.99) * 1000, 1) if fast else None,
+        'slow_p50_ms': round(percentile(slow, 0.50) * 1000, 1) if slow else None,
+    }
+
+
+def run_mode(mode, args, db_path, workdir):
+    port = free_port()
+    env = dict(os.environ, SQLITE_DB_PATH=db_path, SERVER_MODE=mode,
+               REPLICA_PATH=os.path.join(workdir, f'replica-{mode}.db'))
+    child = subprocess.Popen([sys.executable, __file__, '--serve', mode, '--port', str(port), '--script', args.script],
+                             env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(port)
+        token = login(port)
+        asyncio.run(drive(port, token, 20, 200, 0))  # warm-up
+        return asyncio.run(drive(port, token, args.clients, args.requests, args.slow))
+    finally:
+        child.terminate()
+        child.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--slow', type=int, default=20, help='clients that trickle their requests')
+    parser.add_argument('--script', default='server-lets-encrypt.py')
+    parser.add_argument('--serve', choices=['threaded', 'asgi'])
+    parser.add_argument('--port', type=int)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.script, args.port)
+        return
+
+    import standin_db
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'standin.db')
+        standin_db.create(db_path)
+        results = {mode: run_mode(mode, args, db_path, workdir) for mode in ('threaded', 'asgi')}
+    print(json.dumps({'clients': args.clients, 'slow_clients': args.slow, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
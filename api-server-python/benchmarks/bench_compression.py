@@ -0,0 +1,106 @@
+"""
+Response compression benchmark: CPU time vs bytes saved
+Loads a server script in-process on a SQLite stand-in database, takes the
+uncompressed bodies of the list endpoints and compresses each one with
+gzip and brotli at several levels. Prints, per endpoint and setting, the
+compressed size, ratio and milliseconds of CPU per response as JSON, and
+the time a cached (precompressed) hit costs instead.
+
+    python benchmarks/bench_compression.py [--rows 10000] [--script server-lets-encrypt.py]
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.join(HERE, '..')
+sys.path.insert(0, HERE)
+sys.path.insert(0, SERVER_DIR)
+
+import compression  # noqa: E402
+import standin_db  # noqa: E402
+
+ENDPOINTS = ['/api/khazina', '/api/khazina?limit=50', '/api/sulf', '/api/qard', '/api/bait', '/api/instapay',
+             '/api/khazina/summary?group=month', '/api/sulf/by-person']
+
+SETTINGS = [('gzip', 1), ('gzip', 6), ('gzip', 9)]
+if compression.brotli is not None:
+    SETTINGS += [('br', 1), ('br', 5), ('br', 11)]
+
+
+def load_server(script, db_path, workdir):
+    os.environ.update(SQLITE_DB_PATH=db_path, REPLICA_ENABLED='0', COMPRESS_ENABLED='0',
+                      SLOW_QUERY_LOG=os.path.join(workdir, 'slow-queries.log'))
+    spec = importlib.util.spec_from_file_location('server_under_test', os.path.join(SERVER_DIR, script))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def best_time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure(body, coding, level, repeat):
+    compressor = compression.Compressor(gzip_level=level, brotli_quality=level)
+    data = compressor.compress(coding, body)
+    seconds = best_time(lambda: compressor.compress(coding, body), repeat)
+    compressor._store(('tag', coding), len(body), data)
+    hit = best_time(lambda: compressor._cached(('tag', coding), len(body)), repeat)
+    return {
+        'coding': coding,
+        'level': level,
+        'bytes': len(data),
+        'ratio': round(len(data) / len(body), 4),
+        'cpu_ms': round(seconds * 1000, 3),
+        'mb_per_s': round(len(body) / seconds / 1e6, 1),
+        'cached_hit_ms': round(hit * 1000, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000, help='[All] rows in the stand-in database')
+    parser.add_argument('--script', default='server-lets-encrypt.py')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--out', help='also write the JSON to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'standin.db')
+        standin_db.create(db_path, args.rows)
+        server = load_server(args.script, db_path, workdir)
+        client = server.app.test_client()
+        token = client.post('/api/login', json={'username': 'admin', 'password': 'selrs2024'}).get_json()['token']
+        results = []
+        for path in ENDPOINTS:
+            response = client.get(path, headers={'Authorization': f'Bearer {token}'})
+            body = response.get_data()
+            results.append({
+                'endpoint': path,
+                'status': response.status_code,
+                'bytes': len(body),
+                'settings': [measure(body, coding, level, args.repeat) for coding, level in SETTINGS],
+            })
+
+    report = json.dumps({'script': args.script, 'rows': args.rows, 'brotli': compression.brotli is not None,
+                         'results': results}, indent=2)
+    print(report)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
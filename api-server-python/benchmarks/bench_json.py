@@ -0,0 +1,91 @@
+"""
+JSON encoding benchmark: Flask's default provider vs json_provider
+Builds a SQLite stand-in from the real data_import ledger (optionally grown),
+takes the /api/khazina payload (objects and ?format=columns) from a server
+script loaded in-process, and encodes it with Flask's default settings
+(\\uXXXX escapes, sorted keys), the standard library with raw UTF-8 and,
+if installed, orjson. Prints bytes and encode time per encoder as JSON.
+
+    python benchmarks/bench_json.py [--rows 0] [--script server-lets-encrypt.py]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from flask.json.provider import _default as flask_default
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+import bench_compression  # noqa: E402
+import json_provider  # noqa: E402
+import standin_db  # noqa: E402
+
+
+def encoders():
+    yield 'flask default', lambda obj: json.dumps(obj, default=flask_default, ensure_ascii=True, sort_keys=True,
+                                                  separators=(',', ':')).encode('utf-8')
+    yield 'stdlib utf-8', lambda obj: json.dumps(obj, default=json_provider.default, ensure_ascii=False,
+                                                 separators=(',', ':')).encode('utf-8')
+    if json_provider.orjson is not None:
+        yield 'orjson', lambda obj: json_provider.orjson.dumps(obj, default=json_provider.default,
+                                                               option=json_provider.orjson.OPT_NON_STR_KEYS)
+
+
+def best_time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=0, help='grow [All] to this many rows (0 = the real rows only)')
+    parser.add_argument('--script', default='server-lets-encrypt.py')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--out', help='also write the JSON to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'standin.db')
+        counts = standin_db.create(db_path, args.rows or None)
+        server = bench_compression.load_server(args.script, db_path, workdir)
+        client = server.app.test_client()
+        token = client.post('/api/login', json={'username': 'admin', 'password': 'selrs2024'}).get_json()['token']
+        headers = {'Authorization': f'Bearer {token}'}
+        payloads = {
+            'objects': json.loads(client.get('/api/khazina', headers=headers).get_data()),
+            'columns': json.loads(client.get('/api/khazina?format=columns', headers=headers).get_data()),
+        }
+
+    results = []
+    for shape, payload in payloads.items():
+        for name, encode in encoders():
+            data = encode(payload)
+            seconds = best_time(lambda: encode(payload), args.repeat)
+            results.append({
+                'payload': shape,
+                'encoder': name,
+                'bytes': len(data),
+                'encode_ms': round(seconds * 1000, 2),
+                'mb_per_s': round(len(data) / seconds / 1e6, 1),
+            })
+
+    report = json.dumps({'script': args.script, 'rows': counts['[All]'], 'results': results}, indent=2)
+    print(report)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Row conversion microbenchmark: legacy dict_from_row vs compiled converter
+vs value lists (?format=columns), including JSON encoding of the result.
+Synthetic 100k-row [All] result set. format_date, format_number and
+converter_for come from the server script, loaded in-process on a SQLite
+stand-in, so the numbers follow the code that actually runs.
+
+    python benchmarks/bench_row_converter.py [rows] [--script server-lets-encrypt.py]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+import bench_compression  # noqa: E402
+import row_format  # noqa: E402
+import standin_db  # noqa: E402
+
+
+def legacy_dict_from_row(server):
+    """dict_from_row before the compiled converter: the column tests run for every row"""
+    format_date, format_number = server.format_date, server.format_number
+    number_list = list(server.NUMBER_FIELDS)
+
+    def dict_from_row(row, cursor):
+        columns = [description[0] for description in cursor.description]
+        record = dict(zip(columns, row))
+        for key in record:
+            if 'تاريخ' in key.lower() or key in ['التاريخ', 'date']:
+                record[key] = format_date(record[key])
+            elif key in number_list:
+                record[key] = format_number(record[key])
+        return record
+    return dict_from_row
+
+
+class FakeCursor:
+    description = tuple((name, None, None, None, None, None, True) for name in
+                        ['ID', 'التاريخ', 'الايراد', 'المصروف', 'ملاحظات', 'الرصيد', 'الاجمالي'])
+
+
+def make_rows(count):
+    start = datetime(2024, 1, 1)
+    return [(i, start + timedelta(days=i % 800), Decimal('150.5') if i % 3 else None,
+             Decimal(i % 500), 'ملاحظة رقم %d' % i, Decimal(-i), Decimal(100000 - i))
+            for i in range(count)]
+
+
+def bench(label, fn, rows, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(rows)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<22} {len(rows) / best:>12,.0f} rows/sec  ({best * 1000:.1f} ms)")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('rows', type=int, nargs='?', default=100_000)
+    parser.add_argument('--script', default='server-lets-encrypt.py')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'standin.db')
+        standin_db.create(db_path)
+        server = bench_compression.load_server(args.script, db_path, workdir)
+    run(server, make_rows(args.rows))
+
+
+def run(server, rows):
+    converter_for = server.converter_for
+    legacy = legacy_dict_from_row(server)
+    cursor = FakeCursor()
+
+    assert [legacy(r, cursor) for r in rows[:100]] == \
+        [row_format.row_converter(cursor, converter_for)(r) for r in rows[:100]]
+
+    before = bench('legacy dict_from_row', lambda rs: [legacy(r, cursor) for r in rs], rows)
+
+    def compiled(rs):
+        convert = row_format.row_converter(cursor, converter_for)
+        return [convert(r) for r in rs]
+
+    after = bench('compiled converter', compiled, rows)
+    print(f"speedup: {before / after:.2f}x")
+
+    def columnar(rs):
+        convert = row_format.tuple_converter(cursor, converter_for)
+        return [convert(r) for r in rs]
+
+    tuples = bench('value lists', columnar, rows)
+    print(f"speedup: {before / tuples:.2f}x")
+
+    records, values = compiled(rows), columnar(rows)
+    columns = row_format.tuple_converter(cursor, converter_for).columns()
+    bench('JSON of objects', lambda rs: json.dumps(records), rows)
+    bench('JSON of columns', lambda rs: json.dumps({'columns': columns, 'rows': values}), rows)
+    print(f"JSON bytes: {len(json.dumps(records)):,} as objects, "
+          f"{len(json.dumps({'columns': columns, 'rows': values})):,} as columns")
+
+
+if __name__ == '__main__':
+    main()
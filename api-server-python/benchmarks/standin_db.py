@@ -0,0 +1,118 @@
+"""
+SQLite stand-in for the Access database, seeded from data_import/*.csv
+Used by the benchmarks so they run on Linux (SQLITE_DB_PATH=...). The
+ledger can be grown to a given size by repeating the exported rows.
+
+    python benchmarks/standin_db.py out.db [ledger_rows]
+"""
+
+import csv
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import csv_import  # noqa: E402
+import sqlite_compat  # noqa: E402,F401  (registers the datetime/Decimal adapters)
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data_import')
+
+# Columns of both the V13/V14 and the V11 layouts
+SCHEMA = {
+    '[All]': [('التاريخ', 'TIMESTAMP'), ('الايراد', 'REAL'), ('المصروف', 'REAL'), ('الرصيد', 'REAL'),
+              ('الاجمالي', 'REAL'), ('ملاحظات', 'TEXT')],
+    '[سلف]': [('الاسم', 'TEXT'), ('التاريخ', 'TIMESTAMP'), ('المبلغ', 'REAL'), ('سداد', 'REAL'), ('ملاحظات', 'TEXT')],
+    '[القرض]': [('الاسم', 'TEXT'), ('التاريخ', 'TIMESTAMP'), ('المبلغ', 'REAL'), ('سداد', 'REAL'), ('ملاحظات', 'TEXT')],
+    '[البيت]': [('الاسم', 'TEXT'), ('التاريخ', 'TIMESTAMP'), ('الاجمالي', 'REAL'), ('الرصيد', 'REAL'), ('معاه', 'REAL'),
+               ('منه', 'REAL'), ('احمالي منه', 'REAL'), ('ملاحظات', 'TEXT')],
+    '[انستا]': [('الاسم', 'TEXT'), ('التاريخ', 'TIMESTAMP'), ('الاجمالي', 'REAL'), ('الرصيد', 'REAL'), ('معاه', 'REAL'),
+               ('منه', 'REAL'), ('احمالي منه', 'REAL'), ('ملاحظات', 'TEXT')],
+}
+
+SOURCES = {
+    '[All]': 'All.csv',
+    '[سلف]': 'سلف.csv',
+    '[القرض]': 'القرض.csv',
+    '[البيت]': 'insta.csv',
+    '[انستا]': 'insta.csv',
+}
+
+
+def data_file(name):
+    """data_import/<name>, also under the mangled name some exports unpacked to"""
+    for candidate in (name, name.encode('utf-8').decode('cp866')):
+        path = os.path.join(DATA_DIR, candidate)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def read_csv(path, columns):
+    """Yields (ID, values in column order) for one export"""
+    types = dict(columns)
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            values = {}
+            for header, raw in row.items():
+                column = csv_import.HEADER_ALIASES.get(header.strip(), header.strip())
+                if column not in types:
+                    continue
+                if types[column] == 'TIMESTAMP':
+                    values[column] = csv_import.parse_date(raw)
+                elif types[column] == 'REAL':
+                    values[column] = csv_import.parse_number(raw, None)
+                else:
+                    values[column] = raw or None
+            record_id = row.get('ID')
+            yield (int(record_id) if record_id and record_id.isdigit() else None), [values.get(c) for c, _ in columns]
+
+
+def grow(conn, table, columns, target):
+    """Repeat the table's rows (same dates, new IDs) until it holds target rows"""
+    names = ', '.join(f"[{name}]" for name, _ in columns)
+    seeded, last_seeded = conn.execute(f"SELECT COUNT(*), MAX(ID) FROM {table}").fetchone()
+    count = seeded
+    while seeded and count < target:
+        conn.execute(f"INSERT INTO {table} ({names}) SELECT {names} FROM {table} WHERE ID <= ? ORDER BY ID LIMIT ?",
+                     (last_seeded, min(target - count, seeded)))
+        count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    return count
+
+
+def create(path, ledger_rows=None):
+    """
+    Create (or replace) the stand-in database; returns {table: rows}.
+    ledger_rows: grow [All] to this many rows (only ever adds rows)
+    """
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    conn = sqlite3.connect(path)
+    counts = {}
+    for table, columns in SCHEMA.items():
+        definitions = ', '.join(f"[{name}] {kind}" for name, kind in columns)
+        conn.execute(f"CREATE TABLE {table} (ID INTEGER PRIMARY KEY AUTOINCREMENT, {definitions})")
+        conn.execute(f"CREATE INDEX [ix_{table.strip('[]')}_date] ON {table} ([التاريخ], ID)")
+        source = data_file(SOURCES[table])
+        if source is None:
+            counts[table] = 0
+            continue
+        names = ', '.join(['ID'] + [f"[{name}]" for name, _ in columns])
+        placeholders = ', '.join('?' for _ in range(len(columns) + 1))
+        rows = [(record_id, *values) for record_id, values in read_csv(source, columns)]
+        conn.executemany(f"INSERT INTO {table} ({names}) VALUES ({placeholders})", rows)
+        counts[table] = len(rows)
+        if table == '[All]' and ledger_rows:
+            counts[table] = grow(conn, table, columns, ledger_rows)
+    conn.commit()
+    conn.close()
+    return counts
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        sys.exit(__doc__)
+    print(create(sys.argv[1], int(sys.argv[2]) if len(sys.argv) == 3 else None))
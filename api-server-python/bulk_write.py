@@ -0,0 +1,117 @@
+"""
+SELRS API Server - Bulk insert/upsert
+Validates a whole batch up front, then writes it inside one transaction:
+one commit for a day's receipts instead of one per row. Updates of IDs
+that have no row reject the whole batch before anything is written. The
+SQL comes from the connection's storage backend.
+"""
+
+import math
+from contextlib import contextmanager
+
+from khazina_ledger import to_date
+
+
+MAX_ROWS = 1000
+
+
+class RecordErrors(Exception):
+    """Raised by write() with per-row errors; nothing was written"""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(f"record {e['index']}: {e['error']}" for e in errors))
+        self.errors = errors
+
+
+def number_fields(columns):
+    """Request fields of columns whose default is a number"""
+    return [field for _, field, default in columns
+            if isinstance(default, (int, float)) and not isinstance(default, bool)]
+
+
+def _is_number(value):
+    if value is None:
+        return True
+    if isinstance(value, bool):
+        return False
+    try:
+        return math.isfinite(float(value))
+    except (TypeError, ValueError):
+        return False
+
+
+def validate(records, required, columns=()):
+    """Per-row errors as [{'index': i, 'error': ...}]; empty when the batch is clean"""
+    numbers = number_fields(columns)
+    errors = []
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors.append({'index': index, 'error': 'Record must be an object'})
+            continue
+        missing = [field for field in required if not record.get(field)]
+        if missing:
+            errors.append({'index': index, 'error': f"Missing required fields: {', '.join(missing)}"})
+            continue
+        if record.get('id') is not None and not str(record['id']).isdigit():
+            errors.append({'index': index, 'error': 'id must be a positive integer'})
+            continue
+        invalid = [field for field in numbers if not _is_number(record.get(field))]
+        if invalid:
+            errors.append({'index': index, 'error': f"Not a number: {', '.join(invalid)}"})
+            continue
+        try:
+            to_date(record.get('date'))
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+    return errors
+
+
+@contextmanager
+def transaction(conn):
+    """Run the block in one transaction even on an autocommit connection"""
+    autocommit = getattr(conn, 'autocommit', None)
+    if autocommit:
+        conn.autocommit = False
+    try:
+        yield
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if autocommit:
+            conn.autocommit = True
+
+
+def _values(record, columns):
+    return tuple(record.get(field, default) for _, field, default in columns)
+
+
+def write(conn, table, columns, records):
+    """
+    Insert records without an 'id' and update those with one.
+    columns: [(column name, request field, default)]
+    Returns [{'index': i, 'id': ID}] in request order.
+    """
+    names = [column for column, _, _ in columns]
+    inserts = [(i, r) for i, r in enumerate(records) if r.get('id') is None]
+    updates = [(i, r) for i, r in enumerate(records) if r.get('id') is not None]
+    ids = {}
+
+    backend = conn.backend
+    with transaction(conn):
+        if updates:
+            existing = backend.existing_ids(conn, table, [r['id'] for _, r in updates])
+            missing = [{'index': index, 'error': f"Record not found: {record['id']}"}
+                       for index, record in updates if int(record['id']) not in existing]
+            if missing:
+                raise RecordErrors(missing)
+        if inserts:
+            new_ids = backend.insert_many(conn, table, names, [_values(r, columns) for _, r in inserts])
+            for (index, _), record_id in zip(inserts, new_ids):
+                ids[index] = record_id
+        if updates:
+            backend.update_many(conn, table, names, [(r['id'], _values(r, columns)) for _, r in updates])
+            for index, record in updates:
+                ids[index] = int(record['id'])
+    return [{'index': index, 'id': ids[index]} for index in range(len(records))]
@@ -0,0 +1,60 @@
+"""
+SELRS API Server - Change log for delta sync
+Every write through the API appends (sequence, table, ID, deleted) to a
+bounded in-memory log. A sync token is the server epoch plus the last
+sequence the client has seen, so "what changed since" reads only the tail
+of the log and then fetches just those rows by ID. A write can also mark
+every row of its table dated on or after some day as changed, for the
+Khazina running balance that a backdated entry shifts.
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class ChangeLog:
+    def __init__(self, max_entries=50000):
+        self.epoch = str(int(time.time() * 1000))
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=max_entries)
+        self._seq = 0
+
+    def record(self, table, record_id, deleted=False, affects_from=None):
+        """affects_from: date from which later rows of the table changed too (date.min: all of them)"""
+        with self._lock:
+            self._seq += 1
+            self._entries.append((self._seq, table, int(record_id), deleted, affects_from))
+
+    def token(self):
+        with self._lock:
+            return f"{self.epoch}-{self._seq}"
+
+    def changes_since(self, token):
+        """
+        Returns (new token, {table: {ID: deleted}}, {table: earliest affects_from})
+        with the latest state per row, or (new token, None, None) when the client
+        must reload everything: no or foreign token, server restarted, or the
+        log has been trimmed past it.
+        """
+        with self._lock:
+            current = f"{self.epoch}-{self._seq}"
+            epoch, _, seq = (token or '').partition('-')
+            if epoch != self.epoch or not seq.isdigit() or int(seq) > self._seq:
+                return current, None, None
+            since = int(seq)
+            oldest = self._entries[0][0] if self._entries else self._seq + 1
+            if since < oldest - 1:
+                return current, None, None
+            changed, affected = {}, {}
+            for entry_seq, table, record_id, deleted, affects_from in reversed(self._entries):
+                if entry_seq <= since:
+                    break
+                changed.setdefault(table, {}).setdefault(record_id, deleted)
+                if affects_from is not None and (table not in affected or affects_from < affected[table]):
+                    affected[table] = affects_from
+            return current, changed, affected
+
+    def stats(self):
+        with self._lock:
+            return {'sequence': self._seq, 'entries': len(self._entries), 'max_entries': self._entries.maxlen}
@@ -0,0 +1,173 @@
+"""
+SELRS API Server - Response compression
+Buffered JSON/text responses above a size threshold are sent gzip- or
+brotli-encoded, whichever the client accepts (brotli only when the module
+is installed). Responses that carry an ETag always have the same body for
+that tag, so their compressed bytes are kept in a small LRU and reused
+instead of being compressed again on every request.
+"""
+
+import gzip
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+
+
+def parse_accept_encoding(header):
+    """{coding: q} from an Accept-Encoding header"""
+    accepted = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+class Compressor:
+    COUNTERS = ('responses', 'cache_hits', 'bytes_in', 'bytes_out', 'cpu_s')
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=5, cache_bytes=32 * 1024 * 1024):
+        """
+        min_size: smaller bodies are sent as they are. gzip_level 1-9,
+        brotli_quality 0-11. cache_bytes: compressed bodies kept per ETag.
+        """
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_bytes = cache_bytes
+        # Preferred first when the client gives them the same q
+        self.codings = (('br',) if brotli is not None else ()) + ('gzip',)
+        self.metrics = None
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._stats = {'responses': 0, 'cache_hits': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_s': 0.0}
+
+    def choose(self, accept_encoding):
+        """The coding to use for this Accept-Encoding, or None"""
+        accepted = parse_accept_encoding(accept_encoding)
+        best, best_q = None, 0.0
+        for coding in self.codings:
+            q = accepted.get(coding, accepted.get('*', 0.0))
+            if q > best_q:
+                best, best_q = coding, q
+        return best
+
+    def compress(self, coding, body):
+        if coding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    def _cached(self, key, size):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None or entry[0] != size:
+                return None
+            self._cache.move_to_end(key)
+            return entry[1]
+
+    def _store(self, key, size, data):
+        if len(data) > self.cache_bytes:
+            return
+        with self._lock:
+            old = self._cache.pop(key, None)
+            if old is not None:
+                self._cached_bytes -= len(old[1])
+            self._cache[key] = (size, data)
+            self._cached_bytes += len(data)
+            while self._cached_bytes > self.cache_bytes:
+                _, (_, evicted) = self._cache.popitem(last=False)
+                self._cached_bytes -= len(evicted)
+
+    def process(self, response):
+        """Compress a response in place if the client and the body allow it"""
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)):
+            return response
+        response.vary.add('Accept-Encoding')
+        coding = self.choose(request.headers.get('Accept-Encoding'))
+        if coding is None:
+            return response
+        body = response.get_data()
+        if len(body) < self.min_size:
+            return response
+
+        etag, weak = response.get_etag()
+        data = self._cached((etag, coding), len(body)) if etag else None
+        hit = data is not None
+        if not hit:
+            started = time.perf_counter()
+            data = self.compress(coding, body)
+            spent = time.perf_counter() - started
+            if self.metrics is not None:
+                self.metrics.observe('compress', spent)
+            if etag:
+                self._store((etag, coding), len(body), data)
+        with self._lock:
+            self._stats['responses'] += 1
+            self._stats['cache_hits'] += 1 if hit else 0
+            self._stats['bytes_in'] += len(body)
+            self._stats['bytes_out'] += len(data)
+            if not hit:
+                self._stats['cpu_s'] += spent
+
+        response.set_data(data)
+        response.headers['Content-Encoding'] = coding
+        if etag:
+            # A different representation needs its own tag (see etags.CODINGS)
+            response.set_etag(f"{etag}-{coding}", weak)
+        return response
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cache_entries'] = len(self._cache)
+            stats['cache_bytes'] = self._cached_bytes
+        stats['cpu_s'] = round(stats['cpu_s'], 3)
+        stats['ratio'] = round(stats['bytes_out'] / stats['bytes_in'], 3) if stats['bytes_in'] else None
+        stats['brotli'] = brotli is not None
+        return stats
+
+
+def init_app(app, compressor):
+    """Register after add_header and before etags.init_app, so it sees the ETag"""
+
+    @app.after_request
+    def _compress(response):
+        return compressor.process(response)
+
+    return compressor
+
+
+def compressor_from_env():
+    """COMPRESS_ENABLED, COMPRESS_MIN_BYTES, COMPRESS_LEVEL (gzip), BROTLI_QUALITY, COMPRESS_CACHE_MB; None when disabled"""
+    if os.getenv('COMPRESS_ENABLED', '1').lower() in ('0', 'false', 'no'):
+        return None
+    return Compressor(
+        min_size=int(os.getenv('COMPRESS_MIN_BYTES', 1024)),
+        gzip_level=int(os.getenv('COMPRESS_LEVEL', 6)),
+        brotli_quality=int(os.getenv('BROTLI_QUALITY', 5)),
+        cache_bytes=int(float(os.getenv('COMPRESS_CACHE_MB', 32)) * 1024 * 1024),
+    )
@@ -0,0 +1,154 @@
+"""
+SELRS API Server - CSV import
+Streams an Access CSV export (data_import/*.csv) into a sheet row by row:
+dates like "12/31/23 00:00:00" and empty numeric cells are normalised,
+rows already in the table (same date, amounts, notes and name) are
+skipped, and new rows are written in batches through bulk_write.
+"""
+
+import csv
+import hashlib
+import os
+import time
+from datetime import datetime
+
+import bulk_write
+from khazina_ledger import to_date
+
+
+BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 500))
+
+# Headers used by older exports -> current Access column
+HEADER_ALIASES = {'سلفه': 'المبلغ', 'الموظف': 'الاسم', 'اسم الموظف': 'الاسم'}
+
+MAX_REPORTED_ERRORS = 50
+
+
+def parse_date(value):
+    day = to_date(value.strip() if isinstance(value, str) else value)
+    return datetime.combine(day, datetime.min.time()) if day else None
+
+
+def parse_number(value, default=0):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return default
+    if isinstance(value, str):
+        value = value.strip().replace(',', '')
+    return float(value)
+
+
+def _is_numeric(default):
+    return isinstance(default, (int, float)) and not isinstance(default, bool)
+
+
+def content_hash(columns, values):
+    """
+    Digest of (date, amounts, notes, name) for one row.
+    values: {column name: value} as read from the DB or parsed from the CSV
+    """
+    parts = []
+    for column, _, default in columns:
+        value = values.get(column)
+        if column == 'التاريخ':
+            day = to_date(value)
+            parts.append(day.isoformat() if day else '')
+        elif _is_numeric(default):
+            parts.append(f"{parse_number(value, 0):.2f}")
+        else:
+            parts.append('' if value is None else str(value).strip())
+    return hashlib.sha1('\x1f'.join(parts).encode('utf-8')).digest()
+
+
+def existing_hashes(conn, table, columns):
+    """Content hashes of every row already in the table (20 bytes per row)"""
+    names = [column for column, _, _ in columns]
+    cursor = conn.backend.list(conn, table, columns=names, order=None)
+    hashes = set()
+    while True:
+        rows = cursor.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            hashes.add(content_hash(columns, dict(zip(names, row))))
+    return hashes
+
+
+def read_records(stream, columns, required=()):
+    """
+    Yields (line number, record, error) for each CSV row; record is keyed by
+    request field like the JSON endpoints, error is None for usable rows.
+    """
+    reader = csv.DictReader(stream)
+    by_column = {column: (field, default) for column, field, default in columns}
+    headers = {}
+    for header in reader.fieldnames or []:
+        column = HEADER_ALIASES.get(header.strip(), header.strip())
+        if column in by_column and column not in headers.values():
+            headers[header] = column
+
+    for row in reader:
+        record, values = {}, {}
+        try:
+            for header, column in headers.items():
+                field, default = by_column[column]
+                raw = row.get(header)
+                if column == 'التاريخ':
+                    value = parse_date(raw)
+                elif _is_numeric(default):
+                    value = parse_number(raw, default)
+                else:
+                    value = raw if raw not in (None, '') else default
+                record[field] = value
+                values[column] = value
+        except ValueError as e:
+            yield reader.line_num, None, str(e)
+            continue
+        missing = [field for field in required if record.get(field) in (None, '')]
+        if missing:
+            yield reader.line_num, None, f"Missing required fields: {', '.join(missing)}"
+            continue
+        record['_hash'] = content_hash(columns, values)
+        yield reader.line_num, record, None
+
+
+def import_csv(conn, table, columns, stream, required=(), batch_size=None, on_insert=None):
+    """
+    Import one CSV stream. on_insert(results, records) runs after each batch
+    with bulk_write's [{'index', 'id'}] results.
+    Memory holds one batch plus the set of content hashes.
+    """
+    batch_size = batch_size or BATCH_SIZE
+    started = time.perf_counter()
+    seen = existing_hashes(conn, table, columns)
+    report = {'rows': 0, 'inserted': 0, 'skipped_duplicates': 0, 'skipped_invalid': 0, 'errors': []}
+    batch = []
+
+    def flush():
+        results = bulk_write.write(conn, table, columns, batch)
+        report['inserted'] += len(results)
+        if on_insert:
+            on_insert(results, batch)
+        batch.clear()
+
+    for line, record, error in read_records(stream, columns, required):
+        report['rows'] += 1
+        if error:
+            report['skipped_invalid'] += 1
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append({'line': line, 'error': error})
+            continue
+        digest = record.pop('_hash')
+        if digest in seen:
+            report['skipped_duplicates'] += 1
+            continue
+        seen.add(digest)
+        batch.append(record)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    seconds = time.perf_counter() - started
+    report['seconds'] = round(seconds, 3)
+    report['rows_per_second'] = round(report['rows'] / seconds, 1) if seconds else None
+    return report
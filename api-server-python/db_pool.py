@@ -0,0 +1,383 @@
+"""
+SELRS API Server - Database connection pool
+Keeps a bounded set of open connections to the Access file so requests
+don't pay for pyodbc.connect() every time. Works with any DB-API driver
+(pyodbc on the clinic PC, sqlite3 on Linux).
+"""
+
+import os
+import queue
+import threading
+import time
+import weakref
+
+import query_stats
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out in time"""
+
+
+class PooledConnection:
+    """Wraps a driver connection; close() hands it back to the pool"""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self.uses = 0
+        self.broken = False
+        self.checked_out = False
+        # Bumped on every checkout, so a stale reference can tell it is no longer the holder
+        self.lease = 0
+        self._cursors = weakref.WeakSet()
+
+    @property
+    def backend(self):
+        """The pool's storage.Backend, which speaks this connection's SQL"""
+        return self._pool.backend
+
+    @property
+    def autocommit(self):
+        return self._raw.autocommit
+
+    @autocommit.setter
+    def autocommit(self, value):
+        self._raw.autocommit = value
+
+    def cursor(self):
+        cursor = PooledCursor(self, self._raw.cursor())
+        if cursor._statements is not None:
+            self._cursors.add(cursor)
+        return cursor
+
+    def _finish_statements(self):
+        for cursor in list(self._cursors):
+            cursor._finish()
+
+    def commit(self):
+        self._finish_statements()
+        try:
+            self._raw.commit()
+        except Exception:
+            self.broken = True
+            raise
+
+    def rollback(self):
+        self._finish_statements()
+        try:
+            self._raw.rollback()
+        except Exception:
+            self.broken = True
+            raise
+
+    def close(self):
+        self._finish_statements()
+        if self.checked_out:
+            _forget(self)
+            self._pool.release(self)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+class PooledCursor:
+    """
+    Cursor proxy that flags its connection for recycling on driver errors
+    and reports execute/fetch time to the pool's metrics, if any.
+    With pool.statements set, each statement is reported once it is done
+    (result read to the end, next execute, cursor or connection closed,
+    commit/rollback) as statements(sql, params, execute_s, fetch_s, rows, error).
+    """
+
+    def __init__(self, conn, raw):
+        self._conn = conn
+        self._raw = raw
+        self._metrics = conn._pool.metrics
+        self._statements = conn._pool.statements
+        # [sql, params, execute_s, fetch_s, rows] of the statement being read
+        self._pending = None
+
+    def __setattr__(self, name, value):
+        # e.g. cursor.fast_executemany = True must reach the driver cursor
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._raw, name, value)
+
+    def _run(self, stage, fn, args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        except Exception:
+            self._conn.broken = True
+            if self._metrics is not None:
+                self._metrics.db_error()
+            self._failed(stage, args, time.perf_counter() - started)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            if self._metrics is not None:
+                self._metrics.observe(stage, elapsed)
+            if self._pending is not None and stage == 'db_fetch':
+                self._pending[3] += elapsed
+
+    def _failed(self, stage, args, elapsed):
+        if self._statements is None:
+            return
+        if stage == 'db_execute':
+            self._statements(args[0] if args else None, query_stats.param_count(args), elapsed, 0.0, 0, True)
+        elif self._pending is not None:
+            sql, params, execute_s, fetch_s, rows = self._pending
+            self._pending = None
+            self._statements(sql, params, execute_s, fetch_s + elapsed, rows, True)
+
+    def _begin(self, stage, fn, args, params):
+        self._finish()
+        started = time.perf_counter()
+        self._run(stage, fn, args)
+        if self._statements is not None:
+            self._pending = [args[0], params, time.perf_counter() - started, 0.0, 0]
+            if self._raw.description is None:
+                # No result set (INSERT/UPDATE/DELETE): rows affected, done
+                self._pending[4] = max(0, self._raw.rowcount or 0)
+                self._finish()
+
+    def _finish(self):
+        if self._pending is not None:
+            sql, params, execute_s, fetch_s, rows = self._pending
+            self._pending = None
+            self._statements(sql, params, execute_s, fetch_s, rows)
+
+    def _fetched(self, rows, done):
+        if self._pending is not None:
+            self._pending[4] += rows
+            if done:
+                self._finish()
+
+    def execute(self, *args):
+        self._begin('db_execute', self._raw.execute, args, query_stats.param_count(args))
+        return self
+
+    def executemany(self, *args):
+        rows = args[1] if len(args) > 1 else []
+        params = len(rows[0]) if isinstance(rows, (list, tuple)) and rows else 0
+        self._begin('db_execute', self._raw.executemany, args, params)
+        return self
+
+    def fetchone(self):
+        row = self._run('db_fetch', self._raw.fetchone, ())
+        self._fetched(0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._run('db_fetch', self._raw.fetchmany, args)
+        self._fetched(len(rows), not rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._run('db_fetch', self._raw.fetchall, ())
+        self._fetched(len(rows), True)
+        return rows
+
+    def close(self):
+        self._finish()
+        self._raw.close()
+
+    def __iter__(self):
+        if self._pending is None:
+            return iter(self._raw)
+        return self._iterate()
+
+    def _iterate(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+class ConnectionPool:
+    """Bounded pool of DB-API connections"""
+
+    # stats() keys that only ever grow (exported as Prometheus counters)
+    COUNTERS = ('checkouts', 'hits', 'opened', 'recycled', 'ping_failures', 'timeouts')
+
+    def __init__(self, connect, size=5, timeout=10.0, max_uses=500, ping_sql='SELECT 1'):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.max_uses = max_uses
+        self.ping_sql = ping_sql
+        # Optional metrics.Metrics: gets db_connect/db_execute/db_fetch timings
+        self.metrics = None
+        # Optional per-statement callback, see PooledCursor (query_stats.QueryStats.recorder)
+        self.statements = None
+        # storage.Backend for the database the connections point at
+        self.backend = None
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._stats = {
+            'checkouts': 0,
+            'hits': 0,
+            'opened': 0,
+            'recycled': 0,
+            'ping_failures': 0,
+            'timeouts': 0,
+            'in_use': 0,
+        }
+
+    def _count(self, key, delta=1):
+        with self._lock:
+            self._stats[key] += delta
+
+    def _open(self):
+        conn = PooledConnection(self, self._connect())
+        self._count('opened')
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn._raw.close()
+        except Exception:
+            pass
+        self._count('recycled')
+
+    def _ping(self, conn):
+        if not self.ping_sql:
+            return True
+        try:
+            cursor = conn._raw.cursor()
+            cursor.execute(self.ping_sql)
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            self._count('ping_failures')
+            return False
+
+    def acquire(self):
+        """Check out a connection, waiting up to `timeout` seconds for a free slot"""
+        if not self._slots.acquire(timeout=self.timeout):
+            self._count('timeouts')
+            raise PoolTimeout(f"No database connection available after {self.timeout}s")
+        try:
+            conn = None
+            while conn is None:
+                try:
+                    candidate = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._open()
+                    break
+                if self._ping(candidate):
+                    conn = candidate
+                    self._count('hits')
+                else:
+                    self._discard(candidate)
+        except Exception:
+            self._slots.release()
+            raise
+        conn.uses += 1
+        conn.lease += 1
+        conn.broken = False
+        conn.checked_out = True
+        self._count('checkouts')
+        self._count('in_use')
+        return conn
+
+    def release(self, conn):
+        """Return a connection; broken or worn-out ones are closed instead"""
+        if not conn.checked_out:
+            return
+        conn.checked_out = False
+        try:
+            if not conn.broken and not getattr(conn._raw, 'autocommit', False):
+                try:
+                    conn._raw.rollback()
+                except Exception:
+                    conn.broken = True
+            if conn.broken or conn.uses >= self.max_uses:
+                self._discard(conn)
+            else:
+                self._idle.put(conn)
+        finally:
+            self._count('in_use', -1)
+            self._slots.release()
+
+    def close_all(self):
+        """Close every idle connection (checked-out ones are closed on release)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn._raw.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+        data['size'] = self.size
+        data['idle'] = self._idle.qsize()
+        data['hit_rate'] = round(data['hits'] / data['checkouts'], 3) if data['checkouts'] else 0.0
+        return data
+
+
+def pool_from_env(connect):
+    """Build a pool using DB_POOL_* environment settings"""
+    return ConnectionPool(
+        connect,
+        size=int(os.getenv('DB_POOL_SIZE', 4)),
+        timeout=float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        max_uses=int(os.getenv('DB_POOL_MAX_USES', 500)),
+        ping_sql=os.getenv('DB_POOL_PING_SQL', 'SELECT 1'),
+    )
+
+
+def init_app(app, pool):
+    """Return any connection a request forgot to close (e.g. after an exception)"""
+    from flask import g
+
+    @app.teardown_request
+    def _release_connections(exc):
+        for conn, lease in g.pop('pooled_connections', []):
+            if not conn.checked_out or conn.lease != lease:
+                # Closed by the route already, perhaps checked out by another request since
+                continue
+            if exc is not None:
+                conn.broken = True
+            conn.close()
+
+    return pool
+
+
+def checkout(pool):
+    """Check out a connection and remember it for the request teardown"""
+    from flask import g, has_request_context
+
+    started = time.perf_counter()
+    conn = pool.acquire()
+    if pool.metrics is not None:
+        pool.metrics.observe('db_connect', time.perf_counter() - started)
+    if has_request_context():
+        g.setdefault('pooled_connections', []).append((conn, conn.lease))
+    return conn
+
+
+def detach(conn):
+    """Take over a checked-out connection (e.g. for a streamed response);
+    the caller must close() it, the request teardown no longer will"""
+    _forget(conn)
+
+
+def _forget(conn):
+    """Drop conn from the request's teardown list"""
+    from flask import g, has_request_context
+
+    if has_request_context() and 'pooled_connections' in g:
+        g.pooled_connections = [entry for entry in g.pooled_connections if entry[0] is not conn]
@@ -0,0 +1,98 @@
+"""
+SELRS API Server - ETag / If-None-Match support
+Each table has an in-process version that is bumped by every successful
+write through the API. GET responses carry a strong ETag derived from the
+table version and the full request path, and a matching If-None-Match is
+answered with 304 before the route (and the database) is reached.
+Only requests whose token verifies (signature, expiry, revocation) get
+that shortcut; the rest go on to the route and its 401. A wildcard
+If-None-Match never matches.
+Compressed responses carry the same tag with the coding appended.
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+from flask import Response, g, request
+
+
+class TableVersions:
+    """Per-table change counters, optionally tied to the database file's mtime"""
+
+    def __init__(self, watch_file=None):
+        # Restarting the server must never revive an old ETag
+        self.epoch = f"{time.time():.6f}:{os.getpid()}"
+        self.watch_file = watch_file
+        self._lock = threading.Lock()
+        self._versions = {}
+
+    def bump(self, table):
+        with self._lock:
+            self._versions[table] = self._versions.get(table, 0) + 1
+
+    def version(self, table):
+        with self._lock:
+            counter = self._versions.get(table, 0)
+        mtime = ''
+        if self.watch_file:
+            # Catches edits made directly in Access
+            try:
+                mtime = os.stat(self.watch_file).st_mtime_ns
+            except OSError:
+                pass
+        return f"{self.epoch}:{counter}:{mtime}"
+
+
+# Content codings compression.py may append to a tag ("<tag>-gzip")
+CODINGS = ('gzip', 'br')
+
+
+def etag_for(version, full_path):
+    return hashlib.sha1(f"{version}|{full_path}".encode('utf-8')).hexdigest()
+
+
+def matching_tag(if_none_match, etag):
+    """The tag the client holds for etag, in any coding, or None"""
+    if if_none_match.star_tag:
+        return None
+    for tag in (etag,) + tuple(f"{etag}-{coding}" for coding in CODINGS):
+        if if_none_match.contains(tag):
+            return tag
+    return None
+
+
+def init_app(app, versions, table_for_path, authenticate):
+    """
+    table_for_path(path) returns the table a /api path reads or writes, or None.
+    authenticate() returns the claims of the request's token, or None.
+    """
+
+    @app.before_request
+    def _check_etag():
+        if request.method != 'GET':
+            return None
+        table = table_for_path(request.path)
+        if table is None:
+            return None
+        g.etag = etag_for(versions.version(table), request.full_path)
+        tag = matching_tag(request.if_none_match, g.etag)
+        if tag is not None and authenticate() is not None:
+            response = Response(status=304)
+            response.set_etag(tag)
+            return response
+        return None
+
+    @app.after_request
+    def _set_etag(response):
+        if request.method == 'GET':
+            if response.status_code == 200 and g.get('etag'):
+                response.set_etag(g.etag)
+        elif request.method in ('POST', 'PUT', 'DELETE') and response.status_code < 400:
+            table = table_for_path(request.path)
+            if table is not None:
+                versions.bump(table)
+        return response
+
+    return versions
@@ -0,0 +1,72 @@
+"""
+SELRS API Server - UTF-8 JSON provider
+Replaces Flask's default encoder, which escapes every Arabic character to
+\\uXXXX (6 bytes instead of 2) and sorts keys. Output is compact raw UTF-8;
+dates become ISO strings and Decimals (Access currency columns) numbers.
+Uses orjson when it is installed and the standard library otherwise.
+Whole responses are encoded straight to bytes.
+"""
+
+import dataclasses
+import json
+import uuid
+from datetime import date
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: pip install orjson
+    orjson = None
+
+
+def default(o):
+    """Values neither encoder handles by itself"""
+    if isinstance(o, Decimal):
+        return int(o) if o == o.to_integral_value() else float(o)
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def encode(obj):
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    _ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=default)
+
+    def encode(obj):
+        return _ENCODER.encode(obj).encode('utf-8')
+
+
+class Utf8JSONProvider(DefaultJSONProvider):
+    ensure_ascii = False
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        """str, for callers that build JSON text themselves (streaming)"""
+        if kwargs.get('indent') is not None or kwargs.get('sort_keys'):
+            kwargs.setdefault('default', default)
+            kwargs.setdefault('ensure_ascii', False)
+            return json.dumps(obj, **kwargs)
+        return encode(obj).decode('utf-8')
+
+    def dumps_bytes(self, obj):
+        return encode(obj)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+
+
+def init_app(app):
+    """Install the provider; call before metrics.init_app, which wraps its dumps"""
+    app.json = Utf8JSONProvider(app)
+    return app.json
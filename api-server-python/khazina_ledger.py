@@ -0,0 +1,225 @@
+"""
+SELRS API Server - Khazina running-balance index
+Date-ordered prefix sums over [All] so the balance of any row, the balance
+as of a date and the net movement between two dates are answered without
+scanning the table. Rows are ordered by (date, ID); a Fenwick tree holds
+the per-day totals and each day keeps its own small {ID: net} map.
+"""
+
+import threading
+from datetime import date, datetime
+
+
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%m/%d/%y %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S']
+
+
+def to_date(value):
+    """Parse a date coming from the DB or from a request body"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text[:19], fmt).date()
+        except ValueError:
+            continue
+    try:
+        return datetime.fromisoformat(text.replace('Z', '+00:00')).date()
+    except ValueError:
+        raise ValueError(f"Unrecognised date: {value!r}")
+
+
+def net_amount(revenue, expense):
+    return float(revenue or 0) - float(expense or 0)
+
+
+class FenwickTree:
+    """Binary indexed tree of floats, 0-based positions"""
+
+    def __init__(self, size):
+        self.size = size
+        self.tree = [0.0] * (size + 1)
+
+    @classmethod
+    def from_values(cls, values):
+        tree = cls(len(values))
+        data = tree.tree
+        for i, value in enumerate(values, start=1):
+            data[i] += value
+            parent = i + (i & -i)
+            if parent <= tree.size:
+                data[parent] += data[i]
+        return tree
+
+    def add(self, pos, delta):
+        i = pos + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, pos):
+        """Sum of positions 0..pos inclusive"""
+        if pos < 0:
+            return 0.0
+        i = min(pos, self.size - 1) + 1
+        total = 0.0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+
+class LedgerIndex:
+    """Running balance of the Khazina ledger, keyed by (date, ID)"""
+
+    # Spare days allocated after the last row so new entries don't force a rebuild
+    PADDING_DAYS = 366
+
+    def __init__(self, loader=None):
+        self._loader = loader
+        self._lock = threading.RLock()
+        self._rows = {}
+        self._days = {}
+        self._tree = None
+        self._base = 0
+        self._reindex()
+        self.loaded = False
+
+    # --- building ---
+
+    def rebuild(self, rows):
+        """rows: iterable of (ID, date, revenue, expense)"""
+        with self._lock:
+            self._rows = {}
+            self._days = {}
+            for record_id, row_date, revenue, expense in rows:
+                day = to_date(row_date)
+                if day is None:
+                    continue
+                self._put(int(record_id), day.toordinal(), net_amount(revenue, expense))
+            self._reindex()
+            self.loaded = True
+
+    def reload(self):
+        if self._loader is None:
+            return
+        self.rebuild(self._loader())
+
+    def invalidate(self):
+        """Force a reload from the database on the next read"""
+        with self._lock:
+            self.loaded = False
+
+    def _ensure_loaded(self):
+        if not self.loaded:
+            self.reload()
+
+    def _put(self, record_id, day, net):
+        self._rows[record_id] = (day, net)
+        self._days.setdefault(day, {})[record_id] = net
+
+    def _reindex(self, low=None, high=None):
+        days = self._days.keys()
+        low = min(days, default=date.today().toordinal()) if low is None else low
+        high = max(days, default=low) if high is None else high
+        self._base = low
+        totals = [0.0] * (high - low + 1 + self.PADDING_DAYS)
+        for day, entries in self._days.items():
+            totals[day - low] += sum(entries.values())
+        self._tree = FenwickTree.from_values(totals)
+
+    def _pos(self, day):
+        return day - self._base
+
+    # --- writes ---
+
+    def upsert(self, record_id, row_date, revenue, expense):
+        """Insert or move a row; O(log n) unless the date falls outside the indexed range"""
+        day = to_date(row_date)
+        if day is None:
+            self.invalidate()
+            return
+        with self._lock:
+            self._ensure_loaded()
+            self._remove(int(record_id))
+            ordinal = day.toordinal()
+            net = net_amount(revenue, expense)
+            self._put(int(record_id), ordinal, net)
+            if ordinal < self._base or self._pos(ordinal) >= self._tree.size:
+                self._reindex(min(self._base, ordinal), max(self._base + self._tree.size - 1, ordinal))
+            else:
+                self._tree.add(self._pos(ordinal), net)
+
+    def remove(self, record_id):
+        with self._lock:
+            self._ensure_loaded()
+            self._remove(int(record_id))
+
+    def _remove(self, record_id):
+        old = self._rows.pop(record_id, None)
+        if old is None:
+            return
+        day, net = old
+        entries = self._days[day]
+        del entries[record_id]
+        if not entries:
+            del self._days[day]
+        self._tree.add(self._pos(day), -net)
+
+    # --- reads ---
+
+    def _balance_through_day(self, ordinal):
+        if ordinal < self._base:
+            return 0.0
+        return self._tree.prefix(self._pos(ordinal))
+
+    def balance_of(self, record_id):
+        """Running balance immediately after the given row"""
+        with self._lock:
+            self._ensure_loaded()
+            row = self._rows.get(int(record_id))
+            if row is None:
+                return None
+            day = row[0]
+            same_day = sum(net for other_id, net in self._days[day].items() if other_id <= int(record_id))
+            return round(self._balance_through_day(day - 1) + same_day, 2)
+
+    def balances_from(self, since):
+        """{ID: running balance} of every row dated on or after `since`, in (date, ID) order"""
+        with self._lock:
+            self._ensure_loaded()
+            first = max(to_date(since).toordinal(), self._base)
+            total = self._balance_through_day(first - 1)
+            balances = {}
+            for day in sorted(day for day in self._days if day >= first):
+                for record_id, net in sorted(self._days[day].items()):
+                    total += net
+                    balances[record_id] = round(total, 2)
+            return balances
+
+    def date_of(self, record_id):
+        """Date the index currently holds for a row, or None"""
+        with self._lock:
+            self._ensure_loaded()
+            row = self._rows.get(int(record_id))
+            return date.fromordinal(row[0]) if row else None
+
+    def balance_as_of(self, as_of):
+        """Balance after every row dated on or before `as_of`"""
+        with self._lock:
+            self._ensure_loaded()
+            return round(self._balance_through_day(to_date(as_of).toordinal()), 2)
+
+    def net_between(self, start, end):
+        """Revenue minus expense for rows dated start..end inclusive"""
+        with self._lock:
+            self._ensure_loaded()
+            return round(self._balance_through_day(to_date(end).toordinal())
+                         - self._balance_through_day(to_date(start).toordinal() - 1), 2)
+
+    def __len__(self):
+        return len(self._rows)
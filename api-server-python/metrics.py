@@ -0,0 +1,183 @@
+"""
+SELRS API Server - Prometheus metrics
+Per route and method: request latency, time spent getting a connection,
+in cursor.execute, fetching, waiting on the writer, serializing JSON and
+compressing, response size, status codes and DB errors. Stats the server
+already keeps (pool, caches, replica, writer) are read at scrape time:
+running totals as counters, the rest as gauges.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Stages timed inside a request (see observe)
+STAGES = ('db_connect', 'db_execute', 'db_fetch', 'db_write', 'serialize', 'compress')
+
+
+def _labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self, out):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} histogram")
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            base = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                out.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            out.append(f'{self.name}_bucket{{{base},le="+Inf"}} {count}')
+            out.append(f'{self.name}_sum{{{base}}} {round(total, 6)}')
+            out.append(f'{self.name}_count{{{base}}} {count}')
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self._values = {}
+
+    def inc(self, labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self, out):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} counter")
+        for labels, value in sorted(self._values.items()):
+            out.append(f'{self.name}{{{_labels(self.label_names, labels)}}} {value}')
+
+
+class Metrics:
+    def __init__(self, prefix='selrs'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._collectors = {}
+        self.latency = Histogram(f'{prefix}_request_seconds', 'Time from request start to response',
+                                 ('route', 'method'), LATENCY_BUCKETS)
+        self.stages = Histogram(f'{prefix}_request_stage_seconds', 'Time per request spent in one stage',
+                                ('route', 'method', 'stage'), LATENCY_BUCKETS)
+        self.size = Histogram(f'{prefix}_response_bytes', 'Response body size (buffered responses)',
+                              ('route', 'method'), SIZE_BUCKETS)
+        self.responses = Counter(f'{prefix}_responses_total', 'Responses by status code',
+                                 ('route', 'method', 'status'))
+        self.db_errors = Counter(f'{prefix}_db_errors_total', 'Statements that raised a driver error',
+                                 ('route', 'method'))
+
+    def observe(self, stage, seconds):
+        """Add time spent in a stage to the current request (no-op outside requests)"""
+        if has_request_context():
+            stages = g.get('metrics_stages')
+            if stages is None:
+                stages = g.metrics_stages = {}
+            stages[stage] = stages.get(stage, 0.0) + seconds
+
+    def db_error(self):
+        if has_request_context():
+            g.metrics_db_errors = g.get('metrics_db_errors', 0) + 1
+
+    def timed(self, stage, fn):
+        """Wrap fn so each call is counted as time in stage"""
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.observe(stage, time.perf_counter() - started)
+        return wrapper
+
+    def collect(self, name, stats, counters=()):
+        """
+        stats() -> dict; its numeric values are exported as <prefix>_<name>_<key>
+        gauges, except the keys in counters (totals that only grow), which
+        become <prefix>_<name>_<key>_total counters
+        """
+        self._collectors[name] = (stats, frozenset(counters))
+
+    def _record(self, response):
+        rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        labels = (rule, request.method)
+        seconds = time.perf_counter() - g.metrics_started
+        size = None if response.is_streamed else response.calculate_content_length()
+        with self._lock:
+            self.latency.observe(labels, seconds)
+            for stage, spent in (g.get('metrics_stages') or {}).items():
+                self.stages.observe(labels + (stage,), spent)
+            if size is not None:
+                self.size.observe(labels, size)
+            self.responses.inc(labels + (str(response.status_code),))
+            errors = g.get('metrics_db_errors')
+            if errors:
+                self.db_errors.inc(labels, errors)
+
+    def render(self):
+        out = []
+        with self._lock:
+            for metric in (self.latency, self.stages, self.size, self.responses, self.db_errors):
+                metric.render(out)
+        for name, (stats, counters) in self._collectors.items():
+            try:
+                values = stats() or {}
+            except Exception:
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                if key in counters:
+                    out.append(f"# TYPE {self.prefix}_{name}_{key}_total counter")
+                    out.append(f"{self.prefix}_{name}_{key}_total {value}")
+                else:
+                    out.append(f"# TYPE {self.prefix}_{name}_{key} gauge")
+                    out.append(f"{self.prefix}_{name}_{key} {value}")
+        return '\n'.join(out) + '\n'
+
+
+def init_app(app, metrics=None):
+    """Register the request hooks; call right after creating the app so they wrap the others"""
+    metrics = metrics or Metrics()
+    app.json.dumps = metrics.timed('serialize', app.json.dumps)
+    if hasattr(app.json, 'dumps_bytes'):
+        # json_provider encodes whole responses without going through dumps
+        app.json.dumps_bytes = metrics.timed('serialize', app.json.dumps_bytes)
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record(response):
+        if g.get('metrics_started') is not None:
+            metrics._record(response)
+        return response
+
+    return metrics
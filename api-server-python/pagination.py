@@ -0,0 +1,56 @@
+"""
+SELRS API Server - Keyset pagination for list endpoints
+Pages are ordered by ([التاريخ] DESC, ID DESC). The cursor is an opaque
+token holding the (date, ID) of the last row served; the next page starts
+strictly after it, so pages stay stable while rows are being added.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+def encode_cursor(row_date, record_id):
+    payload = [row_date.isoformat() if row_date is not None else None, int(record_id)]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        row_date, record_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (datetime.fromisoformat(row_date) if row_date is not None else None), int(record_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def page_args(args):
+    """(limit, after) from ?limit=&cursor=, or None when the client wants the full list"""
+    limit = args.get('limit')
+    token = args.get('cursor')
+    if limit is None and token is None:
+        return None
+    if limit is None:
+        limit = DEFAULT_LIMIT
+    elif not str(limit).isdigit() or int(limit) < 1:
+        raise ValueError('limit must be a positive integer')
+    return min(int(limit), MAX_LIMIT), (decode_cursor(token) if token else None)
+
+
+def fetch_page(conn, table, limit, after=None, start=None, end=None):
+    """
+    Run one page query through the connection's storage backend.
+    Returns (cursor, raw rows, next_cursor or None).
+    """
+    cursor = conn.backend.list(conn, table, start=start, end=end, after=after, limit=limit + 1)
+    rows = cursor.fetchall()
+    if len(rows) <= limit:
+        return cursor, rows, None
+    rows = rows[:limit]
+    columns = [column[0] for column in cursor.description]
+    last = rows[-1]
+    return cursor, rows, encode_cursor(last[columns.index('التاريخ')], last[columns.index('ID')])
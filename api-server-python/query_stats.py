@@ -0,0 +1,157 @@
+"""
+SELRS API Server - Per-statement timing and slow-query log
+Pooled cursors report every statement here: the SQL with its literals
+replaced by ?, parameter count, time in execute, time fetching and rows
+returned. Totals are kept per normalised statement for the admin endpoint;
+statements slower than the threshold are written to a rotating log file.
+"""
+
+import logging
+import logging.handlers
+import os
+import re
+import threading
+
+
+_TOKEN = re.compile(r"(\[[^\]]*\])|('(?:[^']|'')*')|(#[^#]*#)|(?<![\w.])(-?\d+(?:\.\d+)?)(?![\w.])")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+
+# Distinct raw SQL strings remembered by normalize() (they repeat per route)
+_CACHE_SIZE = 2048
+_normalized = {}
+
+
+def normalize(sql):
+    """
+    Statement text with numbers, 'strings' and #dates# replaced by ?,
+    IN (?, ?, ...) collapsed and whitespace squeezed. [Bracketed] names
+    are kept as they are, digits included.
+    """
+    cached = _normalized.get(sql)
+    if cached is not None:
+        return cached
+    text = _TOKEN.sub(lambda m: m.group(1) or '?', sql)
+    text = _IN_LIST.sub('IN (?...)', text)
+    text = _SPACES.sub(' ', text).strip()
+    if len(_normalized) >= _CACHE_SIZE:
+        _normalized.clear()
+    _normalized[sql] = text
+    return text
+
+
+def param_count(args):
+    """Number of parameters passed to execute(sql, ...) in either pyodbc style"""
+    if len(args) == 2 and isinstance(args[1], (list, tuple)):
+        return len(args[1])
+    return max(0, len(args) - 1)
+
+
+class QueryStats:
+    def __init__(self, slow_ms=200, log_path=None, max_bytes=1024 * 1024, backups=5):
+        """
+        slow_ms: statements taking longer than this (execute + fetch) are
+        logged; 0 disables the log. log_path: rotating log file.
+        """
+        self.slow_ms = slow_ms
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._logger = None
+        if log_path and slow_ms > 0:
+            self._logger = logging.getLogger(f'selrs.slow_queries.{os.path.abspath(log_path)}')
+            self._logger.setLevel(logging.INFO)
+            self._logger.propagate = False
+            if not self._logger.handlers:
+                handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=max_bytes,
+                                                               backupCount=backups, encoding='utf-8')
+                handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+                self._logger.addHandler(handler)
+
+    def recorder(self, source):
+        """record() bound to one connection source (e.g. 'access', 'replica')"""
+        def record(sql, params, execute_s, fetch_s, rows, error=False):
+            self.record(source, sql, params, execute_s, fetch_s, rows, error)
+        return record
+
+    def record(self, source, sql, params, execute_s, fetch_s, rows, error=False):
+        if not isinstance(sql, str):
+            return
+        text = normalize(sql)
+        total_s = execute_s + fetch_s
+        key = (source, text)
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is None:
+                entry = self._statements[key] = {
+                    'calls': 0, 'errors': 0, 'total_s': 0.0, 'execute_s': 0.0,
+                    'fetch_s': 0.0, 'max_s': 0.0, 'rows': 0, 'params': params,
+                }
+            entry['calls'] += 1
+            entry['errors'] += 1 if error else 0
+            entry['total_s'] += total_s
+            entry['execute_s'] += execute_s
+            entry['fetch_s'] += fetch_s
+            entry['max_s'] = max(entry['max_s'], total_s)
+            entry['rows'] += rows
+            entry['params'] = params
+        if self._logger is not None and total_s * 1000 >= self.slow_ms:
+            self._logger.info("%s %.1fms execute=%.1fms fetch=%.1fms rows=%d params=%d%s | %s",
+                              source, total_s * 1000, execute_s * 1000, fetch_s * 1000, rows, params,
+                              ' error' if error else '', text)
+
+    def top(self, n=20, sort='total'):
+        """The n statements with the highest total (or mean/max/calls)"""
+        keys = {
+            'total': lambda item: item[1]['total_s'],
+            'mean': lambda item: item[1]['total_s'] / item[1]['calls'],
+            'max': lambda item: item[1]['max_s'],
+            'calls': lambda item: item[1]['calls'],
+        }
+        if sort not in keys:
+            raise ValueError(f"sort must be one of: {', '.join(keys)}")
+        with self._lock:
+            items = [(key, dict(entry)) for key, entry in self._statements.items()]
+        items.sort(key=keys[sort], reverse=True)
+        result = []
+        for (source, text), entry in items[:n]:
+            calls = entry['calls']
+            result.append({
+                'sql': text,
+                'source': source,
+                'calls': calls,
+                'errors': entry['errors'],
+                'params': entry['params'],
+                'total_ms': round(entry['total_s'] * 1000, 2),
+                'mean_ms': round(entry['total_s'] * 1000 / calls, 3),
+                'max_ms': round(entry['max_s'] * 1000, 2),
+                'execute_ms': round(entry['execute_s'] * 1000, 2),
+                'fetch_ms': round(entry['fetch_s'] * 1000, 2),
+                'rows': entry['rows'],
+                'rows_per_call': round(entry['rows'] / calls, 1),
+            })
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+
+    def stats(self):
+        with self._lock:
+            entries = list(self._statements.values())
+        return {
+            'statements': len(entries),
+            'calls': sum(e['calls'] for e in entries),
+            'total_ms': round(sum(e['total_s'] for e in entries) * 1000, 1),
+            'slow_ms': self.slow_ms,
+        }
+
+
+def stats_from_env(default_log):
+    """SLOW_QUERY_MS (threshold, 0 = no log), SLOW_QUERY_LOG (file), SLOW_QUERY_LOG_BYTES/BACKUPS"""
+    return QueryStats(
+        slow_ms=float(os.getenv('SLOW_QUERY_MS', 200)),
+        log_path=os.getenv('SLOW_QUERY_LOG', default_log),
+        max_bytes=int(os.getenv('SLOW_QUERY_LOG_BYTES', 1024 * 1024)),
+        backups=int(os.getenv('SLOW_QUERY_LOG_BACKUPS', 5)),
+    )
@@ -0,0 +1,78 @@
+"""
+SELRS API Server - Partitioned read cache
+Holds formatted rows per partition (e.g. one Khazina year) with LRU
+eviction bounded by the total number of cached rows. Writers invalidate
+only the partitions they touch.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class PartitionedCache:
+    """LRU cache of row lists keyed by partition"""
+
+    COUNTERS = ('hits', 'misses', 'evictions', 'invalidations')
+
+    def __init__(self, max_rows=20000):
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._rows = 0
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def generation(self, key):
+        """Snapshot to pass to put(); a later invalidate() makes that put a no-op"""
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def get(self, key):
+        with self._lock:
+            rows = self._entries.get(key)
+            if rows is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return rows
+
+    def put(self, key, rows, generation):
+        with self._lock:
+            if self._generations.get(key, 0) != generation or len(rows) > self.max_rows:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._rows -= len(old)
+            self._entries[key] = rows
+            self._rows += len(rows)
+            while self._rows > self.max_rows:
+                _, evicted = self._entries.popitem(last=False)
+                self._rows -= len(evicted)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._generations[key] = self._generations.get(key, 0) + 1
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self._rows -= len(old)
+                    self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries) + list(self._generations):
+                self._generations[key] = self._generations.get(key, 0) + 1
+            self._entries.clear()
+            self._rows = 0
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['partitions'] = list(self._entries)
+            data['rows'] = self._rows
+            data['max_rows'] = self.max_rows
+        lookups = data['hits'] + data['misses']
+        data['hit_rate'] = round(data['hits'] / lookups, 3) if lookups else 0.0
+        return data
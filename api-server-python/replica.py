@@ -0,0 +1,251 @@
+"""
+SELRS API Server - Local SQLite read replica
+GET endpoints read a SQLite copy of the five sheets instead of the Access
+file. Writes still go to Access first; the written rows are then copied
+into the replica by ID, and a background full re-sync picks up anything
+that was edited directly in Access.
+"""
+
+import os
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+import db_pool
+import storage
+
+
+INDEXED_COLUMNS = ('التاريخ', 'الاسم')
+
+# Python type reported by the source driver -> SQLite declared type
+COLUMN_TYPES = [
+    (bool, 'INTEGER'),
+    (int, 'INTEGER'),
+    ((float, Decimal), 'REAL'),
+    ((datetime, date), 'TIMESTAMP'),
+    (str, 'TEXT'),
+]
+
+
+def quote(name):
+    return '[' + name.strip('[]') + ']'
+
+
+def column_type(type_code, values):
+    """Declared type from cursor.description, or from the first non-null value"""
+    if not isinstance(type_code, type):
+        sample = next((value for value in values if value is not None), None)
+        type_code = type(sample) if sample is not None else str
+    for types, declared in COLUMN_TYPES:
+        if issubclass(type_code, types):
+            return declared
+    return 'TEXT'
+
+
+class Replica:
+    COUNTERS = ('full_syncs', 'full_sync_errors', 'fallbacks', 'rows_refreshed', 'rows_changed_outside')
+
+    # Wait before re-syncing after a failure; doubles while failures repeat
+    RETRY_SECONDS = 1
+    RETRY_MAX_SECONDS = 30
+
+    def __init__(self, path, tables, source, on_change=None, interval=300, pool_size=4):
+        """
+        tables: Access table names, e.g. '[All]'
+        source(): a pooled connection to the primary database (its storage
+        backend reads the rows), closed after use
+        on_change(table, ID, deleted): rows found changed by a full re-sync
+        """
+        self.path = path
+        self.tables = list(tables)
+        self.source = source
+        self.on_change = on_change
+        self.interval = interval
+        self.backend = storage.SQLiteBackend(path)
+        self.pool = db_pool.ConnectionPool(self.backend.connect, size=pool_size)
+        self.pool.backend = self.backend
+        self.ready = False
+        self._lock = threading.Lock()
+        self._columns = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._fell_back = False
+        self._stats = {'full_syncs': 0, 'full_sync_errors': 0, 'fallbacks': 0, 'last_full_sync': None,
+                       'last_full_sync_seconds': None, 'last_error': None,
+                       'rows_refreshed': 0, 'rows_changed_outside': 0}
+
+    def _writer(self):
+        return self.backend.connect()
+
+    def full_sync(self):
+        """Copy every table from the source, swapping each one in atomically"""
+        started = time.perf_counter()
+        with self._lock:
+            source = self.source()
+            if not source:
+                raise RuntimeError('Database connection failed')
+            conn = self._writer()
+            try:
+                changed = []
+                for table in self.tables:
+                    changed.extend(self._copy_table(source, conn, table))
+            finally:
+                source.close()
+                conn.close()
+            first_sync = not self._stats['full_syncs']
+            self.ready = True
+        self._stats['full_syncs'] += 1
+        self._stats['last_full_sync'] = datetime.now().isoformat(timespec='seconds')
+        self._stats['last_full_sync_seconds'] = round(time.perf_counter() - started, 3)
+        if self.on_change and not first_sync:
+            self._stats['rows_changed_outside'] += len(changed)
+            for change in changed:
+                self.on_change(*change)
+        return len(changed)
+
+    def _copy_table(self, source, conn, table):
+        source_cursor = source.backend.list(source, table, order=None)
+        names = [column[0] for column in source_cursor.description]
+        rows = source_cursor.fetchall()
+        columns = []
+        for index, column in enumerate(source_cursor.description):
+            declared = column_type(column[1], (row[index] for row in rows))
+            if column[0] == 'ID':
+                declared = 'INTEGER PRIMARY KEY'
+            columns.append(f"{quote(column[0])} {declared}")
+
+        name = table.strip('[]')
+        staging = quote(name + '__sync')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(f"DROP TABLE IF EXISTS {staging}")
+            conn.execute(f"CREATE TABLE {staging} ({', '.join(columns)})")
+            conn.executemany(f"INSERT INTO {staging} VALUES ({', '.join('?' for _ in names)})",
+                             [tuple(row) for row in rows])
+
+            changed = []
+            existing = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone()
+            if existing and 'ID' in names:
+                old_names = [column[0] for column in conn.execute(f"SELECT * FROM {table} LIMIT 0").description]
+                if old_names == names:
+                    changed.extend((table, row[0], False) for row in conn.execute(
+                        f"SELECT ID FROM (SELECT * FROM {staging} EXCEPT SELECT * FROM {table})"))
+                else:
+                    changed.extend((table, row[0], False) for row in conn.execute(f"SELECT ID FROM {staging}"))
+                changed.extend((table, row[0], True) for row in conn.execute(
+                    f"SELECT ID FROM {table} EXCEPT SELECT ID FROM {staging}"))
+
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.execute(f"ALTER TABLE {staging} RENAME TO {quote(name)}")
+            for column in INDEXED_COLUMNS:
+                if column in names:
+                    conn.execute(f"CREATE INDEX {quote(f'ix_{name}_{column}')} ON {table} ({quote(column)}, ID)")
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._columns[table] = names
+        return changed
+
+    def refresh(self, table, record_id, deleted=False):
+        """Copy one row written through the API from the source (or drop it)"""
+        if not self.ready or table not in self._columns:
+            return
+        try:
+            self._refresh(table, record_id, deleted)
+        except Exception as e:
+            self._fall_back(str(e))
+            raise
+
+    def _fall_back(self, reason):
+        """Serve reads from the source and start a full re-sync (after the back-off)"""
+        self.ready = False
+        self._fell_back = True
+        self._stats['fallbacks'] += 1
+        self._stats['last_error'] = reason
+        self._wake.set()
+
+    def _refresh(self, table, record_id, deleted):
+        with self._lock:
+            row = None
+            if not deleted:
+                source = self.source()
+                if not source:
+                    raise RuntimeError('Database connection failed')
+                try:
+                    cursor = source.backend.get(source, table, record_id)
+                    names = [column[0] for column in cursor.description]
+                    row = cursor.fetchone()
+                finally:
+                    source.close()
+                if names != self._columns[table]:
+                    # Columns changed in Access; only a full copy can follow that
+                    self._fall_back(f"columns of {table} changed")
+                    return
+            conn = self._writer()
+            try:
+                if row is None:
+                    self.backend.delete(conn, table, record_id)
+                else:
+                    values = {name: value for name, value in zip(names, row) if name != 'ID'}
+                    self.backend.upsert(conn, table, record_id, values)
+            finally:
+                conn.close()
+            self._stats['rows_refreshed'] += 1
+
+    def _backoff(self, delay):
+        return min(max(delay * 2, self.RETRY_SECONDS), self.RETRY_MAX_SECONDS, self.interval)
+
+    def _run(self):
+        delay = 0
+        while not self._stop.is_set():
+            if delay:
+                # A source that keeps failing is not retried faster however often reads fall back
+                self._stop.wait(delay)
+            self._wake.clear()
+            self._fell_back = False
+            try:
+                self.full_sync()
+            except Exception as e:
+                self._stats['full_sync_errors'] += 1
+                self._stats['last_error'] = str(e)
+                print(f"Replica sync error: {e}", flush=True)
+                delay = self._backoff(delay)
+                continue
+            self._wake.wait(self.interval)
+            delay = self._backoff(delay) if self._fell_back else 0
+
+    def start(self):
+        """Fill the replica and keep re-syncing it in a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sqlite-replica', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def invalidate(self):
+        """Read from the source until a full re-sync, which starts now (e.g. after an import)"""
+        self.ready = False
+        self._wake.set()
+
+    def stats(self):
+        data = dict(self._stats)
+        data['ready'] = self.ready
+        data['path'] = self.path
+        data['interval'] = self.interval
+        data['pool'] = self.pool.stats()
+        return data
+
+
+def replica_from_env(tables, source, on_change=None, default_path=None):
+    """REPLICA_ENABLED, REPLICA_PATH, REPLICA_RESYNC_SECONDS, REPLICA_POOL_SIZE; None when disabled"""
+    if os.getenv('REPLICA_ENABLED', '1').lower() in ('0', 'false', 'no'):
+        return None
+    path = os.getenv('REPLICA_PATH') or default_path
+    return Replica(path, tables, source, on_change=on_change,
+                   interval=float(os.getenv('REPLICA_RESYNC_SECONDS', 300)),
+                   pool_size=int(os.getenv('REPLICA_POOL_SIZE', 4)))
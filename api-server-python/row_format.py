@@ -0,0 +1,91 @@
+"""
+SELRS API Server - Compiled row converters
+Decides once per result set which columns need formatting, instead of
+re-checking every column name for every row. Rows come out as dicts, or as
+plain value lists for the columnar (?format=columns) responses.
+"""
+
+
+def compile_plan(description, converter_for):
+    """
+    description: cursor.description
+    converter_for(column name) -> formatting function or None
+    Returns (column names, [(index, function)]) for the columns that need work.
+    """
+    names = tuple(column[0] for column in description)
+    steps = []
+    for index, name in enumerate(names):
+        convert = converter_for(name)
+        if convert is not None:
+            steps.append((index, convert))
+    return names, tuple(steps)
+
+
+def row_converter(cursor, converter_for):
+    """
+    Returns convert(row) -> dict for the cursor's current result set.
+    The plan is built from cursor.description on the first row, so the
+    converter may be created before the query is executed.
+    """
+    plan = []
+
+    def convert(row):
+        if not plan:
+            plan.extend(compile_plan(cursor.description, converter_for))
+        names, steps = plan
+        values = list(row)
+        for index, fn in steps:
+            values[index] = fn(values[index])
+        return dict(zip(names, values))
+
+    return convert
+
+
+def tuple_converter(cursor, converter_for, derived=()):
+    """
+    Returns convert(row) -> list of formatted values, in the order of
+    convert.columns(). derived: (column, fn(get)) pairs computed after
+    formatting, where get(column) is that column's formatted value in the
+    same row; an existing column is replaced in place, a new one appended.
+    """
+    plan = []
+
+    def build():
+        names, steps = compile_plan(cursor.description, converter_for)
+        columns = list(names)
+        index = {name: i for i, name in enumerate(columns)}
+        extra = []
+        for name, fn in derived:
+            if name not in index:
+                index[name] = len(columns)
+                columns.append(name)
+            extra.append((index[name], fn))
+        plan.extend((columns, steps, index, tuple(extra), len(columns) - len(names)))
+
+    def columns():
+        if not plan:
+            build()
+        return list(plan[0])
+
+    def convert(row):
+        if not plan:
+            build()
+        _, steps, index, extra, added = plan
+        values = list(row)
+        if added:
+            values.extend([None] * added)
+        for i, fn in steps:
+            values[i] = fn(values[i])
+        if extra:
+            get = lambda name: values[index[name]] if name in index else None
+            for i, fn in extra:
+                values[i] = fn(get)
+        return values
+
+    convert.columns = columns
+    return convert
+
+
+def wants_columns(args):
+    """?format=columns: {columns: [...], rows: [[...], ...]} instead of one object per row"""
+    return args.get('format', '').lower() == 'columns'
@@ -0,0 +1,206 @@
+"""
+SELRS API Server - Full-text search over names and notes
+An in-process inverted index (token -> {(table, ID): occurrences}) over the
+text columns of the five sheets. Text is normalised the way people type
+Arabic on a phone: alef variants, ya/alef maqsura and ta marbuta are folded,
+tatweel and diacritics are dropped, and words starting with the article
+(ال) can also be found without it. Tables are loaded on first use and kept
+current one row at a time as writes come in.
+"""
+
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+
+from khazina_ledger import to_date
+
+
+# Character folding applied before tokenizing
+_FOLD = {ord(c): 'ا' for c in 'أإآٱ'}
+_FOLD.update({ord('ى'): 'ي', ord('ة'): 'ه', ord('ـ'): None})
+_FOLD.update({code: None for code in range(0x064B, 0x0660)})   # harakat, shadda, sukun, ...
+_FOLD[0x0670] = None                                             # superscript alef
+_FOLD.update({0x0660 + d: str(d) for d in range(10)})            # Arabic-Indic digits
+_FOLD.update({0x06F0 + d: str(d) for d in range(10)})            # Persian digits
+
+_WORD = re.compile(r'\w+')
+
+ARTICLE = 'ال'
+
+# Query terms this long or longer also match words they are a prefix of
+PREFIX_MIN = 2
+# Score of a prefix match relative to a whole-word match
+PREFIX_WEIGHT = 0.5
+
+
+def normalize(text):
+    return str(text).translate(_FOLD).casefold()
+
+
+def tokenize(text):
+    """Normalised words of a value; None gives none"""
+    if text is None:
+        return []
+    return _WORD.findall(normalize(text))
+
+
+def index_terms(text):
+    """tokenize(), plus each word that starts with the article without it"""
+    terms = []
+    for token in tokenize(text):
+        terms.append(token)
+        if token.startswith(ARTICLE) and len(token) > len(ARTICLE) + 1:
+            terms.append(token[len(ARTICLE):])
+    return terms
+
+
+class SearchIndex:
+    def __init__(self, fields, loader):
+        """
+        fields: {table: [text columns]}. loader(table, record_id=None) ->
+        rows of (ID, date, *text columns) for the whole table or one row.
+        """
+        self.fields = fields
+        self._loader = loader
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._vocabulary = []
+        self._docs = {}
+        self._loaded = set()
+
+    # --- building ---
+
+    def reload(self, table):
+        rows = self._loader(table)
+        with self._lock:
+            for key in [key for key in self._docs if key[0] == table]:
+                self._remove(key)
+            for row in rows:
+                self._put(table, row)
+            self._loaded.add(table)
+
+    def invalidate(self, table=None):
+        """Reload a table (or all of them) on the next search"""
+        with self._lock:
+            if table is None:
+                self._loaded.clear()
+            else:
+                self._loaded.discard(table)
+
+    def _ensure_loaded(self, tables):
+        for table in tables:
+            if table not in self._loaded:
+                self.reload(table)
+
+    def __len__(self):
+        return len(self._docs)
+
+    # --- writes ---
+
+    def refresh(self, table, record_id, deleted=False):
+        """Re-read one written row; tables not loaded yet are left alone"""
+        if table not in self._loaded:
+            return
+        rows = [] if deleted else self._loader(table, record_id)
+        with self._lock:
+            self._remove((table, int(record_id)))
+            for row in rows:
+                self._put(table, row)
+
+    def _put(self, table, row):
+        record_id, row_date, *texts = row
+        key = (table, int(record_id))
+        self._remove(key)
+        counts = {}
+        for text in texts:
+            for token in index_terms(text):
+                counts[token] = counts.get(token, 0) + 1
+        try:
+            day = to_date(row_date)
+        except ValueError:
+            day = None
+        self._docs[key] = (day, texts, counts)
+        for token, count in counts.items():
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = {}
+                insort(self._vocabulary, token)
+            posting[key] = count
+
+    def _remove(self, key):
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        for token in doc[2]:
+            posting = self._postings[token]
+            del posting[key]
+            if not posting:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+
+    # --- reads ---
+
+    def _matches(self, term):
+        """[(token, weight)]: the term itself and, if long enough, words starting with it"""
+        matches = [(term, 1.0)] if term in self._postings else []
+        if len(term) >= PREFIX_MIN:
+            i = bisect_left(self._vocabulary, term)
+            while i < len(self._vocabulary) and self._vocabulary[i].startswith(term):
+                if self._vocabulary[i] != term:
+                    matches.append((self._vocabulary[i], PREFIX_WEIGHT))
+                i += 1
+        return matches
+
+    def search(self, query, tables=None, start=None, end=None, limit=50, offset=0):
+        """
+        Rows containing every word of query (whole words or prefixes), best
+        first: tf-idf summed over the words, then newest. start/end: dates,
+        both inclusive. Returns (total hits, [(table, ID, date, texts, score)]).
+        """
+        tables = list(tables or self.fields)
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return 0, []
+        self._ensure_loaded(tables)
+        wanted = set(tables)
+        with self._lock:
+            total_docs = len(self._docs) or 1
+            scores = None
+            for term in terms:
+                term_scores = {}
+                for token, weight in self._matches(term):
+                    posting = self._postings[token]
+                    idf = math.log(1 + total_docs / len(posting))
+                    for key, count in posting.items():
+                        if key[0] not in wanted or (scores is not None and key not in scores):
+                            continue
+                        score = weight * count * idf
+                        if score > term_scores.get(key, 0.0):
+                            term_scores[key] = score
+                if scores is not None:
+                    term_scores = {key: scores[key] + score for key, score in term_scores.items()}
+                scores = term_scores
+                if not scores:
+                    return 0, []
+            hits = []
+            for key, score in scores.items():
+                day, texts, _ = self._docs[key]
+                if (start is not None or end is not None) and day is None:
+                    continue
+                if (start is not None and day < start) or (end is not None and day > end):
+                    continue
+                hits.append((key[0], key[1], day, texts, score))
+        # Only the pages up to this one need ordering
+        ranked = heapq.nsmallest(offset + limit, hits,
+                                 key=lambda hit: (-hit[4], -(hit[2].toordinal() if hit[2] else 0), -hit[1]))
+        return len(hits), ranked[offset:]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rows': len(self._docs),
+                'words': len(self._postings),
+                'tables_loaded': len(self._loaded),
+            }
@@ -5,13 +5,13 @@ Supports both HTTP and HTTPS (with SSL certificate)
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import pyodbc
 import jwt
 import os
 from datetime import datetime, timedelta
 from functools import wraps
 import ssl
 from dotenv import load_dotenv
+import storage
 
 # Load environment variables
 load_dotenv()
@@ -24,13 +24,14 @@ DATABASE_PATH = r"C:\Users\selrs\OneDrive\Documents\SELRS\SELRS.accdb"
 SECRET_KEY = os.getenv('SECRET_KEY', 'selrs-secret-key-2024')
 JWT_EXPIRATION = 24  # hours
 
+# Access through pyodbc, or a SQLite file standing in for it (SQLITE_DB_PATH, e.g. on Linux)
+STORAGE = storage.backend_from_env(DATABASE_PATH)
+
 # Database connection
 def get_db_connection():
     """Create database connection"""
     try:
-        conn_str = f'Driver={{Microsoft Access Driver (*.mdb, *.accdb)}};DBQ={DATABASE_PATH};'
-        conn = pyodbc.connect(conn_str)
-        return conn
+        return STORAGE.connect()
     except Exception as e:
         print(f"Database connection error: {e}")
         return None
@@ -128,8 +129,7 @@ def get_sulf():
         if not conn:
             return jsonify({'error': 'Database connection failed'}), 500
         
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM Sulf ORDER BY [التاريخ] DESC')
+        cursor = STORAGE.list(conn, 'Sulf')
         
         records = []
         for row in cursor.fetchall():
@@ -161,19 +161,13 @@ def create_sulf():
         if not conn:
             return jsonify({'error': 'Database connection failed'}), 500
         
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO Sulf ([الاسم], [المبلغ], [السداد], [التاريخ], [الملاحظات])
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            data.get('الاسم'),
-            data.get('المبلغ', 0),
-            data.get('السداد', 0),
-            data.get('التاريخ'),
-            data.get('الملاحظات')
-        ))
-        
-        conn.commit()
+        STORAGE.insert(conn, 'Sulf', {
+            'الاسم': data.get('الاسم'),
+            'المبلغ': data.get('المبلغ', 0),
+            'السداد': data.get('السداد', 0),
+            'التاريخ': data.get('التاريخ'),
+            'الملاحظات': data.get('الملاحظات')
+        })
         conn.close()
         
         return jsonify({'message': 'Sulf record created'}), 201
@@ -195,8 +189,7 @@ def get_qard():
         if not conn:
             return jsonify({'error': 'Database connection failed'}), 500
         
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM Qard ORDER BY [التاريخ] DESC')
+        cursor = STORAGE.list(conn, 'Qard')
         
         records = []
         for row in cursor.fetchall():
@@ -228,19 +221,13 @@ def create_qard():
         if not conn:
             return jsonify({'error': 'Database connection failed'}), 500
         
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO Qard ([الاسم], [المبلغ], [السداد], [التاريخ], [الملاحظات])
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            data.get('الاسم'),
-            data.get('المبلغ', 0),
-            data.get('السداد', 0),
-            data.get('التاريخ'),
-            data.get('الملاحظات')
-        ))
-        
-        conn.commit()
+        STORAGE.insert(conn, 'Qard', {
+            'الاسم': data.get('الاسم'),
+            'المبلغ': data.get('المبلغ', 0),
+            'السداد': data.get('السداد', 0),
+            'التاريخ': data.get('التاريخ'),
+            'الملاحظات': data.get('الملاحظات')
+        })
         conn.close()
         
         return jsonify({'message': 'Qard record created'}), 201
@@ -263,20 +250,13 @@ def update_sulf(record_id):
         if not conn:
             return jsonify({'error': 'Database connection failed'}), 500
         
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE Sulf SET [الاسم]=?, [المبلغ]=?, [السداد]=?, [التاريخ]=?, [الملاحظات]=?
-            WHERE [ID]=?
-        ''', (
-            data.get('الاسم'),
-            data.get('المبلغ'),
-            data.get('السداد'),
-            data.get('التاريخ'),
-            data.get('الملاحظات'),
-            record_id
-        ))
-        
-        conn.commit()
+        STORAGE.update(conn, 'Sulf', record_id, {
+            'الاسم': data.get('الاسم'),
+            'المبلغ': data.get('المبلغ'),
+            'السداد': data.get('السداد'),
+            'التاريخ': data.get('التاريخ'),
+            'الملاحظات': data.get('الملاحظات')
+        })
         conn.close()
         
         return jsonify({'message': 'Sulf record updated'}), 200
@@ -295,20 +275,13 @@ def update_qard(record_id):
         if not conn:
             return jsonify({'error': 'Database connection failed'}), 500
         
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE Qard SET [الاسم]=?, [المبلغ]=?, [السداد]=?, [التاريخ]=?, [الملاحظات]=?
-            WHERE [ID]=?
-        ''', (
-            data.get('الاسم'),
-            data.get('المبلغ'),
-            data.get('السداد'),
-            data.get('التاريخ'),
-            data.get('الملاحظات'),
-            record_id
-        ))
-        
-        conn.commit()
+        STORAGE.update(conn, 'Qard', record_id, {
+            'الاسم': data.get('الاسم'),
+            'المبلغ': data.get('المبلغ'),
+            'السداد': data.get('السداد'),
+            'التاريخ': data.get('التاريخ'),
+            'الملاحظات': data.get('الملاحظات')
+        })
         conn.close()
         
         return jsonify({'message': 'Qard record updated'}), 200
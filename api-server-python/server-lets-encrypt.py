@@ -5,18 +5,40 @@ SELRS API Server V13 - Correct column names for all tables
 import warnings
 warnings.filterwarnings("ignore")
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-import pyodbc
 import jwt
 import ssl
 import os
 import sys
 import io
 import socket
+import operator
 import logging
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 from functools import wraps
+import db_pool
+import khazina_ledger
+import read_cache
+import pagination
+import streaming
+import etags
+import bulk_write
+import aggregates
+import row_format
+import token_cache
+import change_log
+import replica
+import csv_import
+import xlsx_export
+import write_queue
+import asgi_server
+import metrics
+import query_stats
+import storage
+import search_index
+import compression
+import json_provider
 
 logging.getLogger('werkzeug').setLevel(logging.ERROR)
 
@@ -26,13 +48,21 @@ if sys.platform == 'win32':
 app = Flask(__name__)
 CORS(app)
 
+# Raw UTF-8 instead of \uXXXX for every Arabic character; before METRICS, which times its dumps
+json_provider.init_app(app)
+
+# Registered first so its timer wraps every other hook
+METRICS = metrics.init_app(app)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
 # Configuration
 SECRET_KEY = "selrs2024_secure_and_long_secret_key_for_jwt_compliance_v13"
 ALGORITHM = "HS256"
 CERT_FILE = r"C:\Certbot\live\selrs.cc\fullchain.pem"
 KEY_FILE = r"C:\Certbot\live\selrs.cc\privkey.pem"
 DB_PATH = r"C:\Users\selrs\OneDrive\Documents\SELRS\الخزنه.accdb"
-CONNECTION_STRING = f"Driver={{Microsoft Access Driver (*.mdb, *.accdb)}};DBQ={DB_PATH};"
+# Access through pyodbc, or a SQLite file standing in for it (SQLITE_DB_PATH, e.g. on Linux)
+STORAGE = storage.backend_from_env(DB_PATH)
 
 # Helper Functions
 def get_local_ip():
@@ -47,21 +77,105 @@ def get_local_ip():
 
 READ_ONLY_FIELDS = ['الرصيد', 'المتبقي', 'balance', 'remaining']
 
+# Connections are pooled; conn.close() returns them to the pool
+DB_POOL = db_pool.init_app(app, db_pool.pool_from_env(STORAGE.connect))
+DB_POOL.backend = STORAGE
+DB_POOL.metrics = METRICS
+
+# Per-statement timing; statements over SLOW_QUERY_MS go to slow-queries.log
+QUERY_STATS = query_stats.stats_from_env(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'slow-queries.log'))
+DB_POOL.statements = QUERY_STATS.recorder('access')
+
 def get_db_connection():
     try:
-        conn = pyodbc.connect(CONNECTION_STRING, autocommit=True)
-        return conn
+        return db_pool.checkout(DB_POOL)
     except Exception as e:
         print(f"DB Error: {e}")
         return None
 
+# INSERT/UPDATE/DELETE go through one writer thread with its own connection
+# (from a one-connection pool, so its statements are timed like the rest)
+WRITE_POOL = db_pool.ConnectionPool(STORAGE.connect, size=1)
+WRITE_POOL.backend = STORAGE
+WRITE_POOL.statements = QUERY_STATS.recorder('writer')
+WRITES = write_queue.queue_from_env(WRITE_POOL.acquire)
+WRITES.metrics = METRICS
+
+# Writable columns per sheet: (column, request field, default)
+SHEETS = {
+    'khazina': {
+        'table': '[All]',
+        'required': ['date'],
+        'columns': [('التاريخ', 'date', None), ('الايراد', 'revenue', 0), ('المصروف', 'expense', 0), ('ملاحظات', 'notes', '')],
+    },
+    'sulf': {
+        'table': '[سلف]',
+        'required': ['name', 'date'],
+        'columns': [('الاسم', 'name', None), ('التاريخ', 'date', None), ('المبلغ', 'advance', 0), ('سداد', 'payment', 0), ('ملاحظات', 'notes', '')],
+    },
+    'qard': {
+        'table': '[القرض]',
+        'required': ['name', 'date'],
+        'columns': [('الاسم', 'name', None), ('التاريخ', 'date', None), ('المبلغ', 'advance', 0), ('سداد', 'payment', 0), ('ملاحظات', 'notes', '')],
+    },
+    'bait': {
+        'table': '[البيت]',
+        'required': ['date'],
+        'columns': [('التاريخ', 'date', None), ('الاجمالي', 'advance', 0), ('الرصيد', 'balance', 0), ('معاه', 'with', 0), ('منه', 'payment', 0), ('ملاحظات', 'notes', '')],
+    },
+    'instapay': {
+        'table': '[انستا]',
+        'required': ['date'],
+        'columns': [('التاريخ', 'date', None), ('الاجمالي', 'advance', 0), ('الرصيد', 'balance', 0), ('معاه', 'with', 0), ('منه', 'payment', 0), ('ملاحظات', 'notes', '')],
+    },
+}
+
+# API path segment -> table it reads and writes
+RESOURCE_TABLES = {sheet: spec['table'] for sheet, spec in SHEETS.items()}
+
+def sheet_values(sheet, data):
+    """Request fields -> {column: value} for the sheet's writable columns"""
+    return {column: data.get(field, default) for column, field, default in SHEETS[sheet]['columns']}
+
+def table_for_path(path):
+    parts = path.split('/')
+    if len(parts) > 2 and parts[1] == 'api':
+        return RESOURCE_TABLES.get(parts[2])
+    return None
+
 @app.after_request
 def add_header(response):
+    if response.headers.get('ETag'):
+        # Clients may keep the body but must revalidate it with If-None-Match
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '-1'
     return response
 
+# gzip/brotli for large responses; registered between add_header and etags so it sees the ETag
+COMPRESSION = compression.compressor_from_env()
+if COMPRESSION is not None:
+    compression.init_app(app, COMPRESSION)
+    COMPRESSION.metrics = METRICS
+
+# Claims of tokens that already passed jwt.decode; honours exp and revocations
+TOKEN_CACHE = token_cache.TokenCache(SECRET_KEY, [ALGORITHM], max_size=int(os.getenv('TOKEN_CACHE_SIZE', 1024)))
+
+def request_claims():
+    """Claims of the request's bearer token; None if it is missing, invalid, expired or revoked"""
+    token = request.headers.get('Authorization', '').split(" ")[-1]
+    if not token:
+        return None
+    try:
+        return TOKEN_CACHE.decode(token)
+    except jwt.InvalidTokenError:
+        return None
+
+# Registered after add_header so its after_request hook runs first
+TABLE_VERSIONS = etags.init_app(app, etags.TableVersions(watch_file=STORAGE.path), table_for_path, request_claims)
+
 def format_date(date_obj):
     if date_obj:
         if isinstance(date_obj, str): return date_obj
@@ -71,20 +185,167 @@ def format_date(date_obj):
 
 def format_number(val):
     if val is None: return 0
+    if type(val) is int: return val
     try:
         f_val = float(val)
         return int(f_val) if f_val == int(f_val) else round(f_val, 2)
     except: return val
 
+NUMBER_FIELDS = frozenset(['المبلغ', 'سداد', 'المتبقي', 'الايراد', 'المصروف', 'الرصيد', 'الاجمالي', 'معاه', 'منه', 'amount', 'payment', 'revenue', 'expense'])
+
+def converter_for(key):
+    if 'تاريخ' in key.lower() or key in ('التاريخ', 'date'):
+        return format_date
+    if key in NUMBER_FIELDS:
+        return format_number
+    return None
+
+def row_converter(cursor):
+    """Row -> formatted dict, with the per-column plan compiled once per result set"""
+    return row_format.row_converter(cursor, converter_for)
+
 def dict_from_row(row, cursor):
-    columns = [description[0] for description in cursor.description]
-    record = dict(zip(columns, row))
-    for key in record:
-        if 'تاريخ' in key.lower() or key in ['التاريخ', 'date']:
-            record[key] = format_date(record[key])
-        elif key in ['المبلغ', 'سداد', 'المتبقي', 'الايراد', 'المصروف', 'الرصيد', 'الاجمالي', 'معاه', 'منه', 'amount', 'payment', 'revenue', 'expense']:
-            record[key] = format_number(record[key])
-    return record
+    return row_converter(cursor)(row)
+
+def sheet_list_response(conn, cursor, rows, next_cursor, derived=()):
+    """
+    List response for a sheet, from a page of rows or (rows=None) the whole
+    cursor: one object per row, {columns, rows} with ?format=columns, and
+    streamed with ?stream=1. derived: see row_format.tuple_converter.
+    """
+    convert = row_format.tuple_converter(cursor, converter_for, derived)
+    columns = convert.columns()
+    columnar = row_format.wants_columns(request.args)
+    to_record = convert if columnar else (lambda row: dict(zip(columns, convert(row))))
+    if rows is None:
+        if streaming.wants_stream(request.args):
+            return streaming.json_stream(streaming.fetch_batches(cursor), to_record, app.json.dumps, conn,
+                                         columns=columns if columnar else None)
+        rows = cursor.fetchall()
+    records = [to_record(row) for row in rows]
+    conn.close()
+    if columnar:
+        return jsonify({'success': True, 'columns': columns, 'rows': records, 'next_cursor': next_cursor})
+    return jsonify({'success': True, 'data': records, 'next_cursor': next_cursor})
+
+def load_khazina_ledger():
+    conn = get_read_connection()
+    if not conn:
+        raise RuntimeError('Database connection failed')
+    cursor = conn.backend.list(conn, '[All]', columns=['ID', 'التاريخ', 'الايراد', 'المصروف'], order=None)
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+# Rows written through the API, for /api/sync/changes
+CHANGES = change_log.ChangeLog(max_entries=int(os.getenv('CHANGE_LOG_MAX', 50000)))
+# A delta sync that would re-send more rows than this asks for a reset instead
+SYNC_MAX_ROWS = int(os.getenv('SYNC_MAX_ROWS', 2000))
+
+# Running balance of [All], rebuilt once and updated on every write
+KHAZINA_LEDGER = khazina_ledger.LedgerIndex(load_khazina_ledger)
+
+# Formatted [All] rows per year ('all' = no year filter); balances are filled in per request
+KHAZINA_CACHE = read_cache.PartitionedCache(max_rows=int(os.getenv('KHAZINA_CACHE_MAX_ROWS', 20000)))
+
+# Columns /api/search looks in, per table
+SEARCH_FIELDS = {spec['table']: [column for column, field, _ in spec['columns'] if field in ('name', 'notes')]
+                 for spec in SHEETS.values()}
+SHEET_FOR_TABLE = {table: sheet for sheet, table in RESOURCE_TABLES.items()}
+
+def load_search_rows(table, record_id=None):
+    """(ID, date, name/notes...) of every row of a table, or of one row"""
+    conn = get_read_connection()
+    if not conn:
+        raise RuntimeError('Database connection failed')
+    try:
+        columns = ['ID', 'التاريخ'] + SEARCH_FIELDS[table]
+        if record_id is None:
+            return conn.backend.list(conn, table, columns=columns, order=None).fetchall()
+        cursor = conn.backend.get(conn, table, record_id)
+        names = [column[0] for column in cursor.description]
+        return [tuple(row[names.index(column)] for column in columns) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+# Inverted index over names and notes, updated on every write
+SEARCH = search_index.SearchIndex(SEARCH_FIELDS, load_search_rows)
+
+def invalidate_khazina_cache(*dates):
+    years = set()
+    for value in dates:
+        try:
+            day = khazina_ledger.to_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            KHAZINA_CACHE.clear()
+            return
+        years.add(day.year)
+    KHAZINA_CACHE.invalidate('all', *years)
+
+def khazina_body_error(data):
+    """Why a khazina body can't be indexed (bad date or amount), or None; checked before the write is queued"""
+    errors = bulk_write.validate([dict(data, id=None)], SHEETS['khazina']['required'], SHEETS['khazina']['columns'])
+    return errors[0]['error'] if errors else None
+
+def khazina_affected_from(*dates):
+    """Earliest date a khazina write touched: every row from then on has a new balance"""
+    days = []
+    for value in dates:
+        try:
+            day = khazina_ledger.to_date(value)
+        except ValueError:
+            return date.min
+        if day is not None:
+            days.append(day)
+    return min(days, default=None)
+
+def replica_changed(table, record_id, deleted):
+    """A full re-sync found a row that was edited directly in Access"""
+    SEARCH.refresh(table, record_id, deleted)
+    if table == '[All]':
+        KHAZINA_LEDGER.invalidate()
+    # The row's old date is unknown, so any khazina balance may have moved
+    CHANGES.record(table, record_id, deleted, affects_from=date.min if table == '[All]' else None)
+    TABLE_VERSIONS.bump(table)
+    if table == '[All]':
+        KHAZINA_CACHE.clear()
+
+# SQLite copy of the five sheets; GET endpoints read it once it has been filled
+REPLICA = replica.replica_from_env(RESOURCE_TABLES.values(), DB_POOL.acquire, on_change=replica_changed,
+                                   default_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'selrs-replica.db'))
+if REPLICA is not None:
+    REPLICA.pool.metrics = METRICS
+    REPLICA.pool.statements = QUERY_STATS.recorder('replica')
+    REPLICA.start()
+
+def get_read_connection():
+    """Replica connection for GET endpoints, or Access while the replica is not ready"""
+    if REPLICA is not None and REPLICA.ready:
+        try:
+            return db_pool.checkout(REPLICA.pool)
+        except Exception as e:
+            print(f"Replica Error: {e}")
+    return get_db_connection()
+
+def record_change(table, record_id, deleted=False, affects_from=None):
+    """
+    Copy a row written through the API into the replica and the search
+    index, then log it. Logged last so a concurrent delta sync never reads
+    the replica before the row is there; khazina callers update the ledger
+    before and clear KHAZINA_CACHE after this.
+    """
+    if REPLICA is not None:
+        try:
+            REPLICA.refresh(table, record_id, deleted)
+        except Exception as e:
+            print(f"Replica Error: {e}")
+    try:
+        SEARCH.refresh(table, record_id, deleted)
+    except Exception as e:
+        print(f"Search Index Error: {e}")
+    CHANGES.record(table, record_id, deleted, affects_from)
 
 def token_required(f):
     @wraps(f)
@@ -92,7 +353,7 @@ def token_required(f):
         token = request.headers.get('Authorization', '').split(" ")[-1]
         if not token: return jsonify({'message': 'Token missing'}), 401
         try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            data = TOKEN_CACHE.decode(token)
             return f(data['user'], *args, **kwargs)
         except: return jsonify({'message': 'Invalid token'}), 401
     return decorated
@@ -116,6 +377,13 @@ def login():
         return jsonify({'token': token, 'user': username}), 200
     return jsonify({'message': 'Credentials required'}), 400
 
+@app.route('/api/logout', methods=['POST'])
+@app.route('/api/auth/logout', methods=['POST'])
+@token_required
+def logout(user):
+    TOKEN_CACHE.revoke(request.headers.get('Authorization', '').split(" ")[-1])
+    return jsonify({'success': True})
+
 # --- KHAZINA ---
 @app.route('/api/khazina', methods=['GET'])
 @token_required
@@ -123,37 +391,97 @@ def get_khazina(current_user):
     """Get all Khazina records"""
     try:
         year = request.args.get('year')
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        if year and not year.isdigit():
+            return jsonify({'success': False, 'error': 'Invalid year'}), 400
+        partition = int(year) if year else 'all'
+        page = pagination.page_args(request.args)
+        columnar = row_format.wants_columns(request.args)
+        stream = streaming.wants_stream(request.args) and not page and not columnar
+        next_cursor = None
+        
+        def with_balance(row):
+            record = dict(row)
+            balance = KHAZINA_LEDGER.balance_of(record['ID'])
+            if balance is not None:
+                record['الرصيد'] = format_number(balance)
+            return record
         
-        if year:
-            query = f"SELECT * FROM [All] WHERE YEAR([التاريخ]) = {year} ORDER BY [التاريخ] DESC"
+        start, end = aggregates.year_bounds(year) if year else (None, None)
+        if page:
+            conn = get_read_connection()
+            cursor, page_rows, next_cursor = pagination.fetch_page(conn, '[All]', *page, start=start, end=end)
+            convert = row_converter(cursor)
+            rows = [convert(row) for row in page_rows]
+            conn.close()
         else:
-            query = "SELECT * FROM [All] ORDER BY [التاريخ] DESC"
+            rows = KHAZINA_CACHE.get(partition)
+            if stream and rows is not None:
+                return streaming.json_stream(streaming.batched(rows), with_balance, app.json.dumps)
         
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        records = [dict_from_row(row, cursor) for row in rows]
+        if rows is None:
+            generation = KHAZINA_CACHE.generation(partition)
+            conn = get_read_connection()
+            cursor = conn.backend.list(conn, '[All]', start=start, end=end)
+            convert = row_converter(cursor)
+            if stream:
+                return streaming.json_stream(streaming.fetch_batches(cursor),
+                                             lambda row: with_balance(convert(row)),
+                                             app.json.dumps, conn)
+            rows = [convert(row) for row in cursor.fetchall()]
+            
+            conn.close()
+            KHAZINA_CACHE.put(partition, rows, generation)
         
-        conn.close()
+        if columnar:
+            columns, values = khazina_columns(rows)
+            return jsonify({
+                'success': True,
+                'columns': columns,
+                'rows': values,
+                'count': len(values),
+                'next_cursor': next_cursor
+            }), 200
+        
+        records = [with_balance(row) for row in rows]
         
         return jsonify({
             'success': True,
             'data': records,
-            'count': len(records)
+            'count': len(records),
+            'next_cursor': next_cursor
         }), 200
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def khazina_columns(rows):
+    """Formatted [All] rows (cached or fresh) -> (columns, value lists) with the running balance"""
+    if not rows:
+        return [], []
+    names = list(rows[0])
+    pick = operator.itemgetter(*names)
+    has_balance = 'الرصيد' in names
+    columns = names if has_balance else names + ['الرصيد']
+    balance_at, id_at = columns.index('الرصيد'), columns.index('ID')
+    values = []
+    for row in rows:
+        row_values = list(pick(row))
+        if not has_balance:
+            row_values.append(None)
+        balance = KHAZINA_LEDGER.balance_of(row_values[id_at])
+        if balance is not None:
+            row_values[balance_at] = format_number(balance)
+        values.append(row_values)
+    return columns, values
+
 @app.route('/api/khazina/<int:record_id>', methods=['GET'])
 @token_required
 def get_khazina_by_id(current_user, record_id):
     """Get single Khazina record"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(f"SELECT * FROM [All] WHERE ID = {record_id}")
+        conn = get_read_connection()
+        cursor = conn.backend.get(conn, '[All]', record_id)
         row = cursor.fetchone()
         
         conn.close()
@@ -162,10 +490,56 @@ def get_khazina_by_id(current_user, record_id):
             return jsonify({'success': False, 'error': 'Record not found'}), 404
         
         record = dict_from_row(row, cursor)
+        balance = KHAZINA_LEDGER.balance_of(record_id)
+        if balance is not None:
+            record['الرصيد'] = format_number(balance)
         return jsonify({'success': True, 'data': record}), 200
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/khazina/balance', methods=['GET'])
+@token_required
+def get_khazina_balance(user):
+    """Balance as of ?date= (default today) and net movement for ?from=&to="""
+    try:
+        as_of = request.args.get('date') or date.today()
+        result = {'success': True, 'balance': format_number(KHAZINA_LEDGER.balance_as_of(as_of))}
+        start, end = request.args.get('from'), request.args.get('to')
+        if start or end:
+            if not (start and end):
+                return jsonify({'success': False, 'error': 'Both from and to are required'}), 400
+            result['net'] = format_number(KHAZINA_LEDGER.net_between(start, end))
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/khazina/summary', methods=['GET'])
+@token_required
+def get_khazina_summary(user):
+    """Revenue/expense/net totals per ?group=year|month|day within ?from=&to="""
+    try:
+        group = request.args.get('group', 'month')
+        conn = get_read_connection()
+        if not conn:
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+        try:
+            series = aggregates.khazina_summary(conn, group, request.args.get('from'), request.args.get('to'))
+        finally:
+            conn.close()
+        totals = {
+            'revenue': round(sum(p['revenue'] for p in series), 2),
+            'expense': round(sum(p['expense'] for p in series), 2),
+            'count': sum(p['count'] for p in series),
+        }
+        totals['net'] = round(totals['revenue'] - totals['expense'], 2)
+        return jsonify({'success': True, 'group': group, 'data': series, 'totals': totals})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/khazina', methods=['POST'])
 @token_required
 def create_khazina(user):
@@ -173,16 +547,15 @@ def create_khazina(user):
         data = request.get_json()
         if not data.get('date'):
             return jsonify({'success': False, 'error': 'Missing required field: date'}), 400
+        error = khazina_body_error(data)
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO [All] ([التاريخ], [الايراد], [المصروف], [ملاحظات]) VALUES (?, ?, ?, ?)",
-                       (data.get('date'), data.get('revenue', 0), data.get('expense', 0), data.get('notes', '')))
-        conn.commit()
-        conn.close()
-        return jsonify({'success': True}), 201
+        record_id = WRITES.insert('[All]', sheet_values('khazina', data))
+        KHAZINA_LEDGER.upsert(record_id, data.get('date'), data.get('revenue', 0), data.get('expense', 0))
+        record_change('[All]', record_id, affects_from=khazina_affected_from(data.get('date')))
+        invalidate_khazina_cache(data.get('date'))
+        return jsonify({'success': True, 'id': record_id}), 201
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -193,15 +566,16 @@ def update_khazina(user, id):
         data = request.get_json()
         if not data.get('date'):
             return jsonify({'success': False, 'error': 'Missing required field: date'}), 400
+        error = khazina_body_error(data)
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        cursor = conn.cursor()
-        cursor.execute("UPDATE [All] SET [التاريخ]=?, [الايراد]=?, [المصروف]=?, [ملاحظات]=? WHERE ID=?",
-                       (data.get('date'), data.get('revenue', 0), data.get('expense', 0), data.get('notes', ''), id))
-        conn.commit()
-        conn.close()
+        old_date = KHAZINA_LEDGER.date_of(id)
+        if not WRITES.update('[All]', id, sheet_values('khazina', data)):
+            return jsonify({'success': False, 'error': 'Record not found'}), 404
+        KHAZINA_LEDGER.upsert(id, data.get('date'), data.get('revenue', 0), data.get('expense', 0))
+        record_change('[All]', id, affects_from=khazina_affected_from(old_date, data.get('date')))
+        invalidate_khazina_cache(old_date, data.get('date'))
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -211,21 +585,40 @@ def update_khazina(user, id):
 @token_required
 def get_sulf(user):
     try:
-        conn = get_db_connection()
+        conn = get_read_connection()
         if not conn:
             return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM [سلف] ORDER BY [التاريخ] DESC")
-        records = []
-        for row in cursor.fetchall():
-            record = dict_from_row(row, cursor)
-            sulf_amount = record.get('المبلغ', 0) if record.get('المبلغ') else 0
-            payment = record.get('سداد', 0) if record.get('سداد') else 0
-            record['الاجمالي'] = sulf_amount
-            record['المتبقي'] = sulf_amount - payment
-            records.append(record)
-        conn.close()
-        return jsonify({'success': True, 'data': records})
+        page = pagination.page_args(request.args)
+        if page:
+            cursor, rows, next_cursor = pagination.fetch_page(conn, '[سلف]', *page)
+        else:
+            cursor, rows, next_cursor = conn.backend.list(conn, '[سلف]'), None, None
+        return sheet_list_response(conn, cursor, rows, next_cursor, [
+            ('الاجمالي', lambda get: get('المبلغ') or 0),
+            ('المتبقي', lambda get: (get('المبلغ') or 0) - (get('سداد') or 0)),
+        ])
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/sulf/by-person', methods=['GET'])
+@app.route('/api/qard/by-person', methods=['GET'])
+@token_required
+def get_balances_by_person(user):
+    """Outstanding amount per person; ?sort=name|outstanding|last&top=N"""
+    try:
+        conn = get_read_connection()
+        if not conn:
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+        try:
+            people = aggregates.person_balances(conn, table_for_path(request.path), format_date,
+                                                request.args.get('sort', 'name'), request.args.get('top'))
+        finally:
+            conn.close()
+        return jsonify({'success': True, 'data': people, 'count': len(people)})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -237,15 +630,9 @@ def create_sulf(user):
         if not data.get('name') or not data.get('date'):
             return jsonify({'success': False, 'error': 'Missing required fields: name, date'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO [سلف] ([الاسم], [التاريخ], [المبلغ], [سداد], [ملاحظات]) VALUES (?, ?, ?, ?, ?)",
-                       (data.get('name'), data.get('date'), data.get('advance', 0), data.get('payment', 0), data.get('notes', '')))
-        conn.commit()
-        conn.close()
-        return jsonify({'success': True}), 201
+        record_id = WRITES.insert('[سلف]', sheet_values('sulf', data))
+        record_change('[سلف]', record_id)
+        return jsonify({'success': True, 'id': record_id}), 201
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -257,14 +644,9 @@ def update_sulf(user, id):
         if not data.get('name') or not data.get('date'):
             return jsonify({'success': False, 'error': 'Missing required fields: name, date'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        cursor = conn.cursor()
-        cursor.execute("UPDATE [سلف] SET [الاسم]=?, [التاريخ]=?, [المبلغ]=?, [سداد]=?, [ملاحظات]=? WHERE ID=?",
-                       (data.get('name'), data.get('date'), data.get('advance', 0), data.get('payment', 0), data.get('notes', ''), id))
-        conn.commit()
-        conn.close()
+        if not WRITES.update('[سلف]', id, sheet_values('sulf', data)):
+            return jsonify({'success': False, 'error': 'Record not found'}), 404
+        record_change('[سلف]', id)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -274,21 +656,20 @@ def update_sulf(user, id):
 @token_required
 def get_qard(user):
     try:
-        conn = get_db_connection()
+        conn = get_read_connection()
         if not conn:
             return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM [القرض] ORDER BY [التاريخ] DESC")
-        records = []
-        for row in cursor.fetchall():
-            record = dict_from_row(row, cursor)
-            qard_amount = record.get('المبلغ', 0) if record.get('المبلغ') else 0
-            payment = record.get('سداد', 0) if record.get('سداد') else 0
-            record['الاجمالي'] = qard_amount
-            record['المتبقي'] = qard_amount - payment
-            records.append(record)
-        conn.close()
-        return jsonify({'success': True, 'data': records})
+        page = pagination.page_args(request.args)
+        if page:
+            cursor, rows, next_cursor = pagination.fetch_page(conn, '[القرض]', *page)
+        else:
+            cursor, rows, next_cursor = conn.backend.list(conn, '[القرض]'), None, None
+        return sheet_list_response(conn, cursor, rows, next_cursor, [
+            ('الاجمالي', lambda get: get('المبلغ') or 0),
+            ('المتبقي', lambda get: (get('المبلغ') or 0) - (get('سداد') or 0)),
+        ])
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -300,15 +681,9 @@ def create_qard(user):
         if not data.get('name') or not data.get('date'):
             return jsonify({'success': False, 'error': 'Missing required fields: name, date'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO [القرض] ([الاسم], [التاريخ], [المبلغ], [سداد], [ملاحظات]) VALUES (?, ?, ?, ?, ?)",
-                       (data.get('name'), data.get('date'), data.get('advance', 0), data.get('payment', 0), data.get('notes', '')))
-        conn.commit()
-        conn.close()
-        return jsonify({'success': True}), 201
+        record_id = WRITES.insert('[القرض]', sheet_values('qard', data))
+        record_change('[القرض]', record_id)
+        return jsonify({'success': True, 'id': record_id}), 201
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -320,14 +695,9 @@ def update_qard(user, id):
         if not data.get('name') or not data.get('date'):
             return jsonify({'success': False, 'error': 'Missing required fields: name, date'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        cursor = conn.cursor()
-        cursor.execute("UPDATE [القرض] SET [الاسم]=?, [التاريخ]=?, [المبلغ]=?, [سداد]=?, [ملاحظات]=? WHERE ID=?",
-                       (data.get('name'), data.get('date'), data.get('advance', 0), data.get('payment', 0), data.get('notes', ''), id))
-        conn.commit()
-        conn.close()
+        if not WRITES.update('[القرض]', id, sheet_values('qard', data)):
+            return jsonify({'success': False, 'error': 'Record not found'}), 404
+        record_change('[القرض]', id)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -337,17 +707,17 @@ def update_qard(user, id):
 @token_required
 def get_bait(user):
     try:
-        conn = get_db_connection()
+        conn = get_read_connection()
         if not conn:
             return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM [البيت] ORDER BY [التاريخ] DESC")
-        records = []
-        for row in cursor.fetchall():
-            record = dict_from_row(row, cursor)
-            records.append(record)
-        conn.close()
-        return jsonify({'success': True, 'data': records})
+        page = pagination.page_args(request.args)
+        if page:
+            cursor, rows, next_cursor = pagination.fetch_page(conn, '[البيت]', *page)
+        else:
+            cursor, rows, next_cursor = conn.backend.list(conn, '[البيت]'), None, None
+        return sheet_list_response(conn, cursor, rows, next_cursor)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -359,15 +729,9 @@ def create_bait(user):
         if not data.get('date'):
             return jsonify({'success': False, 'error': 'Missing required field: date'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO [البيت] ([التاريخ], [الاجمالي], [الرصيد], [معاه], [منه], [ملاحظات]) VALUES (?, ?, ?, ?, ?, ?)",
-                       (data.get('date'), data.get('advance', 0), data.get('balance', 0), data.get('with', 0), data.get('payment', 0), data.get('notes', '')))
-        conn.commit()
-        conn.close()
-        return jsonify({'success': True}), 201
+        record_id = WRITES.insert('[البيت]', sheet_values('bait', data))
+        record_change('[البيت]', record_id)
+        return jsonify({'success': True, 'id': record_id}), 201
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -379,14 +743,9 @@ def update_bait(user, id):
         if not data.get('date'):
             return jsonify({'success': False, 'error': 'Missing required field: date'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        cursor = conn.cursor()
-        cursor.execute("UPDATE [البيت] SET [التاريخ]=?, [الاجمالي]=?, [الرصيد]=?, [معاه]=?, [منه]=?, [ملاحظات]=? WHERE ID=?",
-                       (data.get('date'), data.get('advance', 0), data.get('balance', 0), data.get('with', 0), data.get('payment', 0), data.get('notes', ''), id))
-        conn.commit()
-        conn.close()
+        if not WRITES.update('[البيت]', id, sheet_values('bait', data)):
+            return jsonify({'success': False, 'error': 'Record not found'}), 404
+        record_change('[البيت]', id)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -396,17 +755,17 @@ def update_bait(user, id):
 @token_required
 def get_instapay(user):
     try:
-        conn = get_db_connection()
+        conn = get_read_connection()
         if not conn:
             return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM [انستا] ORDER BY [التاريخ] DESC")
-        records = []
-        for row in cursor.fetchall():
-            record = dict_from_row(row, cursor)
-            records.append(record)
-        conn.close()
-        return jsonify({'success': True, 'data': records})
+        page = pagination.page_args(request.args)
+        if page:
+            cursor, rows, next_cursor = pagination.fetch_page(conn, '[انستا]', *page)
+        else:
+            cursor, rows, next_cursor = conn.backend.list(conn, '[انستا]'), None, None
+        return sheet_list_response(conn, cursor, rows, next_cursor)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -418,15 +777,9 @@ def create_instapay(user):
         if not data.get('date'):
             return jsonify({'success': False, 'error': 'Missing required field: date'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO [انستا] ([التاريخ], [الاجمالي], [الرصيد], [معاه], [منه], [ملاحظات]) VALUES (?, ?, ?, ?, ?, ?)",
-                       (data.get('date'), data.get('advance', 0), data.get('balance', 0), data.get('with', 0), data.get('payment', 0), data.get('notes', '')))
-        conn.commit()
-        conn.close()
-        return jsonify({'success': True}), 201
+        record_id = WRITES.insert('[انستا]', sheet_values('instapay', data))
+        record_change('[انستا]', record_id)
+        return jsonify({'success': True, 'id': record_id}), 201
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -438,15 +791,232 @@ def update_instapay(user, id):
         if not data.get('date'):
             return jsonify({'success': False, 'error': 'Missing required field: date'}), 400
         
-        conn = get_db_connection()
+        if not WRITES.update('[انستا]', id, sheet_values('instapay', data)):
+            return jsonify({'success': False, 'error': 'Record not found'}), 404
+        record_change('[انستا]', id)
+        return jsonify({'success': True})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# --- SEARCH ---
+@app.route('/api/search', methods=['GET'])
+@token_required
+def search_records(user):
+    """Rows whose name or notes contain every word of ?q=, best first; ?sheet=&from=&to=&limit=&offset="""
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'success': False, 'error': 'q is required'}), 400
+        sheets = [s for s in request.args.get('sheet', '').split(',') if s] or list(SHEETS)
+        unknown = [s for s in sheets if s not in SHEETS]
+        if unknown:
+            return jsonify({'success': False, 'error': f"Unknown sheet: {', '.join(unknown)}"}), 400
+        limit = request.args.get('limit', str(pagination.DEFAULT_LIMIT))
+        offset = request.args.get('offset', '0')
+        if not limit.isdigit() or int(limit) < 1 or not offset.isdigit():
+            raise ValueError('limit must be a positive integer and offset a non-negative integer')
+        limit, offset = min(int(limit), pagination.MAX_LIMIT), int(offset)
+        
+        total, hits = SEARCH.search(query, [SHEETS[s]['table'] for s in sheets],
+                                    khazina_ledger.to_date(request.args.get('from')),
+                                    khazina_ledger.to_date(request.args.get('to')), limit, offset)
+        records = []
+        for table, record_id, day, texts, score in hits:
+            record = {'sheet': SHEET_FOR_TABLE[table], 'ID': record_id, 'التاريخ': format_date(day)}
+            record.update(zip(SEARCH_FIELDS[table], texts))
+            record['score'] = round(score, 3)
+            records.append(record)
+        next_offset = offset + len(hits) if offset + len(hits) < total else None
+        return jsonify({'success': True, 'data': records, 'total': total, 'next_offset': next_offset})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# --- BULK ---
+@app.route('/api/<sheet>/bulk', methods=['POST'])
+@token_required
+def bulk_write_records(user, sheet):
+    """Insert (no id) or update (with id) many records in one transaction"""
+    try:
+        spec = SHEETS.get(sheet)
+        if not spec:
+            return jsonify({'success': False, 'error': 'Unknown sheet'}), 404
+        data = request.get_json()
+        records = data.get('records') if isinstance(data, dict) else data
+        if not isinstance(records, list) or not records:
+            return jsonify({'success': False, 'error': 'Expected a non-empty array of records'}), 400
+        if len(records) > bulk_write.MAX_ROWS:
+            return jsonify({'success': False, 'error': f'At most {bulk_write.MAX_ROWS} records per request'}), 400
+        
+        errors = bulk_write.validate(records, spec['required'], spec['columns'])
+        if errors:
+            return jsonify({'success': False, 'errors': errors}), 400
+        
+        old_dates = [KHAZINA_LEDGER.date_of(r['id']) for r in records if r.get('id') is not None] if sheet == 'khazina' else []
+        results = WRITES.run(lambda conn: bulk_write.write(conn, spec['table'], spec['columns'], records), batch=False)
+        if sheet == 'khazina':
+            for result, record in zip(results, records):
+                KHAZINA_LEDGER.upsert(result['id'], record.get('date'), record.get('revenue', 0), record.get('expense', 0))
+        affects_from = khazina_affected_from(*old_dates, *[r.get('date') for r in records]) if sheet == 'khazina' else None
+        for result in results:
+            record_change(spec['table'], result['id'], affects_from=affects_from)
+        if sheet == 'khazina':
+            invalidate_khazina_cache(*old_dates, *[r.get('date') for r in records])
+        return jsonify({'success': True, 'results': results, 'count': len(results)}), 201
+    except bulk_write.RecordErrors as e:
+        return jsonify({'success': False, 'errors': e.errors}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# --- EXCEL EXPORT ---
+@app.route('/api/<sheet>/export.xlsx', methods=['GET'])
+@token_required
+def export_xlsx(user, sheet):
+    """The sheet as an .xlsx file in date order, optionally limited to ?from=&to="""
+    try:
+        spec = SHEETS.get(sheet)
+        if not spec:
+            return jsonify({'success': False, 'error': 'Unknown sheet'}), 404
+        start, end = request.args.get('from'), request.args.get('to')
+        lower, upper = aggregates.date_bounds(start, end)
+        conn = get_read_connection()
         if not conn:
             return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        cursor = conn.cursor()
-        cursor.execute("UPDATE [انستا] SET [التاريخ]=?, [الاجمالي]=?, [الرصيد]=?, [معاه]=?, [منه]=?, [ملاحظات]=? WHERE ID=?",
-                       (data.get('date'), data.get('advance', 0), data.get('balance', 0), data.get('with', 0), data.get('payment', 0), data.get('notes', ''), id))
-        conn.commit()
-        conn.close()
-        return jsonify({'success': True})
+        try:
+            cursor = conn.backend.list(conn, spec['table'], start=lower, end=upper, order='asc')
+            headers = [column[0] for column in cursor.description]
+            rows = (row for batch in streaming.fetch_batches(cursor) for row in batch)
+            if sheet == 'khazina' and 'الرصيد' in headers:
+                # Same running balance the app shows
+                balance_at, id_at = headers.index('الرصيد'), headers.index('ID')
+                rows = (row[:balance_at] + (KHAZINA_LEDGER.balance_of(row[id_at]),) + row[balance_at + 1:]
+                        for row in (tuple(r) for r in rows))
+            path = xlsx_export.write_workbook(sheet, headers, rows, number_columns=NUMBER_FIELDS)
+        finally:
+            conn.close()
+        # From the parsed dates: to_date only reads the first 19 characters, so the raw value may carry more
+        filename = '_'.join([sheet] + [khazina_ledger.to_date(v).isoformat() for v in (start, end) if v]) + '.xlsx'
+        return xlsx_export.xlsx_response(path, filename)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# --- CSV IMPORT ---
+def import_sheet_csv(sheet, stream):
+    """Stream one CSV export into a sheet; returns the import report"""
+    spec = SHEETS[sheet]
+    
+    def on_insert(results, records):
+        if sheet == 'khazina':
+            for result, record in zip(results, records):
+                KHAZINA_LEDGER.upsert(result['id'], record.get('date'), record.get('revenue', 0), record.get('expense', 0))
+        if REPLICA is not None:
+            # Reads go to Access until the re-sync picks up the new rows
+            REPLICA.invalidate()
+        for result, record in zip(results, records):
+            CHANGES.record(spec['table'], result['id'],
+                           affects_from=khazina_affected_from(record.get('date')) if sheet == 'khazina' else None)
+    
+    def run_import(conn):
+        return csv_import.import_csv(conn, spec['table'], spec['columns'], stream, required=spec['required'], on_insert=on_insert)
+    
+    try:
+        # Holds the writer for the whole file; other writes queue behind it
+        report = WRITES.submit(run_import, batch=False).result()
+    finally:
+        if sheet == 'khazina':
+            KHAZINA_CACHE.clear()
+        if REPLICA is not None:
+            REPLICA.invalidate()
+        SEARCH.invalidate(spec['table'])
+    report['sheet'] = sheet
+    return report
+
+@app.route('/api/<sheet>/import', methods=['POST'])
+@token_required
+def import_csv(user, sheet):
+    """CSV upload (multipart 'file' or raw text/csv body); existing rows are skipped"""
+    try:
+        if sheet not in SHEETS:
+            return jsonify({'success': False, 'error': 'Unknown sheet'}), 404
+        upload = request.files.get('file')
+        stream = io.TextIOWrapper(upload.stream if upload else request.stream, encoding='utf-8-sig', newline='')
+        report = import_sheet_csv(sheet, stream)
+        return jsonify({'success': True, **report})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def run_import_command(args):
+    """python <server>.py --import <sheet> <file.csv> [...]"""
+    if len(args) < 2 or args[0] not in SHEETS:
+        print(f"Usage: --import <{'|'.join(SHEETS)}> <file.csv> [...]", flush=True)
+        return 2
+    for path in args[1:]:
+        if not os.path.isfile(path):
+            print(f"❌ File not found: {path}", flush=True)
+            return 1
+        with open(path, encoding='utf-8-sig', newline='') as stream:
+            report = import_sheet_csv(args[0], stream)
+        print(f"{path}: {report['inserted']} inserted, {report['skipped_duplicates']} duplicates, "
+              f"{report['skipped_invalid']} invalid, {report['rows_per_second']} rows/s", flush=True)
+        for error in report['errors']:
+            print(f"  line {error['line']}: {error['error']}", flush=True)
+    return 0
+
+# --- DELTA SYNC ---
+@app.route('/api/sync/changes', methods=['GET'])
+@token_required
+def sync_changes(user):
+    """Rows upserted and IDs deleted since ?since=<token>; reset=true means reload everything.
+    A backdated khazina write moves the running balance of every later row: those rows come
+    back as {ID: balance} under 'balances' instead of in full."""
+    try:
+        token, changed, affected = CHANGES.changes_since(request.args.get('since'))
+        if changed is None:
+            return jsonify({'success': True, 'reset': True, 'token': token, 'changes': {}})
+        
+        conn = None
+        changes = {}
+        for sheet, table in RESOURCE_TABLES.items():
+            rows = changed.get(table)
+            if not rows:
+                continue
+            upserted_ids = [record_id for record_id, deleted in rows.items() if not deleted]
+            records = []
+            if upserted_ids and conn is None:
+                conn = get_read_connection()
+                if not conn:
+                    return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+            for start in range(0, len(upserted_ids), 100):
+                cursor = conn.backend.get_many(conn, table, upserted_ids[start:start + 100])
+                convert = row_converter(cursor)
+                records.extend(convert(row) for row in cursor.fetchall())
+            found = {record['ID'] for record in records}
+            changes[sheet] = {
+                'upserted': records,
+                # Rows that vanished since they were written count as deleted
+                'deleted': [record_id for record_id, deleted in rows.items() if deleted or record_id not in found],
+            }
+        if conn is not None:
+            conn.close()
+        
+        if 'khazina' in changes:
+            for record in changes['khazina']['upserted']:
+                balance = KHAZINA_LEDGER.balance_of(record['ID'])
+                if balance is not None:
+                    record['الرصيد'] = format_number(balance)
+            if '[All]' in affected:
+                # Rows dated on or after a backdated write only need their new running balance
+                balances = KHAZINA_LEDGER.balances_from(affected['[All]'])
+                if len(balances) > SYNC_MAX_ROWS:
+                    return jsonify({'success': True, 'reset': True, 'token': token, 'changes': {}})
+                sent = {record['ID'] for record in changes['khazina']['upserted']}
+                changes['khazina']['balances'] = {
+                    record_id: format_number(balance) for record_id, balance in balances.items() if record_id not in sent
+                }
+        return jsonify({'success': True, 'reset': False, 'token': token, 'changes': changes})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -470,17 +1040,55 @@ def delete_record(user, id):
         elif "instapay" in request.path:
             table = "[انستا]"
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        cursor = conn.cursor()
-        cursor.execute(f"DELETE FROM {table} WHERE ID=?", (id,))
-        conn.commit()
-        conn.close()
+        old_date = KHAZINA_LEDGER.date_of(id) if table == "[All]" else None
+        WRITES.delete(table, id)
+        if table == "[All]":
+            KHAZINA_LEDGER.remove(id)
+        record_change(table, id, deleted=True, affects_from=khazina_affected_from(old_date))
+        if table == "[All]":
+            invalidate_khazina_cache(old_date)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# --- METRICS ---
+METRICS.collect('pool', DB_POOL.stats, DB_POOL.COUNTERS)
+METRICS.collect('writer', WRITES.stats, WRITES.COUNTERS)
+METRICS.collect('khazina_cache', KHAZINA_CACHE.stats, KHAZINA_CACHE.COUNTERS)
+METRICS.collect('auth_cache', TOKEN_CACHE.stats, TOKEN_CACHE.COUNTERS)
+METRICS.collect('change_log', CHANGES.stats)
+METRICS.collect('queries', QUERY_STATS.stats)
+METRICS.collect('search', SEARCH.stats)
+if COMPRESSION is not None:
+    METRICS.collect('compression', COMPRESSION.stats, COMPRESSION.COUNTERS)
+if REPLICA is not None:
+    METRICS.collect('replica', REPLICA.stats, REPLICA.COUNTERS)
+    METRICS.collect('replica_pool', REPLICA.pool.stats, REPLICA.pool.COUNTERS)
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text format; set METRICS_TOKEN to require 'Authorization: Bearer <token>'"""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+# --- ADMIN ---
+@app.route('/api/admin/queries', methods=['GET', 'DELETE'])
+@token_required
+def query_timings(user):
+    """Top statements by total time: ?top=20&sort=total|mean|max|calls; DELETE clears the counters"""
+    try:
+        if request.method == 'DELETE':
+            QUERY_STATS.reset()
+            return jsonify({'success': True})
+        top = max(1, min(int(request.args.get('top', 20)), 500))
+        statements = QUERY_STATS.top(top, request.args.get('sort', 'total'))
+        return jsonify({'success': True, 'data': statements, 'summary': QUERY_STATS.stats()})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # --- HEALTH CHECK ---
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -488,10 +1096,21 @@ def health_check():
     return jsonify({
         'status': 'ok',
         'message': 'SELRS API Server V13 is running',
-        'timestamp': datetime.utcnow().isoformat()
+        'timestamp': datetime.utcnow().isoformat(),
+        'pool': DB_POOL.stats(),
+        'khazina_cache': KHAZINA_CACHE.stats(),
+        'auth_cache': TOKEN_CACHE.stats(),
+        'change_log': CHANGES.stats(),
+        'search': SEARCH.stats(),
+        'compression': COMPRESSION.stats() if COMPRESSION is not None else None,
+        'replica': REPLICA.stats() if REPLICA is not None else None,
+        'writer': WRITES.stats()
     }), 200
 
 if __name__ == '__main__':
+    if sys.argv[1:2] == ['--import']:
+        sys.exit(run_import_command(sys.argv[2:]))
+    
     local_ip = get_local_ip()
     
     print("\n" + "="*60, flush=True)
@@ -515,10 +1134,21 @@ if __name__ == '__main__':
     # Check DB
     conn = get_db_connection()
     if conn:
-        print(f"✅ Database connection successful: {DB_PATH}", flush=True)
+        print(f"✅ Database connection successful: {STORAGE.path}", flush=True)
         conn.close()
+        try:
+            KHAZINA_LEDGER.reload()
+            print(f"✅ Khazina ledger indexed: {len(KHAZINA_LEDGER)} rows", flush=True)
+        except Exception as e:
+            print(f"⚠️  Khazina ledger not indexed: {e}", flush=True)
+        try:
+            for table in SEARCH_FIELDS:
+                SEARCH.reload(table)
+            print(f"✅ Search index built: {len(SEARCH)} rows", flush=True)
+        except Exception as e:
+            print(f"⚠️  Search index not built: {e}", flush=True)
     else:
-        print(f"⚠️  Database connection failed: {DB_PATH}", flush=True)
+        print(f"⚠️  Database connection failed: {STORAGE.path}", flush=True)
 
     print("\n" + "="*60, flush=True)
     print("🔒 Starting HTTPS server...", flush=True)
@@ -531,6 +1161,9 @@ if __name__ == '__main__':
     print("="*60 + "\n", flush=True)
     print("⚠️  Press Ctrl+C to stop the server\n", flush=True)
     
-    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-    ssl_context.load_cert_chain(CERT_FILE, KEY_FILE)
-    app.run(host='0.0.0.0', port=3000, ssl_context=ssl_context, threaded=True)
+    if asgi_server.enabled():
+        asgi_server.serve(app, '0.0.0.0', 3000, CERT_FILE, KEY_FILE)
+    else:
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(CERT_FILE, KEY_FILE)
+        app.run(host='0.0.0.0', port=3000, ssl_context=ssl_context, threaded=True)
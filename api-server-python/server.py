@@ -5,12 +5,16 @@ Connects to MS Access database without OLEDB provider issues
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from datetime import datetime, timedelta
+from datetime import date as date_type, datetime, timedelta
 import jwt
-import pyodbc
 import os
 from dotenv import load_dotenv
 import logging
+import aggregates
+import db_pool
+import khazina_ledger
+import storage
+import token_cache
 
 # Load environment variables
 load_dotenv()
@@ -30,18 +34,17 @@ ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'selrs2024')
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Database connection string for MS Access
-DRIVER = '{Microsoft Access Driver (*.mdb, *.accdb)}'
-CONNECTION_STRING = f'Driver={DRIVER};DBQ={DB_PATH};'
+# Access through pyodbc, or a SQLite file standing in for it (SQLITE_DB_PATH, e.g. on Linux)
+STORAGE = storage.backend_from_env(DB_PATH)
+
+# Connection pool (size/timeout/recycling configured via DB_POOL_* env vars)
+DB_POOL = db_pool.init_app(app, db_pool.pool_from_env(STORAGE.connect))
+DB_POOL.backend = STORAGE
 
 def get_db_connection():
-    """Create and return database connection"""
+    """Check out a pooled database connection; close() returns it to the pool"""
     try:
-        conn = pyodbc.connect(CONNECTION_STRING)
-        conn.setdecoding(pyodbc.SQL_CHAR, encoding='utf-8')
-        conn.setdecoding(pyodbc.SQL_WCHAR, encoding='utf-8')
-        conn.setencoding(encoding='utf-8')
-        return conn
+        return db_pool.checkout(DB_POOL)
     except Exception as e:
         logger.error(f"Database connection error: {e}")
         raise
@@ -50,6 +53,20 @@ def dict_from_row(row, cursor):
     """Convert database row to dictionary"""
     return dict(zip([column[0] for column in cursor.description], row))
 
+def load_khazina_ledger():
+    """Read the columns the running-balance index needs from [All]"""
+    conn = get_db_connection()
+    cursor = conn.backend.list(conn, '[All]', order=None, columns=['ID', 'التاريخ', 'الايراد', 'المصروف'])
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+# Running balance of [All], rebuilt once and updated on every write
+KHAZINA_LEDGER = khazina_ledger.LedgerIndex(load_khazina_ledger)
+
+# Claims of tokens that already passed jwt.decode; honours exp and revocations
+TOKEN_CACHE = token_cache.TokenCache(JWT_SECRET, ['HS256'], max_size=int(os.getenv('TOKEN_CACHE_SIZE', 1024)))
+
 def authenticate_token(f):
     """Decorator for token authentication"""
     from functools import wraps
@@ -69,7 +86,7 @@ def authenticate_token(f):
             return jsonify({'error': 'Access token required'}), 401
         
         try:
-            jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+            TOKEN_CACHE.decode(token)
         except jwt.ExpiredSignatureError:
             return jsonify({'error': 'Token expired'}), 403
         except jwt.InvalidTokenError:
@@ -122,6 +139,13 @@ def login():
         logger.error(f"Login error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/auth/logout', methods=['POST'])
+@authenticate_token
+def logout():
+    """Revoke the caller's token"""
+    TOKEN_CACHE.revoke(request.headers.get('Authorization').split(' ')[1])
+    return jsonify({'success': True, 'message': 'Logged out'}), 200
+
 # ==================== KHAZINA ROUTES ====================
 
 @app.route('/api/khazina', methods=['GET'])
@@ -130,25 +154,26 @@ def get_khazina():
     """Get all Khazina records"""
     try:
         year = request.args.get('year')
+        start, end = aggregates.year_bounds(year) if year else (None, None)
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        if year:
-            query = f"SELECT * FROM [All] WHERE YEAR([التاريخ]) = {year} ORDER BY [التاريخ] DESC"
-        else:
-            query = "SELECT * FROM [All] ORDER BY [التاريخ] DESC"
-        
-        cursor.execute(query)
+        cursor = conn.backend.list(conn, '[All]', start=start, end=end)
         rows = cursor.fetchall()
         records = [dict_from_row(row, cursor) for row in rows]
         
         conn.close()
         
+        for record in records:
+            balance = KHAZINA_LEDGER.balance_of(record['ID'])
+            if balance is not None:
+                record['الرصيد'] = balance
+        
         return jsonify({
             'success': True,
             'data': records,
             'count': len(records)
         }), 200
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error fetching Khazina records: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -159,9 +184,7 @@ def get_khazina_by_id(record_id):
     """Get single Khazina record"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(f"SELECT * FROM [All] WHERE ID = {record_id}")
+        cursor = conn.backend.get(conn, '[All]', record_id)
         row = cursor.fetchone()
         
         conn.close()
@@ -170,11 +193,33 @@ def get_khazina_by_id(record_id):
             return jsonify({'success': False, 'error': 'Record not found'}), 404
         
         record = dict_from_row(row, cursor)
+        balance = KHAZINA_LEDGER.balance_of(record_id)
+        if balance is not None:
+            record['الرصيد'] = balance
         return jsonify({'success': True, 'data': record}), 200
     except Exception as e:
         logger.error(f"Error fetching Khazina record: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/khazina/balance', methods=['GET'])
+@authenticate_token
+def get_khazina_balance():
+    """Balance as of ?date= (default today) and net movement for ?from=&to="""
+    try:
+        as_of = request.args.get('date') or date_type.today()
+        result = {'success': True, 'balance': KHAZINA_LEDGER.balance_as_of(as_of)}
+        start, end = request.args.get('from'), request.args.get('to')
+        if start or end:
+            if not (start and end):
+                return jsonify({'success': False, 'error': 'Both from and to are required'}), 400
+            result['net'] = KHAZINA_LEDGER.net_between(start, end)
+        return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error computing Khazina balance: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/khazina', methods=['POST'])
 @authenticate_token
 def create_khazina():
@@ -186,26 +231,18 @@ def create_khazina():
         expense = data.get('expense', 0)
         notes = data.get('notes', '')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        # New rows get the highest ID, so they come last on their date
+        new_balance = KHAZINA_LEDGER.balance_as_of(date) + khazina_ledger.net_amount(revenue, expense)
         
-        # Get previous balance
-        cursor.execute(f"SELECT TOP 1 [الرصيد] FROM [All] WHERE [التاريخ] < ? ORDER BY [التاريخ] DESC", (date,))
-        prev_row = cursor.fetchone()
-        prev_balance = prev_row[0] if prev_row else 0
-        
-        new_balance = prev_balance + revenue - expense
-        
-        insert_query = """
-            INSERT INTO [All] ([التاريخ], [الايراد], [المصروف], [ملاحظات], [الرصيد])
-            VALUES (?, ?, ?, ?, ?)
-        """
-        
-        cursor.execute(insert_query, (date, revenue, expense, notes, new_balance))
-        conn.commit()
+        conn = get_db_connection()
+        record_id = conn.backend.insert(conn, '[All]', {'التاريخ': date, 'الايراد': revenue, 'المصروف': expense, 'ملاحظات': notes, 'الرصيد': new_balance})
         conn.close()
         
-        return jsonify({'success': True, 'message': 'Record created successfully'}), 201
+        KHAZINA_LEDGER.upsert(record_id, date, revenue, expense)
+        
+        return jsonify({'success': True, 'id': record_id, 'message': 'Record created successfully'}), 201
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error creating Khazina record: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -220,33 +257,23 @@ def update_khazina(record_id):
         revenue = data.get('revenue', 0)
         expense = data.get('expense', 0)
         notes = data.get('notes', '')
-        
+
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get previous balance
-        cursor.execute(f"SELECT TOP 1 [الرصيد] FROM [All] WHERE [التاريخ] < ? AND ID <> ? ORDER BY [التاريخ] DESC", (date, record_id))
-        prev_row = cursor.fetchone()
-        prev_balance = prev_row[0] if prev_row else 0
-        
-        new_balance = prev_balance + revenue - expense
-        
-        update_query = """
-            UPDATE [All]
-            SET [التاريخ] = ?,
-                [الايراد] = ?,
-                [المصروف] = ?,
-                [ملاحظات] = ?,
-                [الرصيد] = ?
-            WHERE ID = ?
-        """
-        
-        cursor.execute(update_query, (date, revenue, expense, notes, new_balance, record_id))
-        conn.commit()
+        if conn.backend.get(conn, '[All]', record_id).fetchone() is None:
+            conn.close()
+            return jsonify({'success': False, 'error': 'Record not found'}), 404
+
+        KHAZINA_LEDGER.upsert(record_id, date, revenue, expense)
+        new_balance = KHAZINA_LEDGER.balance_of(record_id)
+
+        conn.backend.update(conn, '[All]', record_id, {'التاريخ': date, 'الايراد': revenue, 'المصروف': expense, 'ملاحظات': notes, 'الرصيد': new_balance})
         conn.close()
         
         return jsonify({'success': True, 'message': 'Record updated successfully'}), 200
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
+        KHAZINA_LEDGER.invalidate()
         logger.error(f"Error updating Khazina record: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -256,12 +283,11 @@ def delete_khazina(record_id):
     """Delete Khazina record"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(f"DELETE FROM [All] WHERE ID = {record_id}")
-        conn.commit()
+        conn.backend.delete(conn, '[All]', record_id)
         conn.close()
         
+        KHAZINA_LEDGER.remove(record_id)
+        
         return jsonify({'success': True, 'message': 'Record deleted successfully'}), 200
     except Exception as e:
         logger.error(f"Error deleting Khazina record: {e}")
@@ -275,9 +301,7 @@ def get_sulf():
     """Get all Sulf records"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM [سلف] ORDER BY [التاريخ] DESC")
+        cursor = conn.backend.list(conn, '[سلف]')
         rows = cursor.fetchall()
         records = []
         for row in rows:
@@ -305,9 +329,7 @@ def get_sulf_by_id(record_id):
     """Get single Sulf record"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(f"SELECT * FROM [سلف] WHERE ID = {record_id}")
+        cursor = conn.backend.get(conn, '[سلف]', record_id)
         row = cursor.fetchone()
         
         conn.close()
@@ -338,15 +360,7 @@ def create_sulf():
         notes = data.get('notes', '')
         
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        insert_query = """
-            INSERT INTO [سلف] ([الاسم], [التاريخ], [المبلغ], [سداد], [ملاحظات])
-            VALUES (?, ?, ?, ?, ?)
-        """
-        
-        cursor.execute(insert_query, (name, date, amount, payment, notes))
-        conn.commit()
+        conn.backend.insert(conn, '[سلف]', {'الاسم': name, 'التاريخ': date, 'المبلغ': amount, 'سداد': payment, 'ملاحظات': notes})
         conn.close()
         
         return jsonify({'success': True, 'message': 'Record created successfully'}), 201
@@ -367,20 +381,7 @@ def update_sulf(record_id):
         notes = data.get('notes', '')
         
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        update_query = """
-            UPDATE [سلف]
-            SET [الاسم] = ?,
-                [التاريخ] = ?,
-                [المبلغ] = ?,
-                [سداد] = ?,
-                [ملاحظات] = ?
-            WHERE ID = ?
-        """
-        
-        cursor.execute(update_query, (name, date, amount, payment, notes, record_id))
-        conn.commit()
+        conn.backend.update(conn, '[سلف]', record_id, {'الاسم': name, 'التاريخ': date, 'المبلغ': amount, 'سداد': payment, 'ملاحظات': notes})
         conn.close()
         
         return jsonify({'success': True, 'message': 'Record updated successfully'}), 200
@@ -394,10 +395,7 @@ def delete_sulf(record_id):
     """Delete Sulf record"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(f"DELETE FROM [سلف] WHERE ID = {record_id}")
-        conn.commit()
+        conn.backend.delete(conn, '[سلف]', record_id)
         conn.close()
         
         return jsonify({'success': True, 'message': 'Record deleted successfully'}), 200
@@ -413,9 +411,7 @@ def get_qard():
     """Get all Qard records"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM [القرض] ORDER BY [التاريخ] DESC")
+        cursor = conn.backend.list(conn, '[القرض]')
         rows = cursor.fetchall()
         records = []
         for row in rows:
@@ -443,9 +439,7 @@ def get_qard_by_id(record_id):
     """Get single Qard record"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(f"SELECT * FROM [القرض] WHERE ID = {record_id}")
+        cursor = conn.backend.get(conn, '[القرض]', record_id)
         row = cursor.fetchone()
         
         conn.close()
@@ -476,15 +470,7 @@ def create_qard():
         notes = data.get('notes', '')
         
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        insert_query = """
-            INSERT INTO [القرض] ([الاسم], [التاريخ], [المبلغ], [سداد], [ملاحظات])
-            VALUES (?, ?, ?, ?, ?)
-        """
-        
-        cursor.execute(insert_query, (name, date, amount, payment, notes))
-        conn.commit()
+        conn.backend.insert(conn, '[القرض]', {'الاسم': name, 'التاريخ': date, 'المبلغ': amount, 'سداد': payment, 'ملاحظات': notes})
         conn.close()
         
         return jsonify({'success': True, 'message': 'Record created successfully'}), 201
@@ -505,20 +491,7 @@ def update_qard(record_id):
         notes = data.get('notes', '')
         
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        update_query = """
-            UPDATE [القرض]
-            SET [الاسم] = ?,
-                [التاريخ] = ?,
-                [المبلغ] = ?,
-                [سداد] = ?,
-                [ملاحظات] = ?
-            WHERE ID = ?
-        """
-        
-        cursor.execute(update_query, (name, date, amount, payment, notes, record_id))
-        conn.commit()
+        conn.backend.update(conn, '[القرض]', record_id, {'الاسم': name, 'التاريخ': date, 'المبلغ': amount, 'سداد': payment, 'ملاحظات': notes})
         conn.close()
         
         return jsonify({'success': True, 'message': 'Record updated successfully'}), 200
@@ -532,10 +505,7 @@ def delete_qard(record_id):
     """Delete Qard record"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(f"DELETE FROM [القرض] WHERE ID = {record_id}")
-        conn.commit()
+        conn.backend.delete(conn, '[القرض]', record_id)
         conn.close()
         
         return jsonify({'success': True, 'message': 'Record deleted successfully'}), 200
@@ -551,7 +521,9 @@ def health_check():
     return jsonify({
         'status': 'ok',
         'message': 'SELRS API Server is running',
-        'timestamp': datetime.utcnow().isoformat()
+        'timestamp': datetime.utcnow().isoformat(),
+        'pool': DB_POOL.stats(),
+        'auth_cache': TOKEN_CACHE.stats()
     }), 200
 
 # ==================== ERROR HANDLERS ====================
@@ -573,6 +545,12 @@ if __name__ == '__main__':
     hostname = socket.gethostname()
     local_ip = socket.gethostbyname(hostname)
     
+    try:
+        KHAZINA_LEDGER.reload()
+        logger.info(f"Khazina ledger indexed: {len(KHAZINA_LEDGER)} rows")
+    except Exception as e:
+        logger.error(f"Khazina ledger not indexed: {e}")
+    
     print(f"""
 ╔═══════════════════════════════════════════════════════════╗
 ║                                                           ║
@@ -0,0 +1,59 @@
+"""
+SELRS API Server - SQLite connections that behave like pyodbc ones
+Used by storage.SQLiteBackend for the local read replica and as a Linux
+stand-in for the .accdb file. The SQL itself comes from the backend; this
+only adds what the callers expect of a pyodbc connection: date/datetime/
+Decimal parameters, DATETIME columns read back as datetimes, parameters
+passed as separate arguments and an autocommit flag.
+"""
+
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+
+
+def _to_datetime(raw):
+    text = raw.decode('utf-8')
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return text
+
+
+sqlite3.register_converter('TIMESTAMP', _to_datetime)
+sqlite3.register_converter('DATETIME', _to_datetime)
+
+
+class AccessCursor(sqlite3.Cursor):
+    def execute(self, sql, *params):
+        # pyodbc also accepts parameters as separate arguments
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        return super().execute(sql, tuple(params))
+
+
+class AccessConnection(sqlite3.Connection):
+    def cursor(self, factory=None):
+        return super().cursor(factory or AccessCursor)
+
+    @property
+    def autocommit(self):
+        return self.isolation_level is None
+
+    @autocommit.setter
+    def autocommit(self, value):
+        self.isolation_level = None if value else 'DEFERRED'
+
+
+def connect(path, autocommit=True):
+    conn = sqlite3.connect(path, factory=AccessConnection, check_same_thread=False,
+                           detect_types=sqlite3.PARSE_DECLTYPES, timeout=30)
+    conn.autocommit = autocommit
+    conn.execute('PRAGMA journal_mode=WAL')
+    return conn
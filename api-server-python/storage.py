@@ -0,0 +1,316 @@
+"""
+SELRS API Server - Storage backends
+Every statement the routes need, behind one interface: list, get, insert,
+update, delete, upsert and aggregate. AccessBackend speaks the Jet dialect
+through pyodbc (TOP, IIF, @@IDENTITY); SQLiteBackend serves the replica
+and SQLITE_DB_PATH with native SQL (LIMIT, strftime, TOTAL, ON CONFLICT).
+Methods take the connection to run on, so they work the same on request,
+replica and writer connections; reads return the executed cursor.
+"""
+
+import os
+
+try:
+    import pyodbc
+except ImportError:  # no ODBC driver manager, e.g. Linux with SQLITE_DB_PATH
+    pyodbc = None
+
+import sqlite_compat
+
+
+DATE = '[التاريخ]'
+
+# aggregate(by=...) -> date parts ('year', 'month', 'day') or a column
+DATE_GROUPS = {
+    'year': ('year',),
+    'month': ('year', 'month'),
+    'day': ('year', 'month', 'day'),
+}
+
+
+def quote(column):
+    return column if column.startswith('[') else f"[{column}]"
+
+
+class Backend:
+    """SQL shared by both dialects; subclasses fill in what differs"""
+
+    name = None
+
+    def connect(self):
+        raise NotImplementedError
+
+    # --- dialect ---
+
+    def _select(self, columns, table, conditions, order, limit, group_by=None):
+        """(sql, extra params) for one SELECT"""
+        raise NotImplementedError
+
+    def _last_id(self, cursor):
+        raise NotImplementedError
+
+    def _date_part(self, part, column):
+        raise NotImplementedError
+
+    def _sum_or_zero(self, column):
+        raise NotImplementedError
+
+    # --- reads ---
+
+    def list(self, conn, table, start=None, end=None, after=None, limit=None, order='desc', columns=None):
+        """
+        Rows with start <= date < end, newest first (order='desc', by date
+        then ID), oldest first ('asc') or unordered (None). after: (date, ID)
+        of the last row of the previous page, for keyset paging (desc only).
+        """
+        conditions, params = [], []
+        if start is not None:
+            conditions.append(f"{DATE} >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append(f"{DATE} < ?")
+            params.append(end)
+        if after is not None:
+            after_date, after_id = after
+            if after_date is None:
+                # NULL dates sort last in DESC order on both engines
+                conditions.append(f"({DATE} IS NULL AND ID < ?)")
+                params.append(after_id)
+            else:
+                conditions.append(f"({DATE} < ? OR ({DATE} = ? AND ID < ?) OR {DATE} IS NULL)")
+                params.extend([after_date, after_date, after_id])
+        order_by = {
+            'desc': f"{DATE} DESC, ID DESC",
+            'asc': f"{DATE}, ID",
+            None: None,
+        }[order]
+        names = ', '.join(quote(c) for c in columns) if columns else '*'
+        sql, extra = self._select(names, table, conditions, order_by, limit)
+        cursor = conn.cursor()
+        cursor.execute(sql, params + extra)
+        return cursor
+
+    def get(self, conn, table, record_id):
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT * FROM {table} WHERE ID = ?", (int(record_id),))
+        return cursor
+
+    def get_many(self, conn, table, ids):
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT * FROM {table} WHERE ID IN ({', '.join('?' for _ in ids)})", [int(i) for i in ids])
+        return cursor
+
+    def existing_ids(self, conn, table, ids, chunk=100):
+        """The subset of ids that have a row"""
+        ids = sorted({int(i) for i in ids})
+        found = set()
+        cursor = conn.cursor()
+        for offset in range(0, len(ids), chunk):
+            part = ids[offset:offset + chunk]
+            cursor.execute(f"SELECT ID FROM {table} WHERE ID IN ({', '.join('?' for _ in part)})", part)
+            found.update(int(row[0]) for row in cursor.fetchall())
+        return found
+
+    def aggregate(self, conn, table, by, sums=(), start=None, end=None, order='group', top=None):
+        """
+        One row per group: group values, SUM() of each column in sums,
+        COUNT(*), MAX(date). by: 'year', 'month', 'day' or a column name.
+        order: 'group' (by group values), 'balance' (sums[0] - sums[1],
+        largest first) or 'last' (latest date first).
+        """
+        conditions, params = [], []
+        if by in DATE_GROUPS:
+            keys = [self._date_part(part, DATE) for part in DATE_GROUPS[by]]
+            conditions.append(f"{DATE} IS NOT NULL")
+        else:
+            keys = [quote(by)]
+        if start is not None:
+            conditions.append(f"{DATE} >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append(f"{DATE} < ?")
+            params.append(end)
+        order_by = {
+            'group': ', '.join(keys),
+            'balance': (f"{self._sum_or_zero(quote(sums[0]))} - {self._sum_or_zero(quote(sums[1]))} DESC"
+                        if len(sums) >= 2 else None),
+            'last': f"MAX({DATE}) DESC",
+        }.get(order)
+        if order_by is None:
+            raise ValueError(f"Unknown order: {order}")
+        columns = ', '.join(keys + [f"SUM({quote(c)})" for c in sums] + ["COUNT(*)", f"MAX({DATE})"])
+        sql, extra = self._select(columns, table, conditions, order_by, top, group_by=', '.join(keys))
+        cursor = conn.cursor()
+        cursor.execute(sql, params + extra)
+        return cursor
+
+    # --- writes (run on the writer's connection) ---
+
+    def insert(self, conn, table, values):
+        """values: {column: value}; returns the new ID"""
+        names = list(values)
+        cursor = conn.cursor()
+        cursor.execute(f"INSERT INTO {table} ({', '.join(quote(n) for n in names)}) "
+                       f"VALUES ({', '.join('?' for _ in names)})", [values[n] for n in names])
+        return self._last_id(cursor)
+
+    def insert_many(self, conn, table, names, rows):
+        """
+        rows: value tuples in names order, inside the caller's transaction.
+        Returns the new IDs in row order.
+        """
+        sql = f"INSERT INTO {table} ({', '.join(quote(n) for n in names)}) VALUES ({', '.join('?' for _ in names)})"
+        # Row by row: AutoNumber IDs need not be contiguous, so each one is
+        # read back; the ID query gets its own cursor so the INSERT stays prepared
+        cursor, id_cursor = conn.cursor(), conn.cursor()
+        ids = []
+        for row in rows:
+            cursor.execute(sql, row)
+            ids.append(self._last_id(id_cursor))
+        return ids
+
+    def update(self, conn, table, record_id, values):
+        """Returns the number of rows changed"""
+        names = list(values)
+        cursor = conn.cursor()
+        cursor.execute(f"UPDATE {table} SET {', '.join(f'{quote(n)}=?' for n in names)} WHERE ID=?",
+                       [values[n] for n in names] + [int(record_id)])
+        return cursor.rowcount
+
+    def update_many(self, conn, table, names, rows):
+        """rows: (ID, value tuple in names order)"""
+        cursor = self._bulk_cursor(conn)
+        cursor.executemany(f"UPDATE {table} SET {', '.join(f'{quote(n)}=?' for n in names)} WHERE ID=?",
+                           [tuple(values) + (int(record_id),) for record_id, values in rows])
+
+    def upsert(self, conn, table, record_id, values):
+        """Insert the row under record_id, or update it if it exists"""
+        raise NotImplementedError
+
+    def delete(self, conn, table, record_id):
+        cursor = conn.cursor()
+        cursor.execute(f"DELETE FROM {table} WHERE ID=?", (int(record_id),))
+        return cursor.rowcount
+
+    def _bulk_cursor(self, conn):
+        return conn.cursor()
+
+
+class AccessBackend(Backend):
+    """The .accdb file through the Access ODBC driver"""
+
+    name = 'access'
+
+    def __init__(self, path, fast_executemany=False):
+        """fast_executemany: bind update_many's rows as one array; not every Access driver accepts it"""
+        self.path = path
+        self.fast_executemany = fast_executemany
+        self.connection_string = f"Driver={{Microsoft Access Driver (*.mdb, *.accdb)}};DBQ={path};"
+
+    def connect(self):
+        if pyodbc is None:
+            raise RuntimeError('pyodbc is not installed; set SQLITE_DB_PATH to run without Access')
+        return pyodbc.connect(self.connection_string, autocommit=True)
+
+    def _select(self, columns, table, conditions, order, limit, group_by=None):
+        top = f"TOP {int(limit)} " if limit is not None else ""
+        sql = f"SELECT {top}{columns} FROM {table}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if group_by:
+            sql += f" GROUP BY {group_by}"
+        if order:
+            sql += f" ORDER BY {order}"
+        return sql, []
+
+    def _last_id(self, cursor):
+        cursor.execute("SELECT @@IDENTITY")
+        return int(cursor.fetchone()[0])
+
+    def _date_part(self, part, column):
+        return f"{part.upper()}({column})"
+
+    def _sum_or_zero(self, column):
+        return f"SUM(IIF({column} IS NULL, 0, {column}))"
+
+    def _bulk_cursor(self, conn):
+        cursor = conn.cursor()
+        if self.fast_executemany:
+            try:
+                cursor.fast_executemany = True
+            except AttributeError:  # pyodbc older than 4.0.19
+                pass
+        return cursor
+
+    def upsert(self, conn, table, record_id, values):
+        # No native upsert in Jet: update, and insert with the ID if nothing matched
+        if self.update(conn, table, record_id, values):
+            return int(record_id)
+        names = list(values)
+        cursor = conn.cursor()
+        cursor.execute(f"INSERT INTO {table} (ID, {', '.join(quote(n) for n in names)}) "
+                       f"VALUES (?, {', '.join('?' for _ in names)})", [int(record_id)] + [values[n] for n in names])
+        return int(record_id)
+
+
+class SQLiteBackend(Backend):
+    """A SQLite file: the local replica, or a stand-in for the .accdb file"""
+
+    name = 'sqlite'
+
+    STRFTIME = {'year': '%Y', 'month': '%m', 'day': '%d'}
+
+    def __init__(self, path=None):
+        self.path = path
+
+    def connect(self):
+        return sqlite_compat.connect(self.path)
+
+    def _select(self, columns, table, conditions, order, limit, group_by=None):
+        sql = f"SELECT {columns} FROM {table}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if group_by:
+            sql += f" GROUP BY {group_by}"
+        if order:
+            sql += f" ORDER BY {order}"
+        if limit is None:
+            return sql, []
+        return sql + " LIMIT ?", [int(limit)]
+
+    def _last_id(self, cursor):
+        cursor.execute("SELECT last_insert_rowid()")
+        return int(cursor.fetchone()[0])
+
+    def _date_part(self, part, column):
+        return f"CAST(strftime('{self.STRFTIME[part]}', {column}) AS INTEGER)"
+
+    def _sum_or_zero(self, column):
+        return f"TOTAL({column})"
+
+    def upsert(self, conn, table, record_id, values):
+        names = list(values)
+        cursor = conn.cursor()
+        cursor.execute(f"INSERT INTO {table} (ID, {', '.join(quote(n) for n in names)}) "
+                       f"VALUES (?, {', '.join('?' for _ in names)}) "
+                       f"ON CONFLICT(ID) DO UPDATE SET {', '.join(f'{quote(n)}=excluded.{quote(n)}' for n in names)}",
+                       [int(record_id)] + [values[n] for n in names])
+        return int(record_id)
+
+
+def backend_from_env(access_path):
+    """
+    STORAGE_BACKEND=access|sqlite; SQLITE_DB_PATH is the SQLite file.
+    Defaults to sqlite when SQLITE_DB_PATH is set, otherwise Access.
+    ACCESS_FAST_EXECUTEMANY=1 turns on pyodbc's fast_executemany.
+    """
+    sqlite_path = os.getenv('SQLITE_DB_PATH')
+    kind = os.getenv('STORAGE_BACKEND', 'sqlite' if sqlite_path else 'access').lower()
+    if kind == 'sqlite':
+        if not sqlite_path:
+            raise RuntimeError('STORAGE_BACKEND=sqlite needs SQLITE_DB_PATH')
+        return SQLiteBackend(sqlite_path)
+    if kind == 'access':
+        fast = os.getenv('ACCESS_FAST_EXECUTEMANY', '0').lower() in ('1', 'true', 'yes')
+        return AccessBackend(access_path, fast_executemany=fast)
+    raise RuntimeError(f"Unknown STORAGE_BACKEND: {kind}")
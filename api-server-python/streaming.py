@@ -0,0 +1,70 @@
+"""
+SELRS API Server - Streaming JSON list responses
+Rows are pulled from the cursor with fetchmany() and written out batch by
+batch, so memory stays flat and the first bytes leave before the query
+has been fully read.
+"""
+
+import logging
+import os
+
+from flask import Response
+
+import db_pool
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', 500))
+
+
+def wants_stream(args):
+    return args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def fetch_batches(cursor, size=BATCH_SIZE):
+    """Yield lists of rows from an executed cursor"""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+
+def batched(items, size=BATCH_SIZE):
+    """Split an in-memory list into batches for json_stream"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def json_stream(batches, to_record, dumps, conn=None, columns=None):
+    """
+    Stream {"success": true, "data": [...], "count": n} from row batches, or
+    {"success": true, "columns": [...], "rows": [...], "count": n} when
+    columns is given. When conn is given the generator owns it and closes
+    it when done.
+    """
+    if conn is not None:
+        db_pool.detach(conn)
+
+    def generate():
+        count = 0
+        try:
+            if columns is None:
+                yield '{"success": true, "data": ['
+            else:
+                yield '{"success": true, "columns": %s, "rows": [' % dumps(columns)
+            for rows in batches:
+                chunk = ','.join(dumps(to_record(row)) for row in rows)
+                if not chunk:
+                    continue
+                yield (',' + chunk) if count else chunk
+                count += len(rows)
+            yield '], "count": %d}' % count
+        except Exception as e:
+            # Headers are already sent; the truncated body signals the failure
+            logger.error(f"Streaming response failed after {count} rows: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+
+    return Response(generate(), mimetype='application/json')
@@ -0,0 +1,60 @@
+import pytest
+
+import bulk_write
+import db_pool
+import storage
+
+
+COLUMNS = [('التاريخ', 'date', None), ('الايراد', 'revenue', 0), ('المصروف', 'expense', 0), ('ملاحظات', 'notes', '')]
+
+
+@pytest.fixture
+def conn(tmp_path):
+    backend = storage.SQLiteBackend(str(tmp_path / 'bulk.db'))
+    pool = db_pool.ConnectionPool(backend.connect, size=1)
+    pool.backend = backend
+    conn = pool.acquire()
+    conn.cursor().execute("CREATE TABLE [All] (ID INTEGER PRIMARY KEY AUTOINCREMENT, [التاريخ] DATETIME, "
+                          "[الايراد] REAL, [المصروف] REAL, [ملاحظات] TEXT)")
+    yield conn
+    conn.close()
+
+
+def rows(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT ID, [الايراد], [ملاحظات] FROM [All] ORDER BY ID")
+    return [tuple(row) for row in cursor.fetchall()]
+
+
+def test_validate_rejects_non_numbers():
+    records = [
+        {'date': '2025-01-01', 'revenue': 10},
+        {'date': '2025-01-01', 'revenue': 'abc'},
+        {'date': '2025-01-01', 'expense': True},
+        {'date': '2025-01-01', 'revenue': '12.5', 'expense': None},
+    ]
+    errors = bulk_write.validate(records, ['date'], COLUMNS)
+    assert [e['index'] for e in errors] == [1, 2]
+    assert 'revenue' in errors[0]['error']
+
+
+def test_insert_returns_the_id_of_each_row(conn):
+    results = bulk_write.write(conn, '[All]', COLUMNS, [{'date': '2025-01-02', 'revenue': n, 'notes': str(n)}
+                                                        for n in range(3)])
+    by_id = {row[0]: row for row in rows(conn)}
+    for index, result in enumerate(results):
+        assert result['index'] == index
+        assert by_id[result['id']][2] == str(index)
+
+
+def test_update_of_missing_id_writes_nothing(conn):
+    [created] = bulk_write.write(conn, '[All]', COLUMNS, [{'date': '2025-01-01', 'revenue': 1}])
+    before = rows(conn)
+    with pytest.raises(bulk_write.RecordErrors) as raised:
+        bulk_write.write(conn, '[All]', COLUMNS, [
+            {'date': '2025-01-03', 'revenue': 5},
+            {'id': created['id'], 'date': '2025-01-01', 'revenue': 2},
+            {'id': 888888, 'date': '2025-01-01', 'revenue': 3},
+        ])
+    assert raised.value.errors == [{'index': 2, 'error': 'Record not found: 888888'}]
+    assert rows(conn) == before
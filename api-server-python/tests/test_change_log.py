@@ -0,0 +1,36 @@
+from datetime import date
+
+from change_log import ChangeLog
+
+
+def test_latest_state_per_row():
+    log = ChangeLog()
+    token = log.token()
+    log.record('[سلف]', 1)
+    log.record('[سلف]', 1, deleted=True)
+    log.record('[All]', 2)
+    token, changed, affected = log.changes_since(token)
+    assert changed == {'[سلف]': {1: True}, '[All]': {2: False}}
+    assert affected == {}
+    assert log.changes_since(token)[1:] == ({}, {})
+
+
+def test_earliest_affected_date_per_table():
+    log = ChangeLog()
+    token = log.token()
+    log.record('[All]', 1, affects_from=date(2025, 3, 1))
+    log.record('[All]', 2, affects_from=date(2025, 1, 1))
+    log.record('[All]', 3, affects_from=date(2025, 2, 1))
+    log.record('[سلف]', 4)
+    _, _, affected = log.changes_since(token)
+    assert affected == {'[All]': date(2025, 1, 1)}
+
+
+def test_reset_for_unknown_or_trimmed_token():
+    log = ChangeLog(max_entries=2)
+    assert log.changes_since(None)[1:] == (None, None)
+    assert log.changes_since('other-0')[1:] == (None, None)
+    token = log.token()
+    for record_id in range(3):
+        log.record('[All]', record_id)
+    assert log.changes_since(token)[1:] == (None, None)
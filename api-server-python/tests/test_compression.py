@@ -0,0 +1,111 @@
+import gzip
+
+import pytest
+from flask import Flask, Response, jsonify
+
+import compression
+from compression import Compressor, parse_accept_encoding
+
+
+ROWS = [{'ID': i, 'الاسم': 'احمد', 'المبلغ': i * 10} for i in range(200)]
+
+
+@pytest.fixture
+def compressor():
+    return Compressor(min_size=1024)
+
+
+@pytest.fixture
+def client(compressor):
+    app = Flask(__name__)
+
+    @app.route('/rows')
+    def rows():
+        response = jsonify(ROWS)
+        response.set_etag('v1')
+        return response
+
+    @app.route('/small')
+    def small():
+        return jsonify({'ok': True})
+
+    @app.route('/missing')
+    def missing():
+        return jsonify({'error': 'x' * 2000}), 404
+
+    @app.route('/stream')
+    def stream():
+        return Response((b'[' + b'1,' * 1000 + b'1]' for _ in range(1)), mimetype='application/json')
+
+    compression.init_app(app, compressor)
+    return app.test_client()
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding('gzip, br;q=0.5, *;q=0') == {'gzip': 1.0, 'br': 0.5, '*': 0.0}
+    assert parse_accept_encoding('gzip;q=bad') == {'gzip': 0.0}
+    assert parse_accept_encoding(None) == {}
+
+
+def test_choose_follows_q_then_preference(compressor, monkeypatch):
+    assert compressor.choose('identity') is None
+    assert compressor.choose('gzip;q=0') is None
+    assert compressor.choose('gzip') == 'gzip'
+    assert compressor.choose('*') == compressor.codings[0]
+    monkeypatch.setattr(compressor, 'codings', ('br', 'gzip'))
+    assert compressor.choose('gzip, br') == 'br'
+    assert compressor.choose('gzip, br;q=0.5') == 'gzip'
+
+
+def test_gzip_response_round_trips(client):
+    response = client.get('/rows', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.headers['ETag'] == '"v1-gzip"'
+    assert gzip.decompress(response.get_data()) == client.get('/rows').get_data()
+
+
+def test_brotli_when_installed(client):
+    brotli = pytest.importorskip('brotli')
+    response = client.get('/rows', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert brotli.decompress(response.get_data()) == client.get('/rows').get_data()
+
+
+def test_left_alone(client):
+    assert 'Content-Encoding' not in client.get('/rows').headers
+    assert 'Content-Encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'Content-Encoding' not in client.get('/missing', headers={'Accept-Encoding': 'gzip'}).headers
+    streamed = client.get('/stream', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in streamed.headers
+    assert len(streamed.get_data()) > 1024
+
+
+def test_tagged_bodies_are_compressed_once(client, compressor):
+    for _ in range(3):
+        client.get('/rows', headers={'Accept-Encoding': 'gzip'})
+    stats = compressor.stats()
+    assert (stats['responses'], stats['cache_hits'], stats['cache_entries']) == (3, 2, 1)
+    assert stats['ratio'] < 0.5
+
+
+def test_cache_is_bounded(compressor):
+    compressor.cache_bytes = 100
+    compressor._store(('a', 'gzip'), 1000, b'x' * 60)
+    compressor._store(('b', 'gzip'), 1000, b'y' * 60)
+    compressor._store(('c', 'gzip'), 1000, b'z' * 500)
+    assert compressor._cached(('a', 'gzip'), 1000) is None
+    assert compressor._cached(('b', 'gzip'), 1000) == b'y' * 60
+    # Same tag but a different body size is not trusted
+    assert compressor._cached(('b', 'gzip'), 999) is None
+    assert compressor.stats()['cache_bytes'] == 60
+
+
+def test_compressor_from_env(monkeypatch):
+    monkeypatch.setenv('COMPRESS_ENABLED', '0')
+    assert compression.compressor_from_env() is None
+    monkeypatch.setenv('COMPRESS_ENABLED', '1')
+    monkeypatch.setenv('COMPRESS_LEVEL', '9')
+    monkeypatch.setenv('COMPRESS_CACHE_MB', '0.5')
+    compressor = compression.compressor_from_env()
+    assert (compressor.gzip_level, compressor.cache_bytes) == (9, 512 * 1024)
@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+from flask import Flask
+
+import db_pool
+import sqlite_compat
+
+
+def make_pool(size=1, **kwargs):
+    return db_pool.ConnectionPool(lambda: sqlite_compat.connect(':memory:'), size=size, timeout=0.2, **kwargs)
+
+
+def test_release_reuses_the_connection():
+    pool = make_pool()
+    conn = pool.acquire()
+    conn.close()
+    assert pool.acquire() is conn
+    stats = pool.stats()
+    assert (stats['checkouts'], stats['hits'], stats['opened'], stats['in_use']) == (2, 1, 1, 1)
+
+
+def test_close_twice_releases_once():
+    pool = make_pool(size=2)
+    conn = pool.acquire()
+    conn.close()
+    conn.close()
+    assert pool.stats()['in_use'] == 0
+    pool.acquire()
+    pool.acquire()
+    with pytest.raises(db_pool.PoolTimeout):
+        pool.acquire()
+
+
+def test_broken_and_worn_out_connections_are_replaced():
+    pool = make_pool(max_uses=2)
+    first = pool.acquire()
+    first.broken = True
+    first.close()
+    second = pool.acquire()
+    assert second is not first
+    second.close()
+    assert pool.acquire() is second
+    second.close()
+    assert pool.acquire() is not second
+    assert pool.stats()['recycled'] == 2
+
+
+def test_full_pool_times_out():
+    pool = make_pool()
+    pool.acquire()
+    with pytest.raises(db_pool.PoolTimeout):
+        pool.acquire()
+    assert pool.stats()['timeouts'] == 1
+
+
+def test_teardown_returns_forgotten_connections():
+    pool = make_pool()
+    app = Flask(__name__)
+    db_pool.init_app(app, pool)
+
+    @app.route('/leak')
+    def leak():
+        db_pool.checkout(pool).cursor().execute('SELECT 1')
+        return ''
+
+    assert app.test_client().get('/leak').status_code == 200
+    assert pool.stats()['in_use'] == 0
+
+
+def test_teardown_after_close_leaves_the_next_holder_alone():
+    pool = make_pool()
+    app = Flask(__name__)
+    db_pool.init_app(app, pool)
+    closed, taken, done = threading.Event(), threading.Event(), threading.Event()
+    held = {}
+
+    @app.route('/a')
+    def route_a():
+        db_pool.checkout(pool).close()
+        closed.set()
+        assert taken.wait(5)
+        return ''
+
+    def request_b():
+        assert closed.wait(5)
+        with app.test_request_context('/b'):
+            held['conn'] = db_pool.checkout(pool)
+            taken.set()
+            assert done.wait(5)
+
+    thread = threading.Thread(target=request_b)
+    thread.start()
+    assert app.test_client().get('/a').status_code == 200
+    # A's teardown has run; B still holds the only connection
+    assert held['conn'].checked_out
+    with pytest.raises(db_pool.PoolTimeout):
+        pool.acquire()
+    done.set()
+    thread.join(5)
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import pytest
+from flask import Flask, jsonify, request
+
+import etags
+from token_cache import TokenCache
+
+SECRET = 'test-secret'
+
+
+def make_token(**delta):
+    expires = datetime.now(timezone.utc) + timedelta(**(delta or {'days': 1}))
+    return jwt.encode({'user': 'admin', 'exp': expires}, SECRET, algorithm='HS256')
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.tokens = TokenCache(SECRET, ['HS256'])
+
+    def claims():
+        try:
+            return app.tokens.decode(request.headers.get('Authorization', '').split(' ')[-1])
+        except jwt.InvalidTokenError:
+            return None
+
+    @app.route('/api/sulf')
+    def sulf():
+        if claims() is None:
+            return jsonify({'message': 'Invalid token'}), 401
+        return jsonify([])
+
+    @app.route('/api/sulf', methods=['POST'])
+    def create_sulf():
+        return jsonify({'success': True}), 201
+
+    etags.init_app(app, etags.TableVersions(), lambda path: '[سلف]' if path.startswith('/api/sulf') else None, claims)
+    return app
+
+
+def get(app, token=None, tag=None):
+    headers = {}
+    if token is not None:
+        headers['Authorization'] = f'Bearer {token}'
+    if tag is not None:
+        headers['If-None-Match'] = tag
+    return app.test_client().get('/api/sulf', headers=headers)
+
+
+@pytest.fixture
+def tag(app):
+    response = get(app, make_token())
+    assert response.status_code == 200
+    return response.headers['ETag']
+
+
+def test_valid_token_gets_304(app, tag):
+    assert get(app, make_token(), tag).status_code == 304
+
+
+def test_wildcard_never_matches(app, tag):
+    assert get(app, make_token(), '*').status_code == 200
+    assert get(app, None, '*').status_code == 401
+
+
+@pytest.mark.parametrize('token', [None, 'garbage', make_token(seconds=-10),
+                                   jwt.encode({'user': 'admin'}, 'other-secret', algorithm='HS256')])
+def test_bad_tokens_get_401_not_304(app, tag, token):
+    assert get(app, token, tag).status_code == 401
+
+
+def test_revoked_token_gets_401(app, tag):
+    token = make_token(hours=1)
+    assert get(app, token, tag).status_code == 304
+    app.tokens.revoke(token)
+    assert get(app, token, tag).status_code == 401
+
+
+def test_write_changes_the_tag(app, tag):
+    app.test_client().post('/api/sulf')
+    assert get(app, make_token(), tag).status_code == 200
@@ -0,0 +1,101 @@
+from datetime import date
+
+import pytest
+
+from khazina_ledger import FenwickTree, LedgerIndex
+
+
+ROWS = [
+    (1, '2025-01-01', 1000, 0),
+    (2, '2025-01-05', 0, 200),
+    (3, '2025-01-05', 50, 0),
+    (4, '2025-02-01', 0, 100),
+]
+
+
+def running_balances(rows):
+    """Reference balances: walk the rows ordered by (date, ID)"""
+    balances, total = {}, 0.0
+    for record_id, row_date, revenue, expense in sorted(rows, key=lambda r: (r[1], r[0])):
+        total += revenue - expense
+        balances[record_id] = round(total, 2)
+    return balances
+
+
+def assert_matches(index, rows):
+    for record_id, balance in running_balances(rows).items():
+        assert index.balance_of(record_id) == balance
+
+
+@pytest.fixture
+def index():
+    ledger = LedgerIndex(lambda: list(ROWS))
+    ledger.reload()
+    return ledger
+
+
+def test_fenwick_prefix_sums():
+    values = [3.0, -1.0, 4.0, 1.0, -5.0, 9.0]
+    tree = FenwickTree.from_values(values)
+    for pos in range(len(values)):
+        assert tree.prefix(pos) == sum(values[:pos + 1])
+    assert tree.prefix(-1) == 0.0
+    tree.add(2, 10.0)
+    assert tree.prefix(1) == 2.0
+    assert tree.prefix(5) == sum(values) + 10.0
+
+
+def test_balances_follow_date_then_id(index):
+    assert_matches(index, ROWS)
+    assert index.balance_as_of('2025-01-04') == 1000
+    assert index.balance_as_of('2025-01-31') == 850
+    assert index.net_between('2025-01-02', '2025-02-01') == -250
+    assert len(index) == 4
+
+
+def test_backdated_insert_moves_later_balances(index):
+    index.upsert(5, '2025-01-03', 0, 300)
+    rows = ROWS + [(5, '2025-01-03', 0, 300)]
+    assert_matches(index, rows)
+    assert index.balance_of(2) == 500
+
+
+def test_balances_from_lists_only_later_rows(index):
+    index.upsert(5, '2025-01-03', 0, 300)
+    rows = ROWS + [(5, '2025-01-03', 0, 300)]
+    expected = running_balances(rows)
+    assert index.balances_from('2025-01-03') == {record_id: expected[record_id] for record_id in (5, 2, 3, 4)}
+    assert list(index.balances_from(date.min)) == [1, 5, 2, 3, 4]
+    assert index.balances_from('2025-03-01') == {}
+
+
+def test_insert_before_indexed_range(index):
+    index.upsert(6, '2024-06-30', 20, 0)
+    rows = ROWS + [(6, '2024-06-30', 20, 0)]
+    assert_matches(index, rows)
+    assert index.balance_as_of('2024-12-31') == 20
+
+
+def test_move_to_another_date(index):
+    index.upsert(4, '2025-01-02', 0, 100)
+    rows = [row for row in ROWS if row[0] != 4] + [(4, '2025-01-02', 0, 100)]
+    assert_matches(index, rows)
+    assert index.date_of(4) == date(2025, 1, 2)
+    assert index.balance_as_of('2025-01-31') == 750
+
+
+def test_delete(index):
+    index.remove(1)
+    rows = [row for row in ROWS if row[0] != 1]
+    assert_matches(index, rows)
+    assert index.balance_of(1) is None
+    assert index.date_of(1) is None
+    index.remove(1)
+    assert len(index) == 3
+
+
+def test_invalidate_reloads_from_loader(index):
+    index.upsert(7, '2025-01-10', 999, 0)
+    index.invalidate()
+    assert index.balance_of(7) is None
+    assert_matches(index, ROWS)
@@ -0,0 +1,56 @@
+from flask import Flask
+
+import metrics
+
+
+def samples(text):
+    """{name: (type, value)} from the exposition text"""
+    types, values = {}, {}
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ')
+            types[name] = kind
+        elif line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            values[name] = float(value)
+    return {name: (types.get(name.split('{')[0]), value) for name, value in values.items()}
+
+
+def test_collected_totals_are_counters():
+    registry = metrics.Metrics()
+    registry.collect('pool', lambda: {'hits': 3, 'in_use': 1, 'hit_rate': 0.5, 'ready': True, 'path': 'x'},
+                     counters=('hits',))
+    exported = samples(registry.render())
+    assert exported['selrs_pool_hits_total'] == ('counter', 3)
+    assert exported['selrs_pool_in_use'] == ('gauge', 1)
+    assert exported['selrs_pool_hit_rate'] == ('gauge', 0.5)
+    assert 'selrs_pool_hits' not in exported
+    assert 'selrs_pool_ready' not in exported and 'selrs_pool_path' not in exported
+
+
+def test_failing_collector_is_skipped():
+    registry = metrics.Metrics()
+    registry.collect('broken', lambda: 1 / 0)
+    registry.collect('ok', lambda: {'size': 2})
+    assert samples(registry.render())['selrs_ok_size'] == ('gauge', 2)
+
+
+def test_requests_are_timed_and_counted():
+    app = Flask(__name__)
+    registry = metrics.init_app(app)
+
+    @app.route('/api/sulf/<int:id>')
+    def sulf(id):
+        registry.observe('db_execute', 0.002)
+        return {'id': id}
+
+    client = app.test_client()
+    client.get('/api/sulf/1')
+    client.get('/api/sulf/2')
+    client.get('/nowhere')
+    exported = samples(registry.render())
+    route = 'route="/api/sulf/<int:id>",method="GET"'
+    assert exported[f'selrs_request_seconds_count{{{route}}}'][1] == 2
+    assert exported[f'selrs_request_stage_seconds_count{{{route},stage="db_execute"}}'][1] == 2
+    assert exported[f'selrs_responses_total{{{route},status="200"}}'] == ('counter', 2)
+    assert exported['selrs_responses_total{route="unmatched",method="GET",status="404"}'] == ('counter', 1)
@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+import db_pool
+import replica
+import storage
+
+
+TABLE = '[All]'
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def source(tmp_path):
+    backend = storage.SQLiteBackend(str(tmp_path / 'source.db'))
+    conn = backend.connect()
+    conn.execute(f"CREATE TABLE {TABLE} (ID INTEGER PRIMARY KEY, [التاريخ] TIMESTAMP, [الايراد] REAL)")
+    conn.executemany(f"INSERT INTO {TABLE} VALUES (?, ?, ?)", [(1, '2025-01-01', 10.0), (2, '2025-01-02', 20.0)])
+    conn.commit()
+    conn.close()
+    pool = db_pool.ConnectionPool(backend.connect, size=2, timeout=1)
+    pool.backend = backend
+    return pool
+
+
+@pytest.fixture
+def copy(tmp_path, source, monkeypatch):
+    monkeypatch.setattr(replica.Replica, 'RETRY_SECONDS', 0.05)
+    monkeypatch.setattr(replica.Replica, 'RETRY_MAX_SECONDS', 0.2)
+    failing = threading.Event()
+    copy = replica.Replica(str(tmp_path / 'replica.db'), [TABLE],
+                           lambda: None if failing.is_set() else source.acquire(), interval=60)
+    copy.failing = failing
+    yield copy
+    copy.stop()
+
+
+def replica_ids(copy):
+    conn = copy.pool.acquire()
+    try:
+        return [row[0] for row in conn.execute(f"SELECT ID FROM {TABLE} ORDER BY ID")]
+    finally:
+        conn.close()
+
+
+def write_source(source, sql, *params):
+    conn = source.acquire()
+    try:
+        conn.execute(sql, params)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_full_sync_then_refresh(copy, source):
+    copy.full_sync()
+    assert copy.ready and replica_ids(copy) == [1, 2]
+    write_source(source, f"INSERT INTO {TABLE} VALUES (3, '2025-01-03', 30.0)")
+    copy.refresh(TABLE, 3)
+    copy.refresh(TABLE, 1, deleted=True)
+    assert replica_ids(copy) == [2, 3]
+    assert copy.ready
+
+
+def test_refresh_failure_falls_back_and_resyncs(copy, source):
+    copy.start()
+    assert wait_for(lambda: copy.ready)
+    copy.failing.set()
+    with pytest.raises(RuntimeError):
+        copy.refresh(TABLE, 1)
+    assert not copy.ready
+    assert copy.stats()['fallbacks'] == 1
+
+    # The re-sync starts after the back-off, not after the 60 s interval
+    write_source(source, f"INSERT INTO {TABLE} VALUES (3, '2025-01-03', 30.0)")
+    copy.failing.clear()
+    assert wait_for(lambda: copy.ready)
+    assert replica_ids(copy) == [1, 2, 3]
+
+
+def test_column_change_falls_back_and_resyncs(copy, source):
+    copy.start()
+    assert wait_for(lambda: copy.ready)
+    syncs = copy.stats()['full_syncs']
+    write_source(source, f"ALTER TABLE {TABLE} ADD COLUMN [ملاحظات] TEXT")
+    copy.refresh(TABLE, 1)
+    assert not copy.ready
+    assert wait_for(lambda: copy.ready)
+    assert copy.stats()['full_syncs'] == syncs + 1
+    assert copy._columns[TABLE][-1] == 'ملاحظات'
+
+
+def test_failing_source_backs_off(copy):
+    copy.failing.set()
+    copy.start()
+    time.sleep(0.6)
+    errors = copy.stats()['full_sync_errors']
+    # 0.05 + 0.1 + 0.2 + 0.2 ... rather than one attempt per wake-up
+    assert 2 <= errors <= 6
+    for _ in range(50):
+        copy.invalidate()
+    time.sleep(0.1)
+    assert copy.stats()['full_sync_errors'] <= errors + 1
+    assert not copy.ready
@@ -0,0 +1,110 @@
+from datetime import date
+
+import pytest
+
+from search_index import PREFIX_WEIGHT, SearchIndex, index_terms, normalize, tokenize
+
+
+TABLES = {
+    '[سلف]': [
+        (1, '2025-01-05', 'أحمد محمود', 'سلفة طنطا'),
+        (2, '2025-02-01', 'احمد علي', None),
+        (3, '2024-12-31', 'مُحَمَّد', 'الاسكندرية'),
+    ],
+    '[القرض]': [
+        (10, '2025-03-01', 'إبراهيم', 'طنطا طنطا'),
+    ],
+}
+
+
+class Loader:
+    def __init__(self):
+        self.tables = {table: list(rows) for table, rows in TABLES.items()}
+        self.calls = []
+
+    def __call__(self, table, record_id=None):
+        self.calls.append((table, record_id))
+        rows = self.tables[table]
+        return rows if record_id is None else [row for row in rows if row[0] == int(record_id)]
+
+
+@pytest.fixture
+def loader():
+    return Loader()
+
+
+@pytest.fixture
+def index(loader):
+    return SearchIndex({table: ['الاسم', 'ملاحظات'] for table in TABLES}, loader)
+
+
+def ids(result):
+    return [(hit[0], hit[1]) for hit in result[1]]
+
+
+def test_normalize_folds_what_phones_type():
+    assert normalize('أإآٱ') == 'اااا'
+    assert normalize('مُحَمَّدـ') == 'محمد'
+    assert normalize('مكتبة على') == 'مكتبه علي'
+    assert tokenize('١٢٣ Cairo') == ['123', 'cairo']
+    assert tokenize(None) == []
+    assert index_terms('الاسكندرية') == ['الاسكندريه', 'اسكندريه']
+
+
+def test_every_word_must_match(index):
+    assert ids(index.search('احمد')) == [('[سلف]', 2), ('[سلف]', 1)]
+    assert ids(index.search('احمد طنطا')) == [('[سلف]', 1)]
+    assert index.search('احمد القاهرة') == (0, [])
+    assert index.search('  ') == (0, [])
+
+
+def test_article_and_diacritics_are_optional(index):
+    assert ids(index.search('اسكندرية')) == [('[سلف]', 3)]
+    assert ids(index.search('الإسكندريه')) == [('[سلف]', 3)]
+    assert ids(index.search('محمد')) == [('[سلف]', 3)]
+
+
+def test_whole_words_rank_above_prefixes():
+    rows = [(1, '2025-01-01', 'محمدين'), (2, '2024-01-01', 'محمد')]
+    index = SearchIndex({'[سلف]': ['الاسم']}, lambda table, record_id=None: rows)
+    total, hits = index.search('محمد')
+    assert total == 2
+    assert [hit[1] for hit in hits] == [2, 1]
+    assert hits[1][4] == pytest.approx(hits[0][4] * PREFIX_WEIGHT)
+    # One-letter terms only match whole words
+    assert index.search('م') == (0, [])
+
+
+def test_term_frequency_and_table_filter(index):
+    assert ids(index.search('طنطا')) == [('[القرض]', 10), ('[سلف]', 1)]
+    assert ids(index.search('طنطا', tables=['[سلف]'])) == [('[سلف]', 1)]
+
+
+def test_date_range_and_paging(index):
+    assert ids(index.search('احمد', start=date(2025, 1, 10))) == [('[سلف]', 2)]
+    assert ids(index.search('احمد', end=date(2025, 1, 5))) == [('[سلف]', 1)]
+    total, hits = index.search('احمد', limit=1, offset=1)
+    assert total == 2
+    assert [(hit[0], hit[1]) for hit in hits] == [('[سلف]', 1)]
+
+
+def test_refresh_follows_writes(index, loader):
+    index.search('احمد')
+    loader.tables['[سلف]'][0] = (1, '2025-01-05', 'خالد', None)
+    index.refresh('[سلف]', 1)
+    assert ids(index.search('احمد')) == [('[سلف]', 2)]
+    assert ids(index.search('خالد')) == [('[سلف]', 1)]
+    index.refresh('[سلف]', 2, deleted=True)
+    assert index.search('احمد') == (0, [])
+    assert 'احمد' not in index._postings
+
+
+def test_tables_load_lazily(index, loader):
+    index.refresh('[القرض]', 10)
+    assert loader.calls == []
+    index.search('طنطا', tables=['[سلف]'])
+    assert loader.calls == [('[سلف]', None)]
+    index.invalidate('[سلف]')
+    index.search('طنطا', tables=['[سلف]'])
+    assert loader.calls == [('[سلف]', None), ('[سلف]', None)]
+    assert index.stats() == {'rows': 3, 'words': len(index._postings), 'tables_loaded': 1}
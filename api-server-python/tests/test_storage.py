@@ -0,0 +1,129 @@
+from datetime import datetime
+
+import pytest
+
+import storage
+from khazina_ledger import to_date
+
+
+TABLE = '[All]'
+
+ROWS = [
+    (1, datetime(2024, 12, 31), 100.0, 0.0, 'a'),
+    (2, datetime(2025, 1, 5), 0.0, 40.0, 'b'),
+    (3, datetime(2025, 1, 5), 10.0, None, 'c'),
+    (4, datetime(2025, 2, 1), 0.0, 25.0, 'd'),
+    (5, None, 7.0, 0.0, 'undated'),
+]
+
+
+@pytest.fixture
+def backend():
+    return storage.SQLiteBackend(':memory:')
+
+
+@pytest.fixture
+def conn(backend):
+    conn = backend.connect()
+    conn.execute(f"CREATE TABLE {TABLE} (ID INTEGER PRIMARY KEY AUTOINCREMENT, [التاريخ] TIMESTAMP, "
+                 "[الايراد] REAL, [المصروف] REAL, [ملاحظات] TEXT)")
+    conn.executemany(f"INSERT INTO {TABLE} VALUES (?, ?, ?, ?, ?)", ROWS)
+    yield conn
+    conn.close()
+
+
+def ids(cursor):
+    return [row[0] for row in cursor.fetchall()]
+
+
+def test_list_orders_and_filters(backend, conn):
+    assert ids(backend.list(conn, TABLE)) == [4, 3, 2, 1, 5]
+    assert ids(backend.list(conn, TABLE, order='asc')) == [5, 1, 2, 3, 4]
+    assert ids(backend.list(conn, TABLE, start=datetime(2025, 1, 1), end=datetime(2025, 2, 1))) == [3, 2]
+    assert ids(backend.list(conn, TABLE, limit=2)) == [4, 3]
+    cursor = backend.list(conn, TABLE, limit=1, columns=['ID', 'ملاحظات'])
+    assert [column[0] for column in cursor.description] == ['ID', 'ملاحظات']
+
+
+def test_list_keyset_pages_cover_every_row(backend, conn):
+    seen, after = [], None
+    while True:
+        rows = backend.list(conn, TABLE, after=after, limit=2).fetchall()
+        if not rows:
+            break
+        seen.extend(row[0] for row in rows)
+        after = (rows[-1][1], rows[-1][0])
+    assert seen == [4, 3, 2, 1, 5]
+
+
+def test_dates_come_back_as_datetimes(backend, conn):
+    row = backend.get(conn, TABLE, 2).fetchone()
+    assert row[1] == datetime(2025, 1, 5)
+    assert backend.get(conn, TABLE, 99).fetchone() is None
+
+
+def test_get_many_and_existing_ids(backend, conn):
+    assert sorted(ids(backend.get_many(conn, TABLE, [4, 2, 99]))) == [2, 4]
+    assert backend.existing_ids(conn, TABLE, ['1', 3, 99, 3], chunk=2) == {1, 3}
+    assert backend.existing_ids(conn, TABLE, []) == set()
+
+
+def test_aggregate_by_date_part(backend, conn):
+    rows = backend.aggregate(conn, TABLE, 'month', sums=('الايراد', 'المصروف')).fetchall()
+    assert [tuple(row[:5]) for row in rows] == [
+        (2024, 12, 100.0, 0.0, 1),
+        (2025, 1, 10.0, 40.0, 2),
+        (2025, 2, 0.0, 25.0, 1),
+    ]
+    # MAX() loses the declared type on SQLite; callers read it with khazina_ledger.to_date
+    assert to_date(rows[1][5]) == datetime(2025, 1, 5).date()
+
+
+def test_aggregate_orders_and_ranges(backend, conn):
+    by_balance = backend.aggregate(conn, TABLE, 'ملاحظات', sums=('الايراد', 'المصروف'), order='balance', top=2)
+    assert [row[0] for row in by_balance.fetchall()] == ['a', 'c']
+    latest = backend.aggregate(conn, TABLE, 'year', sums=('الايراد',), order='last')
+    assert [row[0] for row in latest.fetchall()] == [2025, 2024]
+    in_range = backend.aggregate(conn, TABLE, 'year', start=datetime(2025, 1, 1))
+    assert [tuple(row[:2]) for row in in_range.fetchall()] == [(2025, 3)]
+    with pytest.raises(ValueError):
+        backend.aggregate(conn, TABLE, 'year', order='size')
+
+
+def test_insert_update_delete(backend, conn):
+    record_id = backend.insert(conn, TABLE, {'التاريخ': datetime(2025, 3, 1), 'الايراد': 5.0})
+    assert record_id == 6
+    assert backend.insert_many(conn, TABLE, ['ملاحظات'], [('x',), ('y',)]) == [7, 8]
+    assert backend.update(conn, TABLE, record_id, {'ملاحظات': 'edited'}) == 1
+    assert backend.update(conn, TABLE, 99, {'ملاحظات': 'missing'}) == 0
+    backend.update_many(conn, TABLE, ['الايراد'], [(7, (1.0,)), (8, (2.0,))])
+    assert [row[2] for row in backend.get_many(conn, TABLE, [7, 8]).fetchall()] == [1.0, 2.0]
+    assert backend.get(conn, TABLE, record_id).fetchone()[4] == 'edited'
+    assert backend.delete(conn, TABLE, record_id) == 1
+    assert backend.delete(conn, TABLE, record_id) == 0
+
+
+def test_upsert_inserts_then_updates(backend, conn):
+    assert backend.upsert(conn, TABLE, 50, {'ملاحظات': 'new', 'الايراد': 1.0}) == 50
+    assert backend.upsert(conn, TABLE, 50, {'ملاحظات': 'again'}) == 50
+    row = backend.get(conn, TABLE, 50).fetchone()
+    assert (row[2], row[4]) == (1.0, 'again')
+
+
+def test_access_dialect():
+    backend = storage.AccessBackend('x.accdb')
+    sql, extra = backend._select('*', TABLE, ['[التاريخ] >= ?'], 'ID', 10)
+    assert (sql, extra) == (f"SELECT TOP 10 * FROM {TABLE} WHERE [التاريخ] >= ? ORDER BY ID", [])
+    assert backend._date_part('month', '[التاريخ]') == 'MONTH([التاريخ])'
+    assert backend._sum_or_zero('[x]') == 'SUM(IIF([x] IS NULL, 0, [x]))'
+
+
+def test_backend_from_env(monkeypatch):
+    monkeypatch.delenv('STORAGE_BACKEND', raising=False)
+    monkeypatch.setenv('SQLITE_DB_PATH', 'standin.db')
+    assert isinstance(storage.backend_from_env('x.accdb'), storage.SQLiteBackend)
+    monkeypatch.setenv('STORAGE_BACKEND', 'access')
+    assert storage.backend_from_env('x.accdb').path == 'x.accdb'
+    monkeypatch.setenv('STORAGE_BACKEND', 'oracle')
+    with pytest.raises(RuntimeError):
+        storage.backend_from_env('x.accdb')
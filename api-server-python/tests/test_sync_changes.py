@@ -0,0 +1,89 @@
+import importlib.util
+import json
+import os
+import sys
+
+import pytest
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(SERVER_DIR, 'benchmarks'))
+
+import standin_db  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp('sync')
+    db_path = str(workdir / 'standin.db')
+    if standin_db.create(db_path)['[All]'] < 100:
+        pytest.skip('data_import/All.csv is needed to seed the ledger')
+    saved = dict(os.environ)
+    os.environ.update(SQLITE_DB_PATH=db_path, REPLICA_ENABLED='0', COMPRESS_ENABLED='0',
+                      SLOW_QUERY_LOG=str(workdir / 'slow-queries.log'))
+    try:
+        spec = importlib.util.spec_from_file_location('sync_server', os.path.join(SERVER_DIR, 'server-lets-encrypt.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+    return module
+
+
+@pytest.fixture
+def client(server):
+    client = server.app.test_client()
+    token = client.post('/api/login', json={'username': 'admin', 'password': 'selrs2024'}).get_json()['token']
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    return client
+
+
+def sync_token(client):
+    return client.get('/api/sync/changes').get_json()['token']
+
+
+def day_before_last(server, rows):
+    """Date of the row `rows` from the end of the ledger"""
+    ledger = server.KHAZINA_LEDGER.balances_from('0001-01-01')
+    return server.KHAZINA_LEDGER.date_of(list(ledger)[-rows])
+
+
+def test_backdated_write_sends_balances_not_rows(server, client):
+    token = sync_token(client)
+    day = day_before_last(server, 500)
+    record_id = client.post('/api/khazina', json={'date': day.isoformat(), 'expense': 7}).get_json()['id']
+
+    response = client.get(f'/api/sync/changes?since={token}')
+    body = response.get_json()
+    khazina = body['changes']['khazina']
+    assert body['reset'] is False
+    assert [record['ID'] for record in khazina['upserted']] == [record_id]
+
+    later = server.KHAZINA_LEDGER.balances_from(day)
+    assert len(khazina['balances']) == len(later) - 1
+    for key, balance in khazina['balances'].items():
+        assert balance == server.format_number(later[int(key)])
+
+    # ID and balance only: a few dozen bytes per shifted row instead of the whole record
+    shifted = json.dumps(khazina['balances']).encode()
+    assert len(shifted) < 32 * len(khazina['balances'])
+    assert len(response.get_data()) < len(shifted) + 1024
+
+
+def test_balances_over_the_cap_ask_for_a_reset(server, client, monkeypatch):
+    token = sync_token(client)
+    monkeypatch.setattr(server, 'SYNC_MAX_ROWS', 10)
+    client.post('/api/khazina', json={'date': day_before_last(server, 500).isoformat(), 'revenue': 7})
+
+    body = client.get(f'/api/sync/changes?since={token}').get_json()
+    assert body['reset'] is True
+    assert body['changes'] == {}
+
+
+def test_write_on_the_last_day_sends_no_balances(server, client):
+    token = sync_token(client)
+    record_id = client.post('/api/khazina', json={'date': '2999-01-01', 'revenue': 7}).get_json()['id']
+
+    khazina = client.get(f'/api/sync/changes?since={token}').get_json()['changes']['khazina']
+    assert [record['ID'] for record in khazina['upserted']] == [record_id]
+    assert khazina['balances'] == {}
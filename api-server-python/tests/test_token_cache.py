@@ -0,0 +1,84 @@
+import time
+
+import jwt
+import pytest
+
+from token_cache import TokenCache
+
+
+SECRET = 'test-secret'
+
+
+def make_token(username='admin', expires_in=3600, secret=SECRET):
+    return jwt.encode({'username': username, 'exp': int(time.time()) + expires_in}, secret, algorithm='HS256')
+
+
+@pytest.fixture
+def cache():
+    return TokenCache(SECRET, ['HS256'], max_size=2)
+
+
+def test_second_decode_is_a_hit(cache):
+    token = make_token()
+    assert cache.decode(token)['username'] == 'admin'
+    assert cache.decode(token)['username'] == 'admin'
+    stats = cache.stats()
+    assert (stats['misses'], stats['hits'], stats['size']) == (1, 1, 1)
+
+
+def test_invalid_tokens_are_not_cached(cache):
+    with pytest.raises(jwt.InvalidTokenError):
+        cache.decode('not-a-token')
+    with pytest.raises(jwt.InvalidSignatureError):
+        cache.decode(make_token(secret='other-secret'))
+    with pytest.raises(jwt.ExpiredSignatureError):
+        cache.decode(make_token(expires_in=-10))
+    assert cache.stats()['size'] == 0
+
+
+def test_cached_token_expires(cache, monkeypatch):
+    token = make_token(expires_in=60)
+    cache.decode(token)
+    monkeypatch.setattr(time, 'time', lambda: jwt.decode(token, SECRET, algorithms=['HS256'])['exp'] + 1)
+    with pytest.raises(jwt.ExpiredSignatureError):
+        cache.decode(token)
+    assert cache.stats()['expired'] == 1
+    assert cache.stats()['size'] == 0
+
+
+def test_revoked_token_is_rejected_even_when_cached(cache):
+    token, other = make_token('a'), make_token('b')
+    cache.decode(token)
+    cache.decode(other)
+    cache.revoke(token)
+    with pytest.raises(jwt.InvalidTokenError, match='revoked'):
+        cache.decode(token)
+    assert cache.decode(other)['username'] == 'b'
+    assert cache.stats()['revoked'] == 1
+
+
+def test_revoking_an_unseen_token(cache):
+    token = make_token()
+    cache.revoke(token)
+    with pytest.raises(jwt.InvalidTokenError, match='revoked'):
+        cache.decode(token)
+    assert cache.stats()['misses'] == 0
+
+
+def test_revocations_are_dropped_after_expiry(cache):
+    cache.revoke(make_token('a'), expires=time.time() - 1)
+    cache.revoke(make_token('b'))
+    assert cache.stats()['revocations'] == 1
+
+
+def test_least_recently_used_is_evicted(cache):
+    first, second, third = make_token('a'), make_token('b'), make_token('c')
+    cache.decode(first)
+    cache.decode(second)
+    cache.decode(first)
+    cache.decode(third)
+    assert cache.stats()['size'] == 2
+    cache.decode(first)
+    assert cache.stats()['hits'] == 2
+    cache.decode(second)
+    assert cache.stats()['misses'] == 4
@@ -0,0 +1,44 @@
+import threading
+
+import pytest
+
+import storage
+import write_queue
+
+
+@pytest.fixture
+def writes(tmp_path):
+    queue = write_queue.WriteQueue(storage.SQLiteBackend(str(tmp_path / 'writes.db')).connect, linger=0)
+    yield queue
+    queue.stop()
+
+
+def test_queued_write_is_cancelled_on_timeout(writes):
+    release = threading.Event()
+    ran = []
+    blocker = writes.submit(lambda conn: release.wait(5), batch=False)
+    with pytest.raises(write_queue.WriteTimeout, match='cancelled'):
+        writes.run(lambda conn: ran.append('late'), timeout=0.05)
+    release.set()
+    blocker.result(5)
+    assert writes.run(lambda conn: ran.append('next') or 'ok') == 'ok'
+    assert ran == ['next']
+    assert writes.stats()['cancelled'] == 1
+
+
+def test_started_write_is_waited_for(writes):
+    started, release = threading.Event(), threading.Event()
+
+    def slow(conn):
+        started.set()
+        release.wait(5)
+        return 42
+
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(writes.run(slow, timeout=0.05)))
+    waiter.start()
+    assert started.wait(5)
+    threading.Timer(0.2, release.set).start()
+    waiter.join(5)
+    assert result == [42]
+    assert writes.stats()['cancelled'] == 0
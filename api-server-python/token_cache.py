@@ -0,0 +1,84 @@
+"""
+SELRS API Server - Verified JWT cache
+The phone sends the same long-lived token on every request. After the
+first full jwt.decode the claims are kept in a bounded LRU keyed by a
+SHA-256 digest of the token, so later requests only check the expiry
+and the revocation list.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+
+
+def token_digest(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class TokenCache:
+    """LRU of decoded claims for tokens that already passed verification"""
+
+    COUNTERS = ('hits', 'misses', 'expired', 'revoked')
+
+    def __init__(self, secret, algorithms, max_size=1024):
+        self.secret = secret
+        self.algorithms = algorithms
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._claims = OrderedDict()
+        self._revoked = {}
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'revoked': 0}
+
+    def decode(self, token):
+        """Same contract as jwt.decode: returns claims or raises a jwt exception"""
+        key = token_digest(token)
+        now = time.time()
+        with self._lock:
+            if key in self._revoked:
+                self._stats['revoked'] += 1
+                raise jwt.InvalidTokenError('Token revoked')
+            entry = self._claims.get(key)
+            if entry is not None:
+                claims, expires = entry
+                if expires is not None and expires <= now:
+                    del self._claims[key]
+                    self._stats['expired'] += 1
+                    raise jwt.ExpiredSignatureError('Signature has expired')
+                self._claims.move_to_end(key)
+                self._stats['hits'] += 1
+                return claims
+            self._stats['misses'] += 1
+
+        claims = jwt.decode(token, self.secret, algorithms=self.algorithms)
+        expires = claims.get('exp')
+        with self._lock:
+            self._claims[key] = (claims, float(expires) if expires is not None else None)
+            while len(self._claims) > self.max_size:
+                self._claims.popitem(last=False)
+        return claims
+
+    def revoke(self, token, expires=None):
+        """Reject this token from now on (kept until it would have expired anyway)"""
+        key = token_digest(token)
+        with self._lock:
+            entry = self._claims.pop(key, None)
+            if expires is None and entry is not None:
+                expires = entry[1]
+            self._revoked[key] = expires
+            self._purge_revoked(time.time())
+
+    def _purge_revoked(self, now):
+        for key in [k for k, expires in self._revoked.items() if expires is not None and expires <= now]:
+            del self._revoked[key]
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['size'] = len(self._claims)
+            data['revocations'] = len(self._revoked)
+        lookups = data['hits'] + data['misses']
+        data['hit_rate'] = round(data['hits'] / lookups, 3) if lookups else 0.0
+        return data
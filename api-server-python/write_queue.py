@@ -0,0 +1,219 @@
+"""
+SELRS API Server - Single writer for the Access file
+Request threads no longer commit against the .accdb themselves. They queue
+a job and wait for its future; one writer thread with a long-lived
+connection runs queued jobs in short shared transactions, so concurrent
+writes do not fight over Access's page locks. Reads are not queued.
+A write still queued when its request stops waiting is cancelled, so it
+never commits after the client has been told it failed.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+
+
+_STOP = object()
+
+
+class WriteTimeout(Exception):
+    """Raised when a write was still queued after the timeout; it has been cancelled"""
+
+
+class _Job:
+    __slots__ = ('fn', 'batch', 'future')
+
+    def __init__(self, fn, batch):
+        self.fn = fn
+        self.batch = batch
+        self.future = Future()
+
+
+class WriteQueue:
+    COUNTERS = ('jobs', 'batches', 'retried_alone', 'errors', 'connects', 'cancelled')
+
+    def __init__(self, connect, max_batch=50, linger=0.005, timeout=30.0):
+        """
+        connect(): opens the writer's own connection (kept until it fails);
+        insert/update/delete use its storage backend (conn.backend)
+        max_batch: most jobs committed together
+        linger: seconds to wait for more jobs once one has arrived
+        """
+        self.connect = connect
+        self.max_batch = max_batch
+        self.linger = linger
+        self.timeout = timeout
+        # Optional metrics.Metrics: request threads report time spent waiting here
+        self.metrics = None
+        self._queue = queue.Queue()
+        self._conn = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'jobs': 0, 'batches': 0, 'largest_batch': 0, 'retried_alone': 0,
+                       'errors': 0, 'connects': 0, 'cancelled': 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._queue.put(_STOP)
+
+    def submit(self, fn, batch=True):
+        """
+        Queue fn(conn) and return its Future.
+        batch=True: fn runs inside a transaction shared with other jobs and
+        must not commit. batch=False: fn runs alone on an autocommit
+        connection and manages its own transactions (bulk writes, imports).
+        """
+        self.start()
+        job = _Job(fn, batch)
+        self._queue.put(job)
+        return job.future
+
+    def run(self, fn, batch=True, timeout=None):
+        """
+        Queue fn(conn) and wait for its result. If it has not started within
+        the timeout it is cancelled and WriteTimeout is raised; one that has
+        started is waited for, since it may already have committed.
+        """
+        started = time.perf_counter()
+        timeout = timeout or self.timeout
+        future = self.submit(fn, batch)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            if future.cancel():
+                with self._lock:
+                    self._stats['cancelled'] += 1
+                raise WriteTimeout(f"Write not started within {timeout:g}s; it was cancelled") from None
+            return future.result()
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe('db_write', time.perf_counter() - started)
+
+    def insert(self, table, values):
+        """Insert one row through the writer's storage backend; returns the new ID"""
+        return self.run(lambda conn: conn.backend.insert(conn, table, values))
+
+    def update(self, table, record_id, values):
+        """Update one row through the writer; returns the affected row count"""
+        return self.run(lambda conn: conn.backend.update(conn, table, record_id, values))
+
+    def delete(self, table, record_id):
+        """Delete one row through the writer; returns the affected row count"""
+        return self.run(lambda conn: conn.backend.delete(conn, table, record_id))
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = self.connect()
+            self._stats['connects'] += 1
+        return self._conn
+
+    def _discard(self):
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    def _rollback(self):
+        try:
+            self._conn.rollback()
+        except Exception:
+            # A connection that cannot roll back is not trusted again
+            self._discard()
+
+    def _run(self):
+        carry = None
+        while True:
+            job = carry if carry is not None else self._queue.get()
+            carry = None
+            if job is _STOP:
+                break
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            if not job.batch:
+                self._run_alone(job)
+                continue
+
+            batch = [job]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is _STOP or not job.batch:
+                    carry = job
+                    break
+                if job.future.set_running_or_notify_cancel():
+                    batch.append(job)
+            self._run_batch(batch)
+
+    def _transaction(self, batch):
+        try:
+            conn = self._connection()
+            conn.autocommit = False
+            results = [job.fn(conn) for job in batch]
+            conn.commit()
+            return results
+        except Exception:
+            if self._conn is not None:
+                self._rollback()
+            raise
+
+    def _run_batch(self, batch):
+        try:
+            results = self._transaction(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                self._stats['errors'] += 1
+                batch[0].future.set_exception(e)
+                return
+            # One bad job must not fail the others: redo each on its own
+            self._stats['retried_alone'] += len(batch)
+            for job in batch:
+                self._run_batch([job])
+            return
+        self._stats['batches'] += 1
+        self._stats['jobs'] += len(batch)
+        self._stats['largest_batch'] = max(self._stats['largest_batch'], len(batch))
+        for job, result in zip(batch, results):
+            job.future.set_result(result)
+
+    def _run_alone(self, job):
+        try:
+            conn = self._connection()
+            conn.autocommit = True
+            result = job.fn(conn)
+        except Exception as e:
+            self._stats['errors'] += 1
+            if self._conn is not None:
+                self._rollback()
+            job.future.set_exception(e)
+            return
+        self._stats['jobs'] += 1
+        job.future.set_result(result)
+
+    def stats(self):
+        data = dict(self._stats)
+        data['queued'] = self._queue.qsize()
+        data['avg_batch'] = round(data['jobs'] / data['batches'], 2) if data['batches'] else 0.0
+        return data
+
+
+def queue_from_env(connect):
+    """WRITE_BATCH_SIZE, WRITE_LINGER_MS, WRITE_TIMEOUT"""
+    return WriteQueue(
+        connect,
+        max_batch=int(os.getenv('WRITE_BATCH_SIZE', 50)),
+        linger=float(os.getenv('WRITE_LINGER_MS', 5)) / 1000.0,
+        timeout=float(os.getenv('WRITE_TIMEOUT', 30)),
+    )
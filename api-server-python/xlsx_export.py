@@ -0,0 +1,83 @@
+"""
+SELRS API Server - Excel export
+Rows go from the cursor into a write-only openpyxl workbook, which keeps
+only the current row in memory and spools the sheet XML to disk. The
+finished file is then streamed to the client in chunks and deleted.
+"""
+
+import os
+import tempfile
+from datetime import date
+
+from flask import Response
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+
+DATE_FORMAT = 'dd/mm/yyyy'
+NUMBER_FORMAT = '#,##0.00'
+CHUNK_SIZE = 64 * 1024
+
+MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def write_workbook(title, headers, rows, number_columns=()):
+    """
+    headers: column names as in Access; rows: iterable of value sequences.
+    Dates get a date cell format and number_columns a number format.
+    Returns the path of a temporary .xlsx file; the caller removes it.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=title[:31])
+    ws.sheet_view.rightToLeft = True
+
+    header_font = Font(bold=True)
+    header_cells = []
+    for name in headers:
+        cell = WriteOnlyCell(ws, value=name)
+        cell.font = header_font
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    numeric = [name in number_columns for name in headers]
+    for row in rows:
+        values = []
+        for index, value in enumerate(row):
+            if isinstance(value, date):
+                cell = WriteOnlyCell(ws, value=value)
+                cell.number_format = DATE_FORMAT
+                value = cell
+            elif numeric[index] and value is not None:
+                cell = WriteOnlyCell(ws, value=float(value))
+                cell.number_format = NUMBER_FORMAT
+                value = cell
+            values.append(value)
+        ws.append(values)
+
+    handle, path = tempfile.mkstemp(suffix='.xlsx', prefix='selrs-export-')
+    os.close(handle)
+    try:
+        wb.save(path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def stream_file(path, chunk_size=CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def xlsx_response(path, filename):
+    """Stream the file written by write_workbook and delete it once the response is closed"""
+    response = Response(stream_file(path), mimetype=MIMETYPE)
+    response.headers['Content-Length'] = str(os.path.getsize(path))
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.call_on_close(lambda: os.path.exists(path) and os.remove(path))
+    return response